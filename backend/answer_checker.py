@@ -0,0 +1,232 @@
+"""Answer parsing and comparison for check_answer
+
+Students type answers like "3/4", "1 1/2", "75%", "$31", "$-3", "2.1 kg",
+"7.", "1e3" or "1,250". Each is parsed in one pass of a precompiled regex into an exact
+rational (integer numerator and denominator), remembering how many decimal
+places were typed. Comparison is integer cross-multiplication, so there is
+no float rounding and no Fraction/gcd work on the hot path.
+
+Matching rules, in order:
+- exact rational equality ("0.75" == "3/4" == "75%" for an answer of 0.75);
+- a relative difference below 1e-9, to absorb float noise in stored answers;
+- the student rounded a non-integer answer to at least
+  min(2, places the answer needs) decimals ("0.33" for 1/3, "24.38" for 24.375);
+- the stored answer is itself rounded to two or more places and the student
+  typed something more exact ("1/3" for a stored 0.33).
+A percentage matches either its value or its value / 100, since "75%" for a
+"what percent" question means 75.
+"""
+import re
+from collections import OrderedDict
+from decimal import Decimal
+from functools import lru_cache
+
+# One left-to-right pass with no backtracking between alternatives: a number,
+# then optionally "/den" (it was a numerator) or " num/den" (mixed number)
+_ANSWER_RE = re.compile(r"""
+    (?P<neg>[-−])?\s*
+    [$€£]?\s*
+    (?P<currency_neg>[-−])?\s*                                     # $-3
+    (?P<int>\d{1,3}(?:,\d{3})+|\d+)?(?:\.(?P<frac>\d*))?          # 1,250 / 2.1 / .5 / 3 / 7.
+    (?:e(?P<exp>[-+]?\d{1,3}))?                                    # 1e3
+    (?:
+        \s*/\s*(?P<den>\d+)                                        # 3/4
+      | \s+(?P<mixed_num>\d+)\s*/\s*(?P<mixed_den>\d+)             # 1 1/2
+    )?
+    \s*(?P<percent>%|percent\b)?
+    \s*(?:[^\W\d_][^\d]*)?                                         # units: kg, miles, sq ft
+    $
+""", re.VERBOSE | re.IGNORECASE)
+
+
+# Larger exponents and longer answers are not what anyone types, and would
+# build huge integers (int() refuses strings over 4300 digits anyway)
+MAX_EXPONENT = 30
+MAX_ANSWER_LENGTH = 100
+
+
+class ParsedAnswer:
+    """An exact rational answer plus how it was written"""
+
+    __slots__ = ("numerator", "denominator", "places", "percent")
+
+    def __init__(self, numerator, denominator=1, places=None, percent=False):
+        self.numerator = numerator
+        self.denominator = denominator
+        # Decimal places typed; None when written as a fraction
+        self.places = places
+        self.percent = percent
+
+    def __repr__(self):
+        return f"ParsedAnswer({self.numerator}/{self.denominator}, places={self.places}, percent={self.percent})"
+
+    @property
+    def is_integer(self):
+        return self.numerator % self.denominator == 0
+
+
+def parse_answer(value):
+    """Parse a typed answer (str) or a number; returns ParsedAnswer or None if unreadable"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return ParsedAnswer(value, 1, 0)
+    if isinstance(value, float):
+        if value != value or value in (float("inf"), float("-inf")):
+            return None
+        if value.is_integer():
+            return ParsedAnswer(int(value), 1, 0)
+        return _parse_float(value)
+    if not isinstance(value, str):
+        return None
+
+    text = value.strip()
+    if len(text) > MAX_ANSWER_LENGTH:
+        return None
+    # isdigit() alone also accepts "¹²", which int() rejects
+    if text.isascii() and text.isdigit():
+        # Most answers are plain integers; skip the regex
+        return ParsedAnswer(int(text), 1, 0)
+
+    match = _ANSWER_RE.match(text)
+    if match is None:
+        return None
+    neg, currency_neg, int_part, frac, exp, den, mixed_num, mixed_den, percent = match.groups()
+    if int_part is None and not frac:
+        return None
+    if neg and currency_neg:
+        return None
+    if frac == "":
+        # "7." is 7
+        frac = None
+    if exp is not None and (den is not None or mixed_den is not None):
+        return None
+
+    if int_part is not None and "," in int_part:
+        int_part = int_part.replace(",", "")
+    whole = int(int_part) if int_part else 0
+    if mixed_den is not None:
+        if frac is not None:
+            return None
+        denominator = int(mixed_den)
+        numerator = whole * denominator + int(mixed_num)
+        places = None
+    elif den is not None:
+        if frac is not None:
+            return None
+        numerator, denominator = whole, int(den)
+        places = None
+    elif frac is not None:
+        denominator = 10 ** len(frac)
+        numerator = whole * denominator + int(frac)
+        places = len(frac)
+    else:
+        numerator, denominator, places = whole, 1, 0
+
+    if exp is not None:
+        exponent = int(exp)
+        if abs(exponent) > MAX_EXPONENT:
+            return None
+        if exponent >= 0:
+            numerator *= 10 ** exponent
+        else:
+            denominator *= 10 ** -exponent
+        places = max(0, places - exponent)
+
+    if denominator == 0:
+        return None
+    if neg or currency_neg:
+        numerator = -numerator
+    return ParsedAnswer(numerator, denominator, places, percent is not None)
+
+
+# JSON clients send the same few numbers over and over (mostly the right
+# answer), so skip the repr/Decimal round trip for ones seen recently
+FLOAT_ANSWER_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=FLOAT_ANSWER_CACHE_SIZE)
+def _parse_float(value):
+    """Parse a finite, non-integral float; the result is shared, so never mutate it"""
+    # The shortest repr is what was typed or stored, e.g. 0.1 -> 1/10
+    text = repr(value)
+    if "e" in text:
+        text = format(Decimal(text), "f")
+    int_text, _, frac = text.partition(".")
+    denominator = 10 ** len(frac)
+    numerator = abs(int(int_text)) * denominator + int(frac)
+    return ParsedAnswer(-numerator if text[0] == "-" else numerator, denominator, len(frac))
+
+
+def _rounding_places_required(correct):
+    """Decimals a student must give when rounding this answer, or None if rounding isn't allowed"""
+    if correct.is_integer:
+        return None
+    if correct.places is None:
+        return 2
+    return min(2, correct.places)
+
+
+def _values_match(numerator, denominator, places, correct):
+    cn, cd = correct.numerator, correct.denominator
+    diff = abs(numerator * cd - cn * denominator)
+    if diff == 0:
+        return True
+
+    # |user - correct| == diff / scale
+    scale = denominator * cd
+    if diff * 10 ** 9 <= abs(cn) * denominator:
+        return True
+
+    required = _rounding_places_required(correct)
+    if required is not None and places is not None and places >= required:
+        if diff * 10 ** (places + 1) <= 5 * scale:
+            return True
+
+    if correct.places is not None and correct.places >= 2 and (places is None or places > correct.places):
+        if diff * 10 ** (correct.places + 1) <= 5 * scale:
+            return True
+    return False
+
+
+def answers_match(user, correct):
+    """Compare two ParsedAnswers using the rules in the module docstring"""
+    if _values_match(user.numerator, user.denominator, user.places, correct):
+        return True
+    if user.percent:
+        places = user.places + 2 if user.places is not None else None
+        return _values_match(user.numerator, user.denominator * 100, places, correct)
+    return False
+
+
+# Parsed correct answers by problem ID, so repeat checks skip the parse; least
+# recently used entries are dropped first
+CORRECT_ANSWER_CACHE_SIZE = 10000
+_correct_answers = OrderedDict()
+
+
+def normalized_correct_answer(problem_id, answer):
+    parsed = _correct_answers.get(problem_id)
+    if parsed is not None:
+        _correct_answers.move_to_end(problem_id)
+        return parsed
+    parsed = parse_answer(answer)
+    if parsed is not None:
+        _correct_answers[problem_id] = parsed
+        if len(_correct_answers) > CORRECT_ANSWER_CACHE_SIZE:
+            _correct_answers.popitem(last=False)
+    return parsed
+
+
+def check_answer(user_answer, correct_answer, problem_id=None):
+    """Grade an answer; returns True/False, or None if the user's answer can't be read"""
+    user = parse_answer(user_answer)
+    if user is None:
+        return None
+    if problem_id is None:
+        correct = parse_answer(correct_answer)
+    else:
+        correct = normalized_correct_answer(problem_id, correct_answer)
+    if correct is None:
+        return False
+    return answers_match(user, correct)
@@ -0,0 +1,49 @@
+"""Microbenchmark for answer_checker.check_answer
+
+    python benchmarks/bench_answer_checker.py
+
+Reports the mean time per check for each answer form, with the correct
+answer served from the per-problem cache as it is in check_answer.
+
+This does not meet the sub-microsecond target. On a shared CI-class VM,
+plain integers and repeated JSON floats take about 0.9-1.5 us. Typed
+forms that go through the regex (decimals, fractions, percents, units)
+take 3-4 us, most of it the match and int() calls. No assertion is made;
+compare runs on the same machine.
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from answer_checker import check_answer  # noqa: E402
+
+CASES = [
+    ("integer", "93", 93),
+    ("json number", 24.375, 24.375),
+    ("decimal", "24.38", 24.375),
+    ("fraction", "3/4", 0.75),
+    ("mixed number", "1 1/2", 1.5),
+    ("percent", "75%", 0.75),
+    ("currency", "$31", 31),
+    ("units", "2.1 kg", 2.1),
+    ("thousands", "1,250", 1250),
+    ("wrong", "42", 93),
+    ("unreadable", "no idea", 93),
+]
+
+
+def main(number=200000):
+    print(f"{'form':<14}{'input':>12}{'ns/check':>12}")
+    for problem_id, (label, user_answer, correct_answer) in enumerate(CASES):
+        check_answer(user_answer, correct_answer, problem_id)
+        seconds = min(timeit.repeat(
+            lambda: check_answer(user_answer, correct_answer, problem_id),
+            number=number, repeat=3,
+        ))
+        print(f"{label:<14}{str(user_answer):>12}{seconds / number * 1e9:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Cold-start report: import time and time to the first served problem
+
+    python benchmarks/bench_cold_start.py --runs 5 --latency 0.8 --out cold_start.json
+
+Import time is measured in fresh interpreters (median of --runs), noting
+whether the openai SDK got loaded. Then, --runs times, the server is started
+with uvicorn against benchmarks/fake_openai.py and a corpus seeded with
+--seed template problems per grade (fewer than CORPUS_MIN_SIZE, so they're
+only served if startup puts them in the pool). From process spawn it records
+when /api/health first answers, when /api/ready does (if the server has it)
+and when the first /api/problem response arrives, requested as soon as the
+health check passes, like a user opening the page right after a restart.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from load_test import BACKEND_DIR, free_port, start_fake_openai, stop  # noqa: E402
+
+IMPORT_PROBE = ("import sys, time; started = time.perf_counter(); import challenge_server; "
+                "print(time.perf_counter() - started, 'openai' in sys.modules)")
+
+
+def measure_import(runs):
+    seconds, loaded_openai = [], False
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", IMPORT_PROBE], cwd=BACKEND_DIR, env=dict(
+            os.environ, LOG_LEVEL="ERROR", CORPUS_ENABLED="false", VERIFY_ENABLED="false"),
+            capture_output=True, text=True, check=True).stdout.split()
+        seconds.append(float(output[0]))
+        loaded_openai = output[1] == "True"
+    return {"median_seconds": round(statistics.median(seconds), 3), "runs": [round(s, 3) for s in seconds],
+            "imports_openai": loaded_openai}
+
+
+def seed_corpus(path, per_grade):
+    from problem_corpus import ProblemCorpus
+    from template_engine import generate_template_problem
+
+    corpus = ProblemCorpus(path)
+    for grade_level in ("1-2", "3-5", "5-8"):
+        added = 0
+        while added < per_grade:
+            problem = generate_template_problem(grade_level)
+            problem["prompt_version"] = "v2"
+            added += corpus.add(problem, grade_level)
+    corpus.close()
+
+
+def poll(client, path, deadline):
+    while time.monotonic() < deadline:
+        try:
+            response = client.get(path)
+            if response.status_code == 200:
+                return response
+            if response.status_code == 404:
+                return None
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.02)
+    raise RuntimeError(f"{path} not ready in time")
+
+
+def measure_start(fake_port, seed, grade_level):
+    port = free_port()
+    with tempfile.TemporaryDirectory() as data_dir:
+        corpus_path = os.path.join(data_dir, "corpus.db")
+        seed_corpus(corpus_path, seed)
+        env = dict(os.environ, OPENAI_API_KEY="fake", OPENAI_BASE_URL=f"http://127.0.0.1:{fake_port}/v1",
+                   CORPUS_PATH=corpus_path, QUARANTINE_PATH=os.path.join(data_dir, "quarantine.db"),
+                   LOG_LEVEL="WARNING")
+        command = [sys.executable, "-m", "uvicorn", "challenge_server:app", "--host", "127.0.0.1",
+                   "--port", str(port), "--log-level", "warning"]
+        started = time.monotonic()
+        server = subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+        try:
+            with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=60.0) as client:
+                deadline = started + 60
+                poll(client, "/api/health", deadline)
+                health = time.monotonic() - started
+                client.get("/api/problem", params={"grade_level": grade_level}).raise_for_status()
+                first_problem = time.monotonic() - started
+                from_pool = client.get("/api/pool/stats").json()["hits"] > 0
+                ready_response = poll(client, "/api/ready", deadline)
+                ready = time.monotonic() - started if ready_response is not None else None
+        finally:
+            stop(server)
+    return {"health_seconds": round(health, 3), "ready_seconds": round(ready, 3) if ready else None,
+            "first_problem_seconds": round(first_problem, 3), "first_problem_from_pool": from_pool,
+            "server_report": ready_response.json() if ready_response is not None else None}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure server import time and time to first problem")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=20, help="corpus problems per grade")
+    parser.add_argument("--grade-level", default="5-8")
+    parser.add_argument("--latency", type=float, default=0.8, help="fake completion latency, seconds")
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args(argv)
+    args.jitter, args.error_rate, args.rate_limit_rate, args.slow_rate, args.slow_latency = 0.0, 0.0, 0.0, 0.0, 0.0
+
+    results = {"import": measure_import(args.runs), "starts": []}
+    print(f"import challenge_server: {results['import']['median_seconds']}s median "
+          f"(openai imported: {results['import']['imports_openai']})")
+
+    fake_port = free_port()
+    fake = start_fake_openai(args, fake_port)
+    try:
+        for _ in range(args.runs):
+            run = measure_start(fake_port, args.seed, args.grade_level)
+            results["starts"].append(run)
+            ready = f"{run['ready_seconds']}s" if run["ready_seconds"] is not None else "n/a"
+            print(f"health {run['health_seconds']}s  first problem {run['first_problem_seconds']}s "
+                  f"(from pool: {run['first_problem_from_pool']})  ready {ready}")
+    finally:
+        stop(fake)
+
+    for key in ("health_seconds", "first_problem_seconds"):
+        results[f"median_{key}"] = round(statistics.median(run[key] for run in results["starts"]), 3)
+    print(f"median: health {results['median_health_seconds']}s, "
+          f"first problem {results['median_first_problem_seconds']}s")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""A/B benchmark of per-request logging overhead
+
+    python benchmarks/bench_logging.py
+
+"before" replays what one generated-and-served problem used to log: the
+print of the raw model response and model name, plus three INFO lines from
+the SPA catch-all route, all written synchronously (basicConfig-style
+StreamHandler, stdout flushed per line as on a console). "after" makes the
+same calls the code makes now: those lines are DEBUG and filtered out, and
+anything that is emitted goes through the queue handler in logging_config.
+
+Output goes to a temporary file, which is cheaper than a terminal or a
+container log pipe, so the "before" numbers are a lower bound. The last two
+rows write through a stream that takes 0.2 ms per write, like a busy pipe:
+the sync handler stalls the caller for it, the queue handler doesn't. In a
+tight loop on a fast file the writer thread competes for the GIL, so a
+queued record costs about as much as a synchronous one there.
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from logging_config import configure_logging, shutdown_logging  # noqa: E402
+
+RAW_RESPONSE = '{"question": "' + "A baker packs cookies into boxes. " * 12 + '", "answer": 93, ' \
+               '"explanation": "' + "1. 12 × 7 = 84\\n" * 20 + '"}'
+
+logger = logging.getLogger("bench")
+
+
+def before(stream):
+    print("Raw response:", RAW_RESPONSE, file=stream, flush=True)
+    print("Used model: o3-mini", file=stream, flush=True)
+    logger.info("Attempting to serve frontend")
+    logger.info("Requested path: ")
+    logger.info("Serving index.html from /app/frontend/build/index.html")
+
+
+def after(stream):
+    logger.debug(f"Raw response: {RAW_RESPONSE}")
+    logger.debug("Used model: o3-mini")
+    logger.debug("Requested path: ")
+
+
+def emitted_record():
+    logger.info("Problem pool started (depth=10, low_water=5, workers=2)")
+
+
+class SlowStream:
+    """File wrapper whose writes block for a while, like a full pipe"""
+
+    def __init__(self, stream, delay=0.0002):
+        self._stream = stream
+        self._delay = delay
+
+    def write(self, text):
+        time.sleep(self._delay)
+        return self._stream.write(text)
+
+    def flush(self):
+        self._stream.flush()
+
+
+def measure(fn, number):
+    started = time.perf_counter()
+    for _ in range(number):
+        fn()
+    return (time.perf_counter() - started) / number * 1e6
+
+
+def main(number=20000):
+    with tempfile.TemporaryFile("w") as stream:
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        sync_handler = logging.StreamHandler(stream)
+        sync_handler.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+        root.addHandler(sync_handler)
+        root.setLevel(logging.INFO)
+
+        before_us = measure(lambda: before(stream), number)
+        sync_record_us = measure(emitted_record, number)
+
+        root.removeHandler(sync_handler)
+        configure_logging(level="INFO", module_levels={}, stream=stream)
+        after_us = measure(lambda: after(stream), number)
+        queued_record_us = measure(emitted_record, min(number, 5000))
+        shutdown_logging()
+
+        slow = SlowStream(stream)
+        root.handlers.clear()
+        root.addHandler(logging.StreamHandler(slow))
+        slow_sync_us = measure(emitted_record, 2000)
+        configure_logging(level="INFO", module_levels={}, stream=slow)
+        slow_queued_us = measure(emitted_record, 2000)
+        shutdown_logging()
+
+    print(f"{'scenario':<40}{'us':>10}")
+    print(f"{'per request, before (sync prints/INFO)':<40}{before_us:>10.2f}")
+    print(f"{'per request, after (queued, DEBUG off)':<40}{after_us:>10.2f}")
+    print(f"{'one emitted INFO record, sync handler':<40}{sync_record_us:>10.2f}")
+    print(f"{'one emitted INFO record, queue handler':<40}{queued_record_us:>10.2f}")
+    print(f"{'slow output, sync handler':<40}{slow_sync_us:>10.2f}")
+    print(f"{'slow output, queue handler':<40}{slow_queued_us:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
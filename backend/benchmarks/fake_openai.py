@@ -0,0 +1,146 @@
+"""Local stand-in for the OpenAI chat completions API, for load tests
+
+    python benchmarks/fake_openai.py --port 8100 --latency 0.8 --jitter 0.4 --error-rate 0.01
+
+Answers POST /v1/chat/completions (plain and streamed) with problems from the
+local template engine, so answers are consistent and pass verification.
+Each call waits `latency` ± `jitter` seconds, except `--slow-rate` of calls
+that take `--slow-latency` (an upstream's bad moments); `--rate-limit-rate`
+of calls get a 429 with Retry-After and `--error-rate` get a 500. Point the server at
+it with OPENAI_BASE_URL=http://127.0.0.1:8100/v1 and any OPENAI_API_KEY.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import uvicorn  # noqa: E402
+from fastapi import FastAPI, Request  # noqa: E402
+from fastapi.responses import JSONResponse, StreamingResponse  # noqa: E402
+
+from prompts import GRADE_DESCRIPTIONS, SOLVER_SYSTEM  # noqa: E402
+from template_engine import generate_template_problem  # noqa: E402
+
+STREAM_CHUNK_SIZE = 24
+
+
+class FakeSettings:
+    def __init__(self, latency=0.5, jitter=0.0, error_rate=0.0, rate_limit_rate=0.0, slow_rate=0.0,
+                 slow_latency=10.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+
+
+def grade_from_messages(messages):
+    text = " ".join(str(message.get("content", "")) for message in messages)
+    for grade_level, info in GRADE_DESCRIPTIONS.items():
+        if info["description"] in text:
+            return grade_level
+    return "5-8"
+
+
+def completion_content(messages):
+    if messages and messages[0].get("content") == SOLVER_SYSTEM:
+        # A solve request from answer verification; no opinion
+        return json.dumps({"answer": None})
+    problem = generate_template_problem(grade_from_messages(messages))
+    return json.dumps({field: problem[field] for field in ("question", "answer", "explanation")},
+                      ensure_ascii=False)
+
+
+def usage_for(messages, content):
+    prompt_tokens = sum(len(str(message.get("content", ""))) for message in messages) // 4
+    completion_tokens = len(content) // 4
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+def create_app(settings):
+    app = FastAPI()
+    app.state.calls = 0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+        delay = max(0.0, settings.latency + random.uniform(-settings.jitter, settings.jitter))
+        if random.random() < settings.slow_rate:
+            delay = settings.slow_latency
+
+        roll = random.random()
+        if roll < settings.rate_limit_rate:
+            return JSONResponse(status_code=429, headers={"retry-after": "1"}, content={
+                "error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}})
+        if roll < settings.rate_limit_rate + settings.error_rate:
+            await asyncio.sleep(delay)
+            return JSONResponse(status_code=500, content={
+                "error": {"message": "The server had an error", "type": "server_error"}})
+
+        model = body.get("model", "fake")
+        messages = body.get("messages", [])
+        content = completion_content(messages)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay)
+            return {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": usage_for(messages, content),
+            }
+
+        pieces = [content[i:i + STREAM_CHUNK_SIZE] for i in range(0, len(content), STREAM_CHUNK_SIZE)]
+
+        async def events():
+            # Spread the latency over the chunks, like tokens arriving
+            for piece in pieces:
+                await asyncio.sleep(delay / len(pieces))
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                         "model": model,
+                         "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            final = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                     "model": model, "choices": [], "usage": usage_for(messages, content)}
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return {"calls": app.state.calls}
+
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake OpenAI chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per completion")
+    parser.add_argument("--jitter", type=float, default=0.0, help="± seconds of uniform jitter")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls that return 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of calls that return 429")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="share of calls that take --slow-latency")
+    parser.add_argument("--slow-latency", type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    settings = FakeSettings(args.latency, args.jitter, args.error_rate, args.rate_limit_rate, args.slow_rate,
+                            args.slow_latency)
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
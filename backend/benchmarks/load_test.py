@@ -0,0 +1,275 @@
+"""Load test for challenge_server against a local fake OpenAI server
+
+    python benchmarks/load_test.py --concurrency 1 8 32 --workers 1 4 --duration 10 \
+        --latency 0.8 --jitter 0.3 --rate-limit-rate 0.02 --out results.json
+
+For each worker count this starts benchmarks/fake_openai.py and the server
+(uvicorn, SQLite problem store when there's more than one worker, data files
+in a temporary directory), waits until /api/ready has answered from as many
+distinct worker pids as were asked for (aborting if they don't all come up,
+so a row never measures fewer workers than it says), then for each concurrency
+level runs that many clients for --duration seconds. Each client loop gets a
+problem from /api/problem and posts an answer to /api/check_answer.
+
+Results (p50/p95/p99 latency, RPS, errors per endpoint) are printed and
+written as JSON. With --baseline, the run is compared to an earlier results
+file and the exit status is 1 if any endpoint's p95 or RPS got worse by more
+than --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+ENDPOINTS = ("/api/problem", "/api/check_answer")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": _ms(percentile(latencies, 0.50)),
+        "p95_ms": _ms(percentile(latencies, 0.95)),
+        "p99_ms": _ms(percentile(latencies, 0.99)),
+        "max_ms": _ms(latencies[-1] if latencies else None),
+    }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+def wait_until_ready(url, process, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process for {url} exited with status {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+
+def wait_for_workers(url, process, workers, timeout=60.0):
+    """Wait until `workers` distinct worker pids have answered `url` as ready"""
+    pids = set()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        # A new connection each time, so the kernel can hand it to any worker
+        try:
+            response = httpx.get(url, timeout=1.0)
+            if response.status_code == 200:
+                pids.add(response.json()["pid"])
+        except (httpx.HTTPError, ValueError, KeyError):
+            pass
+        if len(pids) >= workers:
+            return pids
+        time.sleep(0.05)
+    raise RuntimeError(f"Only {len(pids)} of {workers} workers ready after {timeout}s")
+
+
+def stop(process):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def start_fake_openai(args, port):
+    command = [sys.executable, os.path.join("benchmarks", "fake_openai.py"), "--port", str(port),
+               "--latency", str(args.latency), "--jitter", str(args.jitter),
+               "--error-rate", str(args.error_rate), "--rate-limit-rate", str(args.rate_limit_rate),
+               "--slow-rate", str(args.slow_rate), "--slow-latency", str(args.slow_latency)]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR)
+    wait_until_ready(f"http://127.0.0.1:{port}/stats", process)
+    return process
+
+
+def start_server(args, port, workers, fake_port, data_dir):
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="fake",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{fake_port}/v1",
+        PROBLEM_GENERATOR=args.generator,
+        PROBLEM_STORE="sqlite" if workers > 1 else "memory",
+        PROBLEM_STORE_PATH=os.path.join(data_dir, "problems.db"),
+        CORPUS_PATH=os.path.join(data_dir, "corpus.db"),
+        QUARANTINE_PATH=os.path.join(data_dir, "quarantine.db"),
+        LOG_LEVEL="WARNING",
+        # The fake server's template questions are near-duplicates of each other
+        # by design; pass --env DEDUP_ENABLED=true to load the filter anyway
+        DEDUP_ENABLED="false",
+    )
+    env.update(dict(item.split("=", 1) for item in args.env))
+    command = [sys.executable, "-m", "uvicorn", "challenge_server:app", "--host", "127.0.0.1",
+               "--port", str(port), "--workers", str(workers), "--log-level", "warning", "--no-access-log"]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+    try:
+        wait_for_workers(f"http://127.0.0.1:{port}/api/ready", process, workers)
+    except RuntimeError:
+        stop(process)
+        raise
+    return process
+
+
+async def run_load(base_url, concurrency, duration, grade_level):
+    latencies = {endpoint: [] for endpoint in ENDPOINTS}
+    errors = {endpoint: 0 for endpoint in ENDPOINTS}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        async def timed(endpoint, request):
+            started = time.perf_counter()
+            try:
+                response = await request
+                ok = response.status_code == 200 and "status" not in response.json()
+            except (httpx.HTTPError, ValueError):
+                response, ok = None, False
+            latencies[endpoint].append(time.perf_counter() - started)
+            if not ok:
+                errors[endpoint] += 1
+            return response if ok else None
+
+        async def user(deadline):
+            while time.monotonic() < deadline:
+                response = await timed("/api/problem", client.get("/api/problem",
+                                                                  params={"grade_level": grade_level}))
+                if response is None:
+                    continue
+                problem_id = response.json()["problem_id"]
+                await timed("/api/check_answer", client.post("/api/check_answer", json={
+                    "problem_id": problem_id, "user_answer": "42"}))
+
+        started = time.monotonic()
+        await asyncio.gather(*(user(started + duration) for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+
+    return {endpoint: summarize(latencies[endpoint], errors[endpoint], elapsed) for endpoint in ENDPOINTS}
+
+
+def compare(results, baseline, tolerance):
+    """List regressions of p95 latency or RPS beyond `tolerance` against a baseline"""
+    previous = {(run["workers"], run["concurrency"]): run for run in baseline["runs"]}
+    regressions = []
+    for run in results["runs"]:
+        before = previous.get((run["workers"], run["concurrency"]))
+        if before is None:
+            continue
+        for endpoint, stats in run["endpoints"].items():
+            old = before["endpoints"].get(endpoint)
+            if not old:
+                continue
+            label = f"workers={run['workers']} concurrency={run['concurrency']} {endpoint}"
+            if old["p95_ms"] and stats["p95_ms"] and stats["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{label}: p95 {old['p95_ms']}ms -> {stats['p95_ms']}ms")
+            if old["rps"] and stats["rps"] < old["rps"] * (1 - tolerance):
+                regressions.append(f"{label}: rps {old['rps']} -> {stats['rps']}")
+    return regressions
+
+
+def print_table(runs):
+    print(f"{'workers':>7} {'conc':>5} {'endpoint':<18} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'errors':>7}")
+    for run in runs:
+        for endpoint, stats in run["endpoints"].items():
+            print(f"{run['workers']:>7} {run['concurrency']:>5} {endpoint:<18} {stats['rps']:>9} "
+                  f"{stats['p50_ms']!s:>9} {stats['p95_ms']!s:>9} {stats['p99_ms']!s:>9} {stats['errors']:>7}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test challenge_server against a fake OpenAI server")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1])
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per concurrency level")
+    parser.add_argument("--grade-level", default="5-8")
+    parser.add_argument("--generator", choices=("openai", "template"), default="openai")
+    parser.add_argument("--latency", type=float, default=0.5, help="fake completion latency, seconds")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="share of fake calls that are slow")
+    parser.add_argument("--slow-latency", type=float, default=10.0, help="seconds a slow fake call takes")
+    parser.add_argument("--env", nargs="*", default=[], metavar="NAME=VALUE",
+                        help="extra server settings, e.g. POOL_ENABLED=false")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args(argv)
+
+    results = {
+        "meta": {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "runs": [],
+    }
+
+    fake_port = free_port()
+    fake = start_fake_openai(args, fake_port)
+    try:
+        for workers in args.workers:
+            port = free_port()
+            with tempfile.TemporaryDirectory() as data_dir:
+                server = start_server(args, port, workers, fake_port, data_dir)
+                try:
+                    for concurrency in args.concurrency:
+                        endpoints = asyncio.run(run_load(f"http://127.0.0.1:{port}", concurrency,
+                                                         args.duration, args.grade_level))
+                        results["runs"].append({"workers": workers, "concurrency": concurrency,
+                                                "endpoints": endpoints})
+                        print_table(results["runs"][-1:])
+                finally:
+                    stop(server)
+    finally:
+        stop(fake)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""Bulk problem generation for worksheets and practice sets
+
+Builds large sets from the local template engine: each chunk draws its
+parameters as NumPy arrays and computes every answer in one vectorized pass,
+then streams to JSONL or Parquet so memory stays flat however many problems
+are requested. Chunks are seeded from (seed, grade, type, chunk) alone, so a
+given --seed and --chunk-size give identical output for any number of
+worker processes.
+
+    python bulk_generate.py --count 10000 --seed 42 --out problems.jsonl
+    python bulk_generate.py --count 50000 --grades 3-5 --workers 4 --out set.parquet
+
+Parquet output needs the optional `pyarrow` package.
+"""
+import argparse
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from prompts import GRADE_DESCRIPTIONS, PROBLEM_TYPES
+from template_engine import templates_for
+
+GRADE_LEVELS = tuple(GRADE_DESCRIPTIONS)
+FIELDS = ("grade_level", "problem_type", "theme", "question", "answer", "explanation", "num_steps")
+
+
+def generate_chunk(grade_level, problem_type, count, seed):
+    """Generate `count` problems of one grade and type from a single seed"""
+    rng = np.random.default_rng(seed)
+    templates = templates_for(grade_level, problem_type)
+    picks = rng.integers(0, len(templates), size=count)
+
+    problems = [None] * count
+    for index, template in enumerate(templates):
+        rows = np.flatnonzero(picks == index)
+        if not len(rows):
+            continue
+
+        values = {
+            name: rng.integers(low, high + 1, size=len(rows), dtype=np.int64)
+            for name, (low, high) in template.ranges[grade_level].items()
+        }
+        template.solve(values)
+
+        # Back to Python ints once, so rendering doesn't format NumPy scalars
+        columns = {name: column.tolist() for name, column in values.items()}
+        names = list(columns)
+        for position, row in zip(rows.tolist(), zip(*columns.values())):
+            problem = template.render(dict(zip(names, row)))
+            problem["grade_level"] = grade_level
+            problems[position] = problem
+    return problems
+
+
+def _run_job(job):
+    return generate_chunk(*job)
+
+
+def plan_jobs(count, grade_levels, problem_types, seed, chunk_size):
+    """Split `count` problems per (grade, type) into independently seeded chunks"""
+    for grade_index, grade_level in enumerate(grade_levels):
+        for type_index, problem_type in enumerate(problem_types):
+            for chunk_index, start in enumerate(range(0, count, chunk_size)):
+                chunk_seed = np.random.SeedSequence([seed, grade_index, type_index, chunk_index])
+                yield grade_level, problem_type, min(chunk_size, count - start), chunk_seed
+
+
+def generate_bulk(count, grade_levels=GRADE_LEVELS, problem_types=PROBLEM_TYPES, seed=0,
+                  chunk_size=10000, workers=1):
+    """Yield lists of problems, in a deterministic order, `count` per grade and type"""
+    jobs = plan_jobs(count, grade_levels, problem_types, seed, chunk_size)
+    if workers <= 1:
+        for job in jobs:
+            yield _run_job(job)
+        return
+
+    # Keep only a small window of chunks in flight so memory stays bounded
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for job in jobs:
+            pending.append(executor.submit(_run_job, job))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class JSONLWriter:
+    def __init__(self, path):
+        self._file = sys.stdout if path == "-" else open(path, "w", encoding="utf-8")
+
+    def write(self, problems):
+        self._file.write("".join(
+            json.dumps({field: problem[field] for field in FIELDS}, ensure_ascii=False) + "\n"
+            for problem in problems
+        ))
+
+    def close(self):
+        if self._file is not sys.stdout:
+            self._file.close()
+
+
+class ParquetWriter:
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet output needs pyarrow: pip install pyarrow")
+        self._pa = pa
+        self._schema = pa.schema([
+            ("grade_level", pa.string()),
+            ("problem_type", pa.string()),
+            ("theme", pa.string()),
+            ("question", pa.string()),
+            ("answer", pa.int64()),
+            ("explanation", pa.string()),
+            ("num_steps", pa.int32()),
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, problems):
+        columns = {field: [problem[field] for problem in problems] for field in FIELDS}
+        self._writer.write_table(self._pa.table(columns, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+def write_bulk(path, count, fmt=None, **kwargs):
+    """Stream generated problems to `path` ("-" for stdout); returns the number written"""
+    if fmt is None:
+        fmt = "parquet" if str(path).endswith(".parquet") else "jsonl"
+    writer = ParquetWriter(path) if fmt == "parquet" else JSONLWriter(path)
+    written = 0
+    try:
+        for problems in generate_bulk(count, **kwargs):
+            writer.write(problems)
+            written += len(problems)
+    finally:
+        writer.close()
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate large sets of math word problems offline")
+    parser.add_argument("--count", type=int, required=True, help="problems per grade level and problem type")
+    parser.add_argument("--grades", nargs="+", default=list(GRADE_LEVELS), choices=GRADE_LEVELS)
+    parser.add_argument("--types", nargs="+", default=list(PROBLEM_TYPES), choices=PROBLEM_TYPES,
+                        metavar="TYPE", help="problem types (default: all)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for reproducible output")
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=1, help="worker processes")
+    parser.add_argument("--format", choices=("jsonl", "parquet"), help="default: from --out extension")
+    parser.add_argument("--out", default="-", help="output file, or - for stdout")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    written = write_bulk(
+        args.out, args.count, fmt=args.format,
+        grade_levels=args.grades, problem_types=args.types, seed=args.seed,
+        chunk_size=args.chunk_size, workers=args.workers,
+    )
+    elapsed = time.perf_counter() - started
+    print(f"Wrote {written} problems in {elapsed:.2f}s ({written / elapsed:,.0f} problems/s)",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,77 +1,542 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+import time
+
+# Start of the server's own import, for the startup report in /api/ready
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from problem_generator import generate_word_problem
+from answer_checker import check_answer as grade_answer
+from generation_router import Backend, CircuitBreaker, GenerationRouter, parse_backends
+from generation_scheduler import BACKGROUND, INTERACTIVE, GenerationScheduler
+from logging_config import configure_logging, shutdown_logging
+from metrics import REGISTRY, EventLoopLagMonitor, RouteMetricsMiddleware, counter, gauge, histogram
+from problem_generator import (OPENAI_MAX_CONCURRENCY, OPENAI_MODEL, OPENAI_TIMEOUT, close_async_client,
+                               get_async_client, get_fallback_problem, request_word_problem,
+                               solve_problem, stream_word_problem)
+from problem_corpus import ProblemCorpus
+from problem_pool import DISCARDED, GRADE_LEVELS, ProblemPool
+from problem_quarantine import ProblemQuarantine
+from problem_verifier import MISMATCH, UNCONFIRMED, ProblemVerifier, VerificationPipeline, check_arithmetic
+from skill_model import DemandTracker, SkillTracker
+from problem_store import create_problem_store
+from static_assets import StaticAssets
+from template_engine import generate_template_problem
+import asyncio
+import contextlib
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import importlib
+import json
 import os
+import random
 from pathlib import Path
+from typing import Optional, Union
 import logging
 import sys
-import traceback
+
+# Queue-backed logging; DEBUG=true, LOG_LEVEL, LOG_LEVELS etc. are read here
+log_handler = configure_logging()
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
+app.add_middleware(RouteMetricsMiddleware)
+
+# "openai" generates with the model; "template" uses the local template
+# engine only, which needs no API key or network (handy for load tests)
+PROBLEM_GENERATOR = os.getenv("PROBLEM_GENERATOR", "openai")
+
+# Generation scheduler: account rate limits, retries, and how long an
+# interactive request waits for the model before falling back
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "500"))
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "200000"))
+OPENAI_TOKENS_PER_REQUEST = int(os.getenv("OPENAI_TOKENS_PER_REQUEST", "2500"))
+GENERATION_MAX_RETRIES = int(os.getenv("GENERATION_MAX_RETRIES", "3"))
+INTERACTIVE_TIMEOUT = float(os.getenv("INTERACTIVE_TIMEOUT", "20"))
+
+# Generation backends in order of preference (see generation_router.py):
+# openai:<model>, local:<model>@<OpenAI-compatible base URL> or template,
+# e.g. "openai:o3-mini,local:llama3.1@http://localhost:8080/v1,template".
+# A call still running after its backend's p95 latency (ROUTER_INITIAL_BUDGET
+# until there's history, never under ROUTER_MIN_BUDGET) is hedged to the next
+# backend, with at most ROUTER_HEDGE_LIMIT hedged calls at a time. A backend
+# failing ROUTER_BREAKER_ERROR_RATE of its recent calls (over the last
+# ROUTER_WINDOW calls) is skipped for ROUTER_BREAKER_COOLDOWN seconds
+GENERATION_BACKENDS = os.getenv("GENERATION_BACKENDS", f"openai:{OPENAI_MODEL}")
+ROUTER_INITIAL_BUDGET = float(os.getenv("ROUTER_INITIAL_BUDGET", "10"))
+ROUTER_MIN_BUDGET = float(os.getenv("ROUTER_MIN_BUDGET", "1"))
+ROUTER_HEDGE_LIMIT = int(os.getenv("ROUTER_HEDGE_LIMIT", "2"))
+ROUTER_WINDOW = int(os.getenv("ROUTER_WINDOW", "200"))
+ROUTER_BREAKER_ERROR_RATE = float(os.getenv("ROUTER_BREAKER_ERROR_RATE", "0.5"))
+ROUTER_BREAKER_COOLDOWN = float(os.getenv("ROUTER_BREAKER_COOLDOWN", "30"))
+
+# Pre-generated problem pool settings
+POOL_ENABLED = os.getenv("POOL_ENABLED", "true").lower() == "true"
+POOL_DEPTH = int(os.getenv("POOL_DEPTH", "10"))
+POOL_LOW_WATER = int(os.getenv("POOL_LOW_WATER", "5"))
+POOL_REFILL_CONCURRENCY = int(os.getenv("POOL_REFILL_CONCURRENCY", "2"))
+
+# Most problems one /api/problems call may return
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "10"))
+
+# Persistent corpus of generated problems. Once a grade has CORPUS_MIN_SIZE
+# problems, CORPUS_SERVE_RATIO of its requests are served from the corpus and
+# the model is only called to keep growing it
+CORPUS_ENABLED = os.getenv("CORPUS_ENABLED", "true").lower() == "true"
+CORPUS_PATH = os.getenv("CORPUS_PATH", str(Path(__file__).parent / "data" / "corpus.db"))
+CORPUS_MIN_SIZE = int(os.getenv("CORPUS_MIN_SIZE", "50"))
+CORPUS_SERVE_RATIO = float(os.getenv("CORPUS_SERVE_RATIO", "0.9"))
+CORPUS_REUSE_LIMIT = int(os.getenv("CORPUS_REUSE_LIMIT", "1"))
+# Seconds between picking up problems other workers added to the corpus
+CORPUS_RELOAD_INTERVAL = float(os.getenv("CORPUS_RELOAD_INTERVAL", "60"))
+
+# Answer verification: model-generated problems are checked before they reach
+# the pool or corpus, and ones with wrong answers are quarantined. Ones whose
+# answer couldn't be confirmed are served at most once (inline) and never
+# reused; VERIFY_STRICT quarantines them too. With VERIFY_WITH_MODEL a
+# cheaper second model also solves each question
+VERIFY_ENABLED = os.getenv("VERIFY_ENABLED", "true").lower() == "true"
+VERIFY_WORKERS = int(os.getenv("VERIFY_WORKERS", "2"))
+VERIFY_WITH_MODEL = os.getenv("VERIFY_WITH_MODEL", "false").lower() == "true"
+VERIFY_STRICT = os.getenv("VERIFY_STRICT", "false").lower() == "true"
+QUARANTINE_PATH = os.getenv("QUARANTINE_PATH", str(Path(__file__).parent / "data" / "quarantine.db"))
+
+# Served-problem store: "memory" is per process, "sqlite" is shared by every
+# worker on the host and survives restarts
+PROBLEM_STORE = os.getenv("PROBLEM_STORE", "memory")
+PROBLEM_STORE_PATH = os.getenv("PROBLEM_STORE_PATH", str(Path(__file__).parent / "data" / "problems.db"))
+PROBLEM_STORE_MAX_SIZE = int(os.getenv("PROBLEM_STORE_MAX_SIZE", "10000"))
+PROBLEM_STORE_TTL = float(os.getenv("PROBLEM_STORE_TTL", "7200"))
+
+# Adaptive difficulty: answers checked with a session_id feed that session's
+# skill estimate, which picks the problem type and step count it's served
+# next, and pool refills follow the types being asked for. Per process, like
+# the corpus's per-session repeat tracking
+ADAPTIVE_ENABLED = os.getenv("ADAPTIVE_ENABLED", "true").lower() == "true"
+SKILL_MAX_SESSIONS = int(os.getenv("SKILL_MAX_SESSIONS", "10000"))
 
-# Add this near the top
-DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+# Near-duplicate filter over generated questions (MinHash/LSH, see
+# near_duplicates.py). Background refills too similar to a question already
+# seen are dropped before they reach the pool or corpus; interactive ones are
+# still served but not kept. Loaded in the background at startup, as part of
+# the warm-up when that's enabled (built from the corpus the first time), and
+# saved every DEDUP_SAVE_INTERVAL seconds
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+DEDUP_PATH = os.getenv("DEDUP_PATH", str(Path(__file__).parent / "data" / "near_duplicates.npz"))
+DEDUP_CAPACITY = int(os.getenv("DEDUP_CAPACITY", "200000"))
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.5"))
+DEDUP_SAVE_INTERVAL = float(os.getenv("DEDUP_SAVE_INTERVAL", "300"))
 
-def debug_log(message):
-    if DEBUG:
-        print(message)
+# Startup warm-up, run in the background once the server is listening: load
+# the near-duplicate index, import the SDK, build the client and open
+# WARMUP_CONNECTIONS connections. /api/ready answers 503 until it's done. The
+# pool is seeded from the corpus before that, during startup
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "10"))
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "2"))
 
 # Define models first
 class AnswerRequest(BaseModel):
     problem_id: int
-    user_answer: float  # Changed to float for more complex answers
+    # A number, or text as typed: "3/4", "75%", "$31", "2.1 kg"
+    user_answer: Union[float, str]
+    session_id: Optional[str] = None
+
+# Bounded store for served problems and their explanations
+problem_store = create_problem_store(
+    PROBLEM_STORE,
+    path=PROBLEM_STORE_PATH,
+    max_size=PROBLEM_STORE_MAX_SIZE,
+    ttl=PROBLEM_STORE_TTL,
+)
+
+async def run_store(method, *args):
+    """Call a problem store method, from a worker thread if the store does disk I/O"""
+    if problem_store.blocking:
+        return await asyncio.to_thread(method, *args)
+    return method(*args)
+
+problem_corpus = ProblemCorpus(CORPUS_PATH, reuse_limit=CORPUS_REUSE_LIMIT) if CORPUS_ENABLED else None
+
+# Set by the warm-up; until then nothing is checked
+dedup_index = None
+
+def is_near_duplicate(grade_level, problem):
+    """Check a freshly generated question against those seen before; new ones are added to the index"""
+    if dedup_index is None or problem.get("source") != "openai":
+        return False
+    similarity = dedup_index.check_and_add(problem["question"])
+    if similarity is None:
+        return False
+    NEAR_DUPLICATES.inc(grade_level)
+    problem["near_duplicate"] = round(similarity, 3)
+    logger.info(f"Near-duplicate grade {grade_level} problem (similarity {similarity:.2f})")
+    return True
+
+def open_dedup_index():
+    """Load the saved index, or build it from the corpus; runs in a worker thread"""
+    # Imported here so numpy stays off the server's import path
+    from near_duplicates import NearDuplicateIndex
+    index = NearDuplicateIndex(capacity=DEDUP_CAPACITY, threshold=DEDUP_THRESHOLD)
+    if not index.restore(DEDUP_PATH) and problem_corpus is not None:
+        for question in problem_corpus.iter_questions():
+            index.add(question)
+        index.save(DEDUP_PATH)
+    return index
+
+async def load_dedup_index():
+    global dedup_index
+    try:
+        dedup_index = await asyncio.to_thread(open_dedup_index)
+        startup_report["near_duplicate_index"] = len(dedup_index)
+    except Exception as e:
+        logger.error(f"Loading the near-duplicate index failed: {str(e)}")
+
+async def save_dedup_index():
+    if dedup_index is not None and dedup_index.dirty:
+        # The snapshot is copied here on the loop; only the file write runs in a thread
+        await asyncio.to_thread(dedup_index.save, DEDUP_PATH, dedup_index.snapshot())
+
+async def save_dedup_index_periodically():
+    while True:
+        await asyncio.sleep(DEDUP_SAVE_INTERVAL)
+        try:
+            await save_dedup_index()
+        except Exception as e:
+            logger.error(f"Saving the near-duplicate index failed: {str(e)}")
+
+async def reload_corpus_periodically():
+    while True:
+        await asyncio.sleep(CORPUS_RELOAD_INTERVAL)
+        try:
+            await asyncio.to_thread(problem_corpus.reload)
+        except Exception as e:
+            logger.error(f"Reloading the corpus failed: {str(e)}")
+
+# SQLite writes that nobody waits for (corpus adds) run one at a time on this
+# thread rather than on the event loop
+disk_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="disk-writer")
 
-# In-memory store for active problems and their explanations
-active_problems = {}
-problem_explanations = {}
+def write_in_background(function, *args):
+    def log_failure(future):
+        if future.exception() is not None:
+            logger.error(f"Background write failed: {str(future.exception())}")
+
+    disk_writer.submit(function, *args).add_done_callback(log_failure)
+
+def record_generated(grade_level, problem):
+    """Keep a copy of a model-generated problem in the corpus"""
+    if problem_corpus is not None and problem.get("source") == "openai" and "near_duplicate" not in problem:
+        write_in_background(problem_corpus.add, problem, grade_level)
+
+problem_quarantine = ProblemQuarantine(QUARANTINE_PATH) if VERIFY_ENABLED else None
+
+def quarantine_problem(grade_level, problem, reason):
+    if problem_quarantine is not None:
+        write_in_background(problem_quarantine.add, grade_level, problem, reason)
+
+async def confirm_answer(problem):
+    await generation_scheduler.reserve()
+    return await solve_problem(problem["question"])
+
+# Verified problems are the only ones recorded in the corpus
+verification_pipeline = VerificationPipeline(
+    ProblemVerifier(confirm_answer if VERIFY_WITH_MODEL else None, strict=VERIFY_STRICT)
+    if VERIFY_ENABLED else None,
+    workers=VERIFY_WORKERS,
+    on_verified=record_generated,
+    on_quarantined=quarantine_problem,
+)
+
+def serve_generated(grade_level, problem):
+    """Check a problem that's about to be served; the full check runs in the background"""
+    is_near_duplicate(grade_level, problem)
+    if VERIFY_ENABLED:
+        status, reason = check_arithmetic(problem)
+        if status == MISMATCH:
+            logger.warning(f"Quarantined a grade {grade_level} problem before serving: {reason}")
+            quarantine_problem(grade_level, problem, reason)
+            return get_fallback_problem(grade_level)
+    verification_pipeline.submit(grade_level, problem)
+    return problem
+
+def adopt_orphan(grade_level, problem):
+    """Problems whose requester gave up still go to the corpus and pool once verified"""
+    if is_near_duplicate(grade_level, problem):
+        return
+    def pool_verified(future):
+        if not future.cancelled() and future.result() is not None:
+            problem_pool.put(grade_level, future.result())
+
+    verification_pipeline.submit(grade_level, problem).add_done_callback(pool_verified)
+
+async def generate_from_templates(grade_level, problem_type=None):
+    return generate_template_problem(grade_level, problem_type)
+
+def make_backend(kind, model, base_url):
+    if kind == "template":
+        name, generate = "template", generate_from_templates
+    else:
+        name = f"{kind}:{model}"
+        generate = functools.partial(request_word_problem, model=model, base_url=base_url)
+    return Backend(
+        name,
+        generate,
+        budget=ROUTER_INITIAL_BUDGET,
+        min_budget=ROUTER_MIN_BUDGET,
+        max_budget=OPENAI_TIMEOUT,
+        window=ROUTER_WINDOW,
+        breaker=CircuitBreaker(error_rate=ROUTER_BREAKER_ERROR_RATE, cooldown=ROUTER_BREAKER_COOLDOWN),
+    )
+
+def record_backend_result(name, outcome, seconds):
+    BACKEND_CALLS.inc(name, outcome)
+    BACKEND_SECONDS.observe(name, outcome, value=seconds)
+
+backend_specs = parse_backends(GENERATION_BACKENDS)
+# Without an API key only local and template backends can answer
+needs_openai_key = all(kind == "openai" for kind, _, _ in backend_specs)
+generation_router = GenerationRouter([make_backend(*spec) for spec in backend_specs],
+                                     hedge_limit=ROUTER_HEDGE_LIMIT, on_result=record_backend_result)
+
+generation_scheduler = GenerationScheduler(
+    generation_router.generate,
+    workers=OPENAI_MAX_CONCURRENCY,
+    rpm=OPENAI_RPM_LIMIT,
+    tpm=OPENAI_TPM_LIMIT,
+    tokens_per_request=OPENAI_TOKENS_PER_REQUEST,
+    max_retries=GENERATION_MAX_RETRIES,
+    on_orphan=adopt_orphan,
+)
+
+async def generate_and_record(grade_level, priority=INTERACTIVE, problem_type=None):
+    """Generate a problem through the scheduler, falling back to the template engine
+
+    Interactive problems are served after the inline arithmetic check. Background
+    ones wait for full verification and come back as None if quarantined, or
+    DISCARDED if they're near-duplicates or their answer couldn't be confirmed.
+    """
+    if PROBLEM_GENERATOR == "template":
+        return generate_template_problem(grade_level, problem_type)
+    if needs_openai_key and get_async_client() is None:
+        return get_fallback_problem(grade_level, problem_type)
+
+    timeout = INTERACTIVE_TIMEOUT if priority == INTERACTIVE else None
+    problem = await generation_scheduler.request(grade_level, priority, timeout=timeout,
+                                                 problem_type=problem_type)
+    if problem is None:
+        return get_fallback_problem(grade_level, problem_type)
+    if priority == INTERACTIVE:
+        return serve_generated(grade_level, problem)
+    if is_near_duplicate(grade_level, problem):
+        return DISCARDED
+    verified = await verification_pipeline.verify(grade_level, problem)
+    if verified is None and problem.get("verification") == UNCONFIRMED:
+        return DISCARDED
+    return verified
+
+skill_tracker = SkillTracker(max_sessions=SKILL_MAX_SESSIONS)
+demand_tracker = DemandTracker()
+
+def choose_target(grade_level, session_id):
+    """(problem_type, num_steps) to serve the session next, or (None, None) without history"""
+    if not ADAPTIVE_ENABLED:
+        return None, None
+    problem_type, num_steps = skill_tracker.choose(session_id, grade_level)
+    if problem_type is not None:
+        demand_tracker.note(grade_level, problem_type)
+    return problem_type, num_steps
+
+async def refill_problem(grade_level):
+    # Refill with the types sessions have been asking for (random ones until there's demand)
+    problem_type = demand_tracker.next_type(grade_level)
+    return await generate_and_record(grade_level, priority=BACKGROUND, problem_type=problem_type)
+
+problem_pool = ProblemPool(
+    refill_problem,
+    depth=POOL_DEPTH,
+    low_water=POOL_LOW_WATER,
+    refill_concurrency=POOL_REFILL_CONCURRENCY,
+)
+
+# Served by /api/metrics; sizes are read when scraped
+PROBLEMS_SERVED = counter("problems_served_total", "Problems handed to clients", ["source"])
+gauge("problem_store_size", "Served problems waiting for an answer check", callback=problem_store.size_estimate)
+gauge("problem_pool_size", "Pre-generated problems ready to serve", ["grade_level"],
+      callback=lambda: {(grade,): size for grade, size in problem_pool.stats()["sizes"].items()})
+NEAR_DUPLICATES = counter("near_duplicates_total", "Generated problems too similar to an earlier one",
+                          ["grade_level"])
+gauge("near_duplicate_index_size", "Questions in the near-duplicate index",
+      callback=lambda: len(dedup_index) if dedup_index is not None else 0)
+BACKEND_CALLS = counter("generation_backend_calls_total", "Routed generation calls by backend and outcome",
+                        ["backend", "outcome"])
+BACKEND_SECONDS = histogram("generation_backend_seconds", "Latency of routed generation calls",
+                            ["backend", "outcome"])
+gauge("generation_backend_available", "1 while the backend's circuit breaker is closed", ["backend"],
+      callback=lambda: {(backend.name,): int(generation_router.healthy(backend.name))
+                        for backend in generation_router.backends})
+gauge("log_records_dropped", "Log records dropped because the log queue was full",
+      callback=lambda: log_handler.dropped)
+event_loop_lag = EventLoopLagMonitor()
+
+# Seconds since IMPORT_STARTED for each startup milestone; served by /api/ready
+startup_report = {
+    "import_seconds": None,
+    "warmup_seconds": None,
+    "ready_seconds": None,
+    "first_problem_seconds": None,
+    "seeded_from_corpus": 0,
+    "connections_opened": 0,
+    "near_duplicate_index": 0,
+}
+warmup_task = None
+dedup_saver = None
+corpus_reloader = None
 
 # Get the absolute path to the frontend build directory
 FRONTEND_DIR = Path(__file__).parent.parent / "frontend" / "build"
-debug_log(f"Frontend directory path: {FRONTEND_DIR}")  # Debug print
+logger.debug(f"Frontend directory path: {FRONTEND_DIR}")
 
-# Only mount static files if the directory exists
-if (FRONTEND_DIR / "static").exists():
-    print("Static directory found")  # Debug print
-    app.mount("/static", StaticFiles(directory=str(FRONTEND_DIR / "static")), name="static")
-else:
-    print(f"Static directory not found at {FRONTEND_DIR / 'static'}")  # Debug print
+# Scanned once; index.html is kept in memory and assets get ETags and cache headers
+frontend_assets = StaticAssets(FRONTEND_DIR)
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+async def seed_pool_from_corpus():
+    """Fill the pool with verified problems from disk so the first requests don't wait on the model
+
+    Rows are picked from the corpus's in-memory index; only reading them
+    touches the disk, from a worker thread.
+    """
+    if problem_corpus is None or not POOL_ENABLED:
+        return 0
+    seeded = 0
+    for grade_level in GRADE_LEVELS:
+        wanted = problem_pool.depth - problem_pool.size(grade_level)
+        # Distinct rows hold distinct questions. Picks are random and cheap, so
+        # allow plenty of repeats before deciding a small grade has run out
+        row_ids = []
+        for _ in range(problem_pool.depth * 8):
+            if len(row_ids) >= wanted:
+                break
+            row_id = problem_corpus.pick(grade_level)
+            if row_id is None:
+                break
+            if row_id not in row_ids:
+                row_ids.append(row_id)
+        if not row_ids:
+            continue
+        problems = await asyncio.to_thread(lambda: [problem_corpus.load(row_id) for row_id in row_ids])
+        for problem in problems:
+            if problem is not None and problem_pool.put(grade_level, problem):
+                seeded += 1
+    return seeded
+
+async def open_connections(client, count):
+    """Make `count` cheap concurrent calls so the pool holds open TLS connections"""
+    results = await asyncio.gather(*(client.models.list() for _ in range(count)), return_exceptions=True)
+    # An error status still means the connection was made
+    return sum(not isinstance(result, Exception) or hasattr(result, "status_code") for result in results)
+
+async def warm_up():
+    started = time.perf_counter()
+    try:
+        if DEDUP_ENABLED:
+            await load_dedup_index()
+        if PROBLEM_GENERATOR == "openai" and os.getenv("OPENAI_API_KEY"):
+            # Import the SDK off the event loop so requests keep being served meanwhile
+            await asyncio.to_thread(importlib.import_module, "openai")
+            client = get_async_client()
+            if WARMUP_CONNECTIONS > 0:
+                startup_report["connections_opened"] = await asyncio.wait_for(
+                    open_connections(client, WARMUP_CONNECTIONS), WARMUP_TIMEOUT)
+    except Exception as e:
+        # Not fatal: requests fall back to the template engine until the API answers
+        logger.warning(f"Warm-up incomplete: {str(e)}")
+    finally:
+        now = time.perf_counter()
+        startup_report["warmup_seconds"] = round(now - started, 3)
+        startup_report["ready_seconds"] = round(now - IMPORT_STARTED, 3)
+        logger.info(f"Ready: {startup_report}")
 
 @app.on_event("startup")
 async def startup_event():
+    global warmup_task, dedup_saver, corpus_reloader
     logger.info("Starting application...")
-    logger.info(f"Frontend directory: {FRONTEND_DIR}")
-    logger.info(f"Static files exist: {(FRONTEND_DIR / 'static').exists()}")
-    logger.info(f"Index file exists: {(FRONTEND_DIR / 'index.html').exists()}")
+    logger.info(f"Frontend assets: {frontend_assets.stats()}")
+    event_loop_lag.start()
+    # Seed before the refill workers start so they don't generate what's on disk
+    startup_report["seeded_from_corpus"] = await seed_pool_from_corpus()
+    if POOL_ENABLED:
+        await problem_pool.start()
+    if DEDUP_ENABLED:
+        dedup_saver = asyncio.create_task(save_dedup_index_periodically(), name="dedup-saver")
+    if problem_corpus is not None and CORPUS_RELOAD_INTERVAL > 0:
+        corpus_reloader = asyncio.create_task(reload_corpus_periodically(), name="corpus-reloader")
+    if WARMUP_ENABLED:
+        warmup_task = asyncio.create_task(warm_up(), name="warm-up")
+    else:
+        startup_report["ready_seconds"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+        if DEDUP_ENABLED:
+            # Normally part of the warm-up; the filter is off until it has loaded
+            warmup_task = asyncio.create_task(load_dedup_index(), name="dedup-load")
 
-# Add error handling middleware
-@app.middleware("http")
-async def catch_exceptions_middleware(request, call_next):
+@app.on_event("shutdown")
+async def shutdown_event():
+    if warmup_task is not None:
+        warmup_task.cancel()
+    if dedup_saver is not None:
+        dedup_saver.cancel()
+    if corpus_reloader is not None:
+        corpus_reloader.cancel()
     try:
-        return await call_next(request)
+        await save_dedup_index()
     except Exception as e:
-        logger.error(f"Request failed: {str(e)}")
-        logger.error(traceback.format_exc())
-        return JSONResponse(
-            status_code=500,
-            content={"message": "Internal server error", "error": str(e)}
-        )
+        logger.error(f"Saving the near-duplicate index failed: {str(e)}")
+    await problem_pool.stop()
+    await event_loop_lag.stop()
+    await generation_scheduler.stop()
+    await verification_pipeline.stop()
+    await close_async_client()
+    await asyncio.to_thread(disk_writer.shutdown)
+    problem_store.close()
+    if problem_corpus is not None:
+        problem_corpus.close()
+    if problem_quarantine is not None:
+        problem_quarantine.close()
+    shutdown_logging()
 
-# API routes should come BEFORE the catch-all frontend route
-@app.get("/api/problem")
-def get_problem(grade_level: str = "5-8"):
-    problem = generate_word_problem(grade_level=grade_level)
-    problem_id = len(active_problems) + 1000
+# Only called when a request actually fails, unlike an HTTP middleware that
+# wraps every request
+@app.exception_handler(Exception)
+async def unhandled_exception_handler(request, e):
+    logger.exception(f"Request failed: {request.method} {request.url.path}: {str(e)}")
+    return JSONResponse(
+        status_code=500,
+        content={"message": "Internal server error", "error": str(e)}
+    )
+
+async def take_ready_problem(grade_level, session_id=None, problem_type=None, num_steps=None):
+    """Return a problem from the corpus or pool without generating, or None"""
+    problem = None
+    if (problem_corpus is not None
+            and problem_corpus.count(grade_level) >= CORPUS_MIN_SIZE
+            and random.random() < CORPUS_SERVE_RATIO):
+        # Chosen from the in-memory index, honouring the adaptive target; only
+        # the row read touches the disk
+        row_id = problem_corpus.pick(grade_level, session_id, problem_type, num_steps)
+        if row_id is not None:
+            problem = await asyncio.to_thread(problem_corpus.load, row_id)
 
-    active_problems[problem_id] = problem["answer"]
-    problem_explanations[problem_id] = problem["explanation"]
+    # Then the pool
+    if problem is None:
+        problem = problem_pool.take(grade_level, problem_type, num_steps)
+    return problem
 
+def problem_response(problem_id, problem):
+    PROBLEMS_SERVED.inc(problem.get("source", "unknown"))
+    if startup_report["first_problem_seconds"] is None:
+        startup_report["first_problem_seconds"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+        logger.info(f"First problem served {startup_report['first_problem_seconds']}s after start")
     return {
         "problem_id": problem_id,
         "question": problem["question"],
@@ -80,54 +545,269 @@ def get_problem(grade_level: str = "5-8"):
         "num_steps": problem.get("num_steps", 1)
     }
 
+# API routes should come BEFORE the catch-all frontend route
+@app.get("/api/problem")
+async def get_problem(grade_level: str = "5-8", session_id: Optional[str] = None):
+    problem_type, num_steps = choose_target(grade_level, session_id)
+    problem = await take_ready_problem(grade_level, session_id, problem_type, num_steps)
+    # Only generate inline on a miss
+    if problem is None:
+        problem = await generate_and_record(grade_level, problem_type=problem_type)
+    problem_id = await run_store(problem_store.add, problem, grade_level)
+
+    return problem_response(problem_id, problem)
+
+@app.get("/api/problems")
+async def get_problems(grade_level: str = "5-8", count: int = 5, session_id: Optional[str] = None):
+    """Stream up to MAX_BATCH_SIZE problems as NDJSON, one line per problem as it is ready"""
+    count = max(1, min(count, MAX_BATCH_SIZE))
+
+    # Everything the corpus and pool can supply goes out in the first chunk
+    ready = []
+    targets = [choose_target(grade_level, session_id) for _ in range(count)]
+    while len(ready) < count:
+        problem = await take_ready_problem(grade_level, session_id, *targets[len(ready)])
+        if problem is None:
+            break
+        ready.append(problem)
+    ready_ids = await run_store(problem_store.add_many, ready, grade_level) if ready else []
+    missing = count - len(ready)
+
+    async def stream():
+        if ready:
+            yield "".join(json.dumps(problem_response(problem_id, problem)) + "\n"
+                          for problem_id, problem in zip(ready_ids, ready))
+        if not missing:
+            return
+
+        # Generate the rest concurrently and send each one as soon as it's done
+        tasks = [asyncio.create_task(generate_and_record(grade_level, problem_type=problem_type))
+                 for problem_type, _ in targets[len(ready):]]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                problem = await next_done
+                problem_id = await run_store(problem_store.add, problem, grade_level)
+                yield json.dumps(problem_response(problem_id, problem)) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Streamed generations always use OPENAI_MODEL
+STREAM_BACKEND = f"openai:{OPENAI_MODEL}"
+
+def claim_stream_backend():
+    """(backend, None) if a generation may be streamed now, else (None, the reason it can't)
+
+    A stream can't be hedged, so it goes straight to the router's backend for
+    OPENAI_MODEL; its outcome and latency are still recorded there, so failed
+    streams open the breaker like failed routed calls.
+    """
+    if get_async_client() is None:
+        return None, "no OpenAI API key"
+    backend = generation_router.backend(STREAM_BACKEND)
+    if backend is None:
+        return None, f"{STREAM_BACKEND} is not in GENERATION_BACKENDS"
+    if not backend.breaker.allow():
+        return None, f"the {STREAM_BACKEND} circuit breaker is {backend.breaker.state}"
+    return backend, None
+
+@app.get("/api/problem/stream")
+async def stream_problem(grade_level: str = "5-8", session_id: Optional[str] = None):
+    """Server-sent events for one problem
+
+    A `question` event carries the question text as soon as the model has
+    written it. The final `problem` event carries the same fields as
+    /api/problem, including the problem_id, and is only sent after the whole
+    problem has been validated and stored. If generation fails after the
+    question went out, `problem` carries a replacement question. When a
+    stream can't be started, or fails before the question, the problem is
+    generated the same way as for /api/problem and sent as `problem` alone.
+    """
+    async def events():
+        problem_type, num_steps = choose_target(grade_level, session_id)
+        problem = await take_ready_problem(grade_level, session_id, problem_type, num_steps)
+        backend = None
+        if problem is None and PROBLEM_GENERATOR == "openai":
+            backend, reason = claim_stream_backend()
+            if backend is None:
+                logger.info(f"Not streaming a grade {grade_level} problem: {reason}")
+
+        if backend is not None:
+            loop = asyncio.get_running_loop()
+            started = None
+            outcome = "cancelled"
+            question_sent = False
+            try:
+                await generation_scheduler.reserve()
+                started = loop.time()
+                # aclosing: if the client goes away mid-stream, the upstream
+                # stream and its concurrency slot are released now, not at GC
+                async with contextlib.aclosing(stream_word_problem(grade_level, problem_type)) as parts:
+                    async for kind, value in parts:
+                        if kind == "question":
+                            question_sent = True
+                            yield sse_event("question", {"question": value})
+                        else:
+                            problem = value
+                outcome = "ok" if problem is not None else "invalid"
+            except Exception as e:
+                outcome = "error"
+                logger.error(f"Streamed generation failed: {str(e)}")
+            finally:
+                # Also runs when the client disconnects, which counts as cancelled
+                if started is None:
+                    backend.breaker.release()
+                else:
+                    generation_router.record(backend, outcome, loop.time() - started)
+
+            if problem is not None:
+                problem = serve_generated(grade_level, problem)
+            elif question_sent:
+                problem = get_fallback_problem(grade_level, problem_type)
+            else:
+                logger.info(f"Streamed grade {grade_level} generation gave no problem ({outcome}); "
+                            f"generating it without streaming")
+        if problem is None:
+            problem = await generate_and_record(grade_level, problem_type=problem_type)
+
+        problem_id = await run_store(problem_store.add, problem, grade_level)
+        yield sse_event("problem", problem_response(problem_id, problem))
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.post("/api/check_answer")
-def check_answer(answer_request: AnswerRequest):
-    correct_answer = active_problems.get(answer_request.problem_id, None)
-    if correct_answer is None:
+async def check_answer(answer_request: AnswerRequest):
+    """Check an answer against a served problem
+
+    Problems are evicted once the store is full or they sit unanswered past
+    PROBLEM_STORE_TTL. Unknown, evicted and expired IDs all get the same
+    {"status": "error", "message": "Invalid problem ID"} response, and the
+    client should fetch a new problem.
+    """
+    record = await run_store(problem_store.get, answer_request.problem_id)
+    if record is None:
         return {"status": "error", "message": "Invalid problem ID"}
-    
-    # Allow for small floating-point differences
-    is_correct = abs(answer_request.user_answer - correct_answer) < 0.01
-    
-    return {
-        "correct": is_correct,
+    correct_answer = record.answer
+
+    is_correct = grade_answer(answer_request.user_answer, correct_answer, record.problem_id)
+    if ADAPTIVE_ENABLED and answer_request.session_id and is_correct is not None:
+        skill_tracker.record(answer_request.session_id, record, is_correct, time.time() - record.created_at)
+
+    response = {
+        "correct": bool(is_correct),
         "correct_answer": correct_answer,
-        "explanation": problem_explanations.get(answer_request.problem_id, "No explanation available")
+        "explanation": record.explanation
     }
+    if is_correct is None:
+        response["message"] = "Could not read the answer as a number"
+    return response
+
+@app.get("/api/skill")
+async def session_skill(session_id: str):
+    """What the server has learned about a session from its checked answers"""
+    summary = skill_tracker.session(session_id)
+    if summary is None:
+        return {"status": "error", "message": "Unknown session"}
+    return {"session_id": session_id, **summary}
+
+@app.get("/api/skill/stats")
+async def skill_stats():
+    return {"enabled": ADAPTIVE_ENABLED, **skill_tracker.stats(), "demand": demand_tracker.stats()}
+
+@app.get("/api/dedup/stats")
+async def dedup_stats():
+    if dedup_index is None:
+        return {"enabled": DEDUP_ENABLED, "loaded": False}
+    return {"enabled": DEDUP_ENABLED, "loaded": True, **dedup_index.stats()}
+
+@app.get("/api/pool/stats")
+async def pool_stats():
+    return problem_pool.stats()
+
+@app.get("/api/scheduler/stats")
+async def scheduler_stats():
+    return generation_scheduler.stats()
+
+@app.get("/api/router/stats")
+async def router_stats():
+    return generation_router.stats()
+
+@app.get("/api/corpus/stats")
+async def corpus_stats():
+    if problem_corpus is None:
+        return {"enabled": False}
+    return {"enabled": True, **problem_corpus.stats()}
+
+@app.get("/api/verification/stats")
+async def verification_stats():
+    # The quarantine's size is a SQLite count, so it's read off the event loop
+    quarantine = await asyncio.to_thread(problem_quarantine.stats) if problem_quarantine is not None else None
+    return {
+        "enabled": VERIFY_ENABLED,
+        "with_model": VERIFY_WITH_MODEL,
+        "strict": VERIFY_STRICT,
+        **verification_pipeline.stats(),
+        "quarantine": quarantine,
+    }
+
+@app.get("/api/quarantine")
+async def quarantined_problems(limit: int = 20):
+    """Most recently quarantined problems, for review"""
+    if problem_quarantine is None:
+        return []
+    return await asyncio.to_thread(problem_quarantine.recent, max(1, min(limit, 100)))
+
+@app.get("/api/store/stats")
+async def store_stats():
+    return await run_store(problem_store.stats)
+
+@app.get("/api/metrics")
+async def metrics():
+    """All counters, gauges and histograms in the Prometheus text format"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/api/health")
-def health_check():
+async def health_check():
+    """Liveness: the process is up and serving"""
     return {"status": "ok"}
 
+@app.get("/api/ready")
+async def readiness_check():
+    """Readiness: 503 until the startup warm-up has finished, with the startup timings
+
+    The worker's pid is included so a caller can tell the workers apart.
+    """
+    if startup_report["ready_seconds"] is None:
+        return JSONResponse(status_code=503, content={"status": "warming_up", "pid": os.getpid(),
+                                                      **startup_report})
+    return {"status": "ready", "pid": os.getpid(), **startup_report}
+
 # Frontend routes should come AFTER API routes
-@app.get("/")
-async def root():
-    try:
-        logger.info("Attempting to serve frontend")
-        return await serve_frontend("")
-    except Exception as e:
-        logger.error(f"Error serving frontend: {str(e)}")
-        return {"error": str(e)}
+@app.get("/static/{asset_path:path}")
+async def serve_static(asset_path: str, request: Request):
+    response = frontend_assets.response(f"static/{asset_path}", request.headers)
+    if response is None:
+        raise HTTPException(status_code=404)
+    return response
 
 @app.get("/{full_path:path}")
-async def serve_frontend(full_path: str):
-    logger.info(f"Requested path: {full_path}")
-    try:
-        if full_path.startswith("api/"):
-            raise HTTPException(status_code=404)
-        
-        # If frontend isn't built, return a helpful message
-        if not FRONTEND_DIR.exists():
-            logger.error(f"Frontend directory does not exist: {FRONTEND_DIR}")
-            return {"message": "Frontend not built"}
-        
-        index_file = FRONTEND_DIR / "index.html"
-        if not index_file.exists():
-            logger.error(f"index.html not found at {index_file}")
-            return {"message": "Frontend build incomplete"}
-        
-        logger.info(f"Serving index.html from {index_file}")
-        return FileResponse(str(index_file))
-    except Exception as e:
-        logger.error(f"Error: {str(e)}")
-        return {"error": str(e)}
+async def serve_frontend(full_path: str, request: Request):
+    logger.debug(f"Requested path: {full_path}")
+    if full_path.startswith("api/"):
+        raise HTTPException(status_code=404)
+
+    # Top-level build files (manifest.json, favicon.ico), otherwise the SPA entry point
+    response = frontend_assets.response(full_path, request.headers) if full_path else None
+    if response is None:
+        response = frontend_assets.index_response(request.headers)
+    if response is None:
+        return {"message": "Frontend not built"}
+    return response
+
+startup_report["import_seconds"] = round(time.perf_counter() - IMPORT_STARTED, 3)
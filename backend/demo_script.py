@@ -10,36 +10,33 @@ async def demo_client():
     async with httpx.AsyncClient(base_url="http://localhost:8000") as client:
         # Get a new problem
         print("\n1. Requesting a new math problem...")
-        response = await client.get("/problem")
+        response = await client.get("/api/problem", params={"grade_level": "3-5"})
         problem_data = response.json()
         
         problem_id = problem_data["problem_id"]
         question = problem_data["question"]
         print(f"Received problem #{problem_id}: {question}")
         
-        # Calculate answer (for demo purposes)
-        num1, num2 = map(int, question.split(" + "))
-        correct_answer = num1 + num2
-        
-        # First, submit correct answer
-        print("\n2. Submitting correct answer...")
-        response = await client.post("/check_answer", json={
+        # First, submit a wrong answer; the response includes the correct one
+        print("\n2. Submitting wrong answer...")
+        response = await client.post("/api/check_answer", json={
             "problem_id": problem_id,
-            "user_answer": correct_answer
+            "user_answer": "-1"
         })
-        print(f"Server response: {response.json()}")
+        result = response.json()
+        print(f"Server response: {result}")
         
-        # Then, submit wrong answer
-        print("\n3. Submitting wrong answer...")
-        response = await client.post("/check_answer", json={
+        # Then, submit the correct answer
+        print("\n3. Submitting correct answer...")
+        response = await client.post("/api/check_answer", json={
             "problem_id": problem_id,
-            "user_answer": correct_answer + 1
+            "user_answer": result["correct_answer"]
         })
         print(f"Server response: {response.json()}")
         
         # Try invalid problem ID
         print("\n4. Testing invalid problem ID...")
-        response = await client.post("/check_answer", json={
+        response = await client.post("/api/check_answer", json={
             "problem_id": 99999,
             "user_answer": 42
         })
@@ -0,0 +1,431 @@
+"""Routing generation calls across several backends, with hedging and circuit breakers
+
+A backend is anything that can make a problem: an OpenAI model, a model on a
+local OpenAI-compatible server, or the template engine. The router tries them
+in the configured order. Each backend keeps a rolling window of its recent
+calls, from which it gets a p95 latency and an error rate.
+
+- Hedging: if the backend called first hasn't answered within its latency
+  budget (its own p95, clamped), the next backend is called as well and the
+  first usable answer wins; the other call is cancelled. Since only the
+  slowest ~5% of calls are hedged, this costs about 5% more calls. A
+  cancelled call still tells us it took at least that long, so it counts
+  towards the p95 as a censored sample; leaving it out would drag the p95
+  down to the calls fast enough to win, and hedge more each round.
+- Failover: an error or unusable answer moves on to the next backend at once.
+- Circuit breaker: a backend whose error rate over the window (or run of
+  consecutive failures) crosses the threshold is skipped for a cooldown. Then
+  a single probe call is let through; success closes the breaker, failure
+  opens it again for twice as long, up to `max_cooldown`.
+"""
+import asyncio
+import logging
+import time
+from array import array
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Outcomes kept in a LatencyWindow; a cancelled call's latency is only a lower bound
+_FAILED, _OK, _CANCELLED = 0, 1, 2
+
+
+class BackendUnavailable(Exception):
+    """Every backend's circuit breaker is open"""
+
+
+class LatencyWindow:
+    """The last `size` calls of a backend (time, latency, outcome), oldest overwritten first
+
+    Calls older than `horizon` seconds are left out of the figures, so a bad
+    spell stops counting once it's over even when traffic is light. Cancelled
+    calls count towards the latency percentiles but not the error rate.
+    """
+
+    def __init__(self, size=200, horizon=600.0, clock=time.monotonic):
+        self.size = max(1, size)
+        self.horizon = horizon
+        self._clock = clock
+        self._times = array("d", [0.0]) * self.size
+        self._seconds = array("d", [0.0]) * self.size
+        self._outcome = array("B", [_FAILED]) * self.size
+        self._next = 0
+        self._count = 0
+        self._p95 = None
+        self._p95_at = 0.0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, seconds, ok):
+        self._add(seconds, _OK if ok else _FAILED)
+
+    def add_cancelled(self, seconds):
+        """A call cancelled after `seconds`, so it would have taken at least that long"""
+        self._add(seconds, _CANCELLED)
+
+    def _add(self, seconds, outcome):
+        i = self._next
+        self._times[i] = self._clock()
+        self._seconds[i] = seconds
+        self._outcome[i] = outcome
+        self._next = (i + 1) % self.size
+        self._count = min(self._count + 1, self.size)
+        self._p95 = None
+
+    def _recent(self, since):
+        since = max(since, self._clock() - self.horizon)
+        return (i for i in range(self._count) if self._times[i] >= since)
+
+    def error_rate(self, since=0.0):
+        """(failed share, calls) over the calls made at or after `since`"""
+        calls = failed = 0
+        for i in self._recent(since):
+            outcome = self._outcome[i]
+            if outcome != _CANCELLED:
+                calls += 1
+                failed += outcome == _FAILED
+        return (failed / calls if calls else 0.0), calls
+
+    def percentile(self, fraction, since=0.0):
+        """Latency of successful calls at `fraction` (0-1), or None without any
+
+        Cancelled calls are censored samples: a Kaplan-Meier estimate drops
+        them from the calls still running at their latency instead of
+        counting them as finished. Without any, this is the plain percentile.
+        If the percentile lies beyond every finished call, the longest
+        latency seen is returned as a lower bound.
+        """
+        samples = sorted((self._seconds[i], self._outcome[i]) for i in self._recent(since)
+                         if self._outcome[i] != _FAILED)
+        if not any(outcome == _OK for _, outcome in samples):
+            return None
+        still_running = len(samples)
+        survival = 1.0
+        for seconds, outcome in samples:
+            if outcome == _OK:
+                survival *= 1 - 1 / still_running
+                if survival < 1 - fraction - 1e-9:
+                    return seconds
+            still_running -= 1
+        return samples[-1][0]
+
+    def successes(self):
+        return sum(1 for i in self._recent(0.0) if self._outcome[i] == _OK)
+
+    def p95(self):
+        # Read on every routed request, so cached until a call lands or a second passes
+        now = self._clock()
+        if self._p95 is None or now - self._p95_at > 1.0:
+            self._p95 = self.percentile(0.95)
+            self._p95_at = now
+        return self._p95
+
+
+class CircuitBreaker:
+    def __init__(self, error_rate=0.5, min_calls=10, consecutive_failures=5, cooldown=30.0,
+                 max_cooldown=300.0, clock=time.monotonic):
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.consecutive_failures = consecutive_failures
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._clock = clock
+        self.state = CLOSED
+        self.cooldown = cooldown
+        self._open_until = 0.0
+        self._probing = False
+        self._failures_in_a_row = 0
+        # Calls before this time don't count towards reopening a closed breaker
+        self.closed_at = clock()
+        self.opened = 0
+
+    def allow(self):
+        """Whether a call may go ahead; in half-open state only one probe at a time"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if self._clock() < self._open_until:
+                return False
+            self.state = HALF_OPEN
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def release(self):
+        """A call that was let through ended without an outcome (it was cancelled)"""
+        self._probing = False
+
+    def record(self, ok, window):
+        self._probing = False
+        if ok:
+            self._failures_in_a_row = 0
+            if self.state == HALF_OPEN:
+                self.state = CLOSED
+                self.cooldown = self.base_cooldown
+                self.closed_at = self._clock()
+            return
+        self._failures_in_a_row += 1
+        if self.state == HALF_OPEN:
+            self._open(min(self.max_cooldown, self.cooldown * 2))
+            return
+        rate, calls = window.error_rate(since=self.closed_at)
+        if (self.state == CLOSED and (self._failures_in_a_row >= self.consecutive_failures
+                                      or (calls >= self.min_calls and rate >= self.error_rate))):
+            self._open(self.base_cooldown)
+
+    def _open(self, cooldown):
+        self.state = OPEN
+        self.cooldown = cooldown
+        self._open_until = self._clock() + cooldown
+        self.opened += 1
+
+
+class Backend:
+    """One way of generating problems, with its latency window and breaker
+
+    `generate` is an async callable(grade_level, problem_type) that raises on
+    failure and returns None for an unusable answer. The latency budget is
+    the backend's p95 once it has `min_samples` successful calls, clamped to
+    [`min_budget`, `max_budget`]; `budget` until then.
+    """
+
+    def __init__(self, name, generate, budget=10.0, min_budget=1.0, max_budget=30.0, min_samples=20,
+                 window=200, horizon=600.0, breaker=None, clock=time.monotonic):
+        self.name = name
+        self._generate = generate
+        self.budget = budget
+        self.min_budget = min_budget
+        self.max_budget = max_budget
+        self.min_samples = min_samples
+        self.window = LatencyWindow(window, horizon, clock=clock)
+        self.breaker = breaker or CircuitBreaker(clock=clock)
+        self.calls = 0
+        self.errors = 0
+        self.invalid = 0
+        self.cancelled = 0
+        self.hedged = 0
+        self.wins = 0
+
+    def latency_budget(self):
+        p95 = self.window.p95()
+        if p95 is None or self.window.successes() < self.min_samples:
+            return self.budget
+        return max(self.min_budget, min(self.max_budget, p95))
+
+    async def generate(self, grade_level, problem_type=None):
+        return await self._generate(grade_level, problem_type)
+
+    def record(self, seconds, ok):
+        self.calls += 1
+        if not ok:
+            self.errors += 1
+        self.window.add(seconds, ok)
+        self.breaker.record(ok, self.window)
+
+    def record_cancelled(self, seconds):
+        """A call cancelled after `seconds`: a latency sample, but no outcome for the breaker"""
+        self.cancelled += 1
+        self.window.add_cancelled(seconds)
+        self.breaker.release()
+
+    def stats(self):
+        rate, calls = self.window.error_rate()
+        p50 = self.window.percentile(0.5)
+        p95 = self.window.p95()
+        return {
+            "state": self.breaker.state,
+            "p50_seconds": round(p50, 3) if p50 is not None else None,
+            "p95_seconds": round(p95, 3) if p95 is not None else None,
+            "latency_budget": round(self.latency_budget(), 3),
+            "error_rate": round(rate, 3),
+            "window_calls": calls,
+            "calls": self.calls,
+            "errors": self.errors,
+            "invalid": self.invalid,
+            "cancelled": self.cancelled,
+            "hedged": self.hedged,
+            "wins": self.wins,
+            "breaker_opened": self.breaker.opened,
+        }
+
+
+class GenerationRouter:
+    """Route each generation to the first healthy backend, hedging slow calls
+
+    `generate(grade_level, problem_type)` has the same contract as a single
+    backend, so the router can stand in for one (e.g. in GenerationScheduler).
+    At most `max_hedges` extra backends are started because of slowness per
+    call, and at most `hedge_limit` hedged calls run at once, so a slow
+    upstream can't double the load on everything; failovers after errors are
+    not limited.
+    """
+
+    def __init__(self, backends, max_hedges=1, hedge_limit=2, on_result=None):
+        if not backends:
+            raise ValueError("GenerationRouter needs at least one backend")
+        self.backends = list(backends)
+        self.max_hedges = max_hedges
+        self.hedge_limit = hedge_limit
+        self._hedging = 0
+        # on_result(backend_name, outcome, seconds), e.g. for metrics
+        self._on_result = on_result
+        self.routed = 0
+        self.hedges = 0
+        self.failovers = 0
+        self.rejected = 0
+        self.hedges_skipped = 0
+
+    def healthy(self, name):
+        """Whether the named backend's breaker is closed (no probe is taken)"""
+        return any(backend.name == name and backend.breaker.state == CLOSED for backend in self.backends)
+
+    def backend(self, name):
+        """The configured backend called `name`, or None"""
+        return next((backend for backend in self.backends if backend.name == name), None)
+
+    def record(self, backend, outcome, seconds):
+        """Record a finished call: "ok", "unused", "invalid", "error" or "cancelled"
+
+        Also for calls made outside `generate` after `backend.breaker.allow()`,
+        such as a streamed generation, so they count towards the breaker and
+        latency window like routed ones.
+        """
+        if outcome == "cancelled":
+            backend.record_cancelled(seconds)
+        else:
+            # Slow or not, an answer means the backend is up
+            backend.record(seconds, ok=outcome != "error")
+            if outcome == "invalid":
+                backend.invalid += 1
+            elif outcome == "ok":
+                backend.wins += 1
+        if self._on_result is not None:
+            self._on_result(backend.name, outcome, seconds)
+
+    async def generate(self, grade_level, problem_type=None):
+        self.routed += 1
+        loop = asyncio.get_running_loop()
+        remaining = iter(self.backends)
+        pending = {}  # task -> (backend, started)
+
+        def launch():
+            for backend in remaining:
+                if backend.breaker.allow():
+                    task = asyncio.ensure_future(backend.generate(grade_level, problem_type))
+                    pending[task] = (backend, loop.time())
+                    return backend
+            return None
+
+        if launch() is None:
+            self.rejected += 1
+            raise BackendUnavailable("No generation backend available (all circuit breakers open)")
+
+        hedges = 0
+        # exhausted: no backend left to start; no_more_hedges: don't start one for slowness
+        exhausted = no_more_hedges = False
+        last_error = None
+        try:
+            while pending:
+                timeout = None
+                if hedges < self.max_hedges and not exhausted and not no_more_hedges:
+                    newest, started = max(pending.values(), key=lambda entry: entry[1])
+                    timeout = max(0.0, started + newest.latency_budget() - loop.time())
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # Over budget: ask the next backend too and take whichever answers first
+                    slow = max(pending.values(), key=lambda entry: entry[1])[0]
+                    if self._hedging >= self.hedge_limit:
+                        # Only hedging is capped; failover after an error still goes ahead
+                        self.hedges_skipped += 1
+                        no_more_hedges = True
+                        continue
+                    hedge = launch()
+                    if hedge is None:
+                        exhausted = True
+                    else:
+                        hedges += 1
+                        self.hedges += 1
+                        self._hedging += 1
+                        hedge.hedged += 1
+                        logger.info(f"Hedging grade {grade_level} generation: {slow.name} over "
+                                    f"{slow.latency_budget():.1f}s, also asking {hedge.name}")
+                    continue
+
+                # Record every finished call, even when more than one answered
+                winner = None
+                for task in done:
+                    backend, started = pending.pop(task)
+                    seconds = loop.time() - started
+                    error = task.exception()
+                    if error is not None:
+                        self.record(backend, "error", seconds)
+                        logger.warning(f"Backend {backend.name} failed: {str(error)}")
+                        last_error = error
+                        continue
+                    problem = task.result()
+                    if problem is None:
+                        self.record(backend, "invalid", seconds)
+                    elif winner is None:
+                        self.record(backend, "ok", seconds)
+                        problem["backend"] = backend.name
+                        winner = problem
+                    else:
+                        self.record(backend, "unused", seconds)
+                if winner is not None:
+                    return winner
+
+                if not pending and not exhausted:
+                    if launch() is None:
+                        exhausted = True
+                    else:
+                        self.failovers += 1
+        finally:
+            self._hedging -= hedges
+            for task, (backend, started) in pending.items():
+                task.cancel()
+                self.record(backend, "cancelled", loop.time() - started)
+
+        if last_error is not None:
+            raise last_error
+        return None
+
+    def stats(self):
+        return {
+            "routed": self.routed,
+            "hedges": self.hedges,
+            "hedges_skipped": self.hedges_skipped,
+            "hedging": self._hedging,
+            "failovers": self.failovers,
+            "rejected": self.rejected,
+            "backends": {backend.name: backend.stats() for backend in self.backends},
+        }
+
+
+def parse_backends(spec):
+    """Parse GENERATION_BACKENDS: comma-separated `openai:<model>`, `local:<model>@<base url>`
+    or `template` entries, in order of preference. Returns (kind, model, base_url) tuples
+    """
+    backends = []
+    for entry in (part.strip() for part in spec.split(",")):
+        if not entry:
+            continue
+        kind, _, rest = entry.partition(":")
+        model, _, base_url = rest.partition("@")
+        if kind == "template" and not rest:
+            backends.append(("template", None, None))
+        elif kind == "openai" and model and not base_url:
+            backends.append(("openai", model, None))
+        elif kind == "local" and model and base_url:
+            backends.append(("local", model, base_url))
+        else:
+            raise ValueError(f"Bad generation backend {entry!r}: expected openai:<model>, "
+                             f"local:<model>@<base url> or template")
+    if not backends:
+        raise ValueError("GENERATION_BACKENDS names no backends")
+    return backends
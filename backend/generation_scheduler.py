@@ -0,0 +1,299 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import random
+import sys
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Lower values are served first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# Tokens reported by the model calls a scheduled generation makes; None
+# outside a scheduled call
+_reported_tokens = contextvars.ContextVar("reported_tokens", default=None)
+
+
+def report_tokens(total):
+    """Record the tokens a model call actually used, so the scheduler can settle its TPM charge
+
+    Calls that don't count against the TPM limit (local servers) report 0.
+    Outside a scheduled generation this does nothing.
+    """
+    reported = _reported_tokens.get()
+    if reported is not None:
+        reported.append(total)
+
+
+def is_retryable(error):
+    """Rate limits, server errors, timeouts and dropped connections are worth retrying"""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    # Only look up the SDK's error types if it's loaded; if it isn't, it can't have raised
+    openai = sys.modules.get("openai")
+    return openai is not None and isinstance(error, (openai.APIConnectionError, openai.APITimeoutError))
+
+
+class TokenBucket:
+    """Continuously refilling token bucket: `rate` tokens per second, bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+
+    @classmethod
+    def per_minute(cls, limit, burst_seconds=10.0):
+        rate = limit / 60.0
+        return cls(rate, rate * burst_seconds)
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, amount=1.0):
+        """Take `amount` tokens if available; otherwise return seconds until they will be"""
+        amount = min(amount, self.capacity)
+        self._refill()
+        if self._tokens >= amount:
+            self._tokens -= amount
+            return 0.0
+        return (amount - self._tokens) / self.rate
+
+    async def acquire(self, amount=1.0):
+        while True:
+            wait = self.try_acquire(amount)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def refund(self, amount):
+        """Give back `amount` tokens, or take more if it's negative (this can leave a debt)"""
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class GenerationScheduler:
+    """Rate-limited, priority-ordered front door for model generation calls
+
+    Callers ask for a problem for a grade level and wait on a future. Demand
+    is coalesced per grade: a new call is queued only when the calls already
+    queued or running for that grade can't cover everyone waiting, so
+    requests that gave up (timed out) leave their calls for the next
+    requester instead of triggering new ones. Finished calls go to the
+    highest-priority waiter for the grade, and results nobody is waiting for
+    are handed to `on_orphan` (e.g. the problem pool).
+
+    Workers take a job, then a request token from the RPM bucket and an
+    estimated token charge from the TPM bucket before each call, and retry
+    429s, 5xxs and timeouts with full-jitter exponential backoff. Once a call
+    returns, the estimate is settled against the tokens its model calls
+    reported through `report_tokens`, so the TPM limit tracks real usage.
+    """
+
+    def __init__(self, generate, workers=4, rpm=500, tpm=200000, tokens_per_request=2500,
+                 max_retries=3, base_delay=0.5, max_delay=8.0, on_orphan=None):
+        # `generate` is an async callable(grade_level) that raises on failure;
+        # requests that name a problem type call generate(grade_level, problem_type)
+        self._generate = generate
+        self.workers = max(1, workers)
+        self.tokens_per_request = tokens_per_request
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._on_orphan = on_orphan
+        self._request_bucket = TokenBucket.per_minute(rpm)
+        self._token_bucket = TokenBucket.per_minute(tpm)
+
+        self._loop = None
+        self._tasks = []
+        self._reset()
+
+        self.requested = 0
+        self.coalesced = 0
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.orphans = 0
+
+    def _reset(self):
+        self._seq = itertools.count()
+        self._jobs = []            # heap of (priority, seq, grade_level, problem_type)
+        self._queued = Counter()   # (grade_level, priority) -> live queued jobs
+        self._stale = Counter()    # (grade_level, priority) -> promoted entries to skip
+        self._running = Counter()  # grade_level -> calls in flight
+        self._waiters = {}         # grade_level -> heap of (priority, seq, future)
+        self._has_jobs = None
+
+    def _ensure_running(self):
+        # Workers belong to the loop that first needs them; a new loop gets fresh ones
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._tasks:
+            return
+        self._loop = loop
+        self._reset()
+        self._has_jobs = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(), name=f"generation-{i}")
+                       for i in range(self.workers)]
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for waiters in self._waiters.values():
+            for _, _, future in waiters:
+                future.cancel()
+        self._loop = None
+        self._reset()
+
+    async def request(self, grade_level, priority=INTERACTIVE, timeout=None, problem_type=None):
+        """Wait for a generated problem; None on failure or after `timeout` seconds
+
+        `problem_type` is a preference for the call this request may start.
+        Demand is still coalesced per grade, so a request that is covered by
+        a call already queued or running gets whatever type that call makes.
+        """
+        self._ensure_running()
+        self.requested += 1
+
+        future = self._loop.create_future()
+        heapq.heappush(self._waiters.setdefault(grade_level, []), (priority, next(self._seq), future))
+        self._balance(grade_level, priority, problem_type)
+
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return None
+
+    async def reserve(self):
+        """Wait for rate-limit tokens for a call made outside the queue, e.g. a streamed generation"""
+        await self._acquire_rate()
+        self.calls += 1
+
+    def _live_waiters(self, grade_level):
+        return sum(1 for _, _, future in self._waiters.get(grade_level, ()) if not future.done())
+
+    def _supply(self, grade_level):
+        return (self._running[grade_level] + self._queued[(grade_level, INTERACTIVE)]
+                + self._queued[(grade_level, BACKGROUND)])
+
+    def _balance(self, grade_level, priority, problem_type=None):
+        if self._supply(grade_level) < self._live_waiters(grade_level):
+            self._push_job(grade_level, priority, problem_type)
+            return
+
+        # Demand is already covered by calls in progress or queued
+        self.coalesced += 1
+        if priority == INTERACTIVE and self._queued[(grade_level, BACKGROUND)]:
+            # ...but a queued refill would make this user wait behind other
+            # refills, so move it up the queue
+            self._queued[(grade_level, BACKGROUND)] -= 1
+            self._stale[(grade_level, BACKGROUND)] += 1
+            self._push_job(grade_level, INTERACTIVE, problem_type)
+
+    def _push_job(self, grade_level, priority, problem_type=None):
+        heapq.heappush(self._jobs, (priority, next(self._seq), grade_level, problem_type))
+        self._queued[(grade_level, priority)] += 1
+        self._has_jobs.set()
+
+    def _pop_job(self):
+        while self._jobs:
+            priority, _, grade_level, problem_type = heapq.heappop(self._jobs)
+            key = (grade_level, priority)
+            if self._stale[key]:
+                self._stale[key] -= 1
+                continue
+            self._queued[key] -= 1
+            return grade_level, problem_type
+        return None
+
+    def _deliver(self, grade_level, problem):
+        waiters = self._waiters.get(grade_level, [])
+        while waiters:
+            _, _, future = heapq.heappop(waiters)
+            if not future.done():
+                future.set_result(problem)
+                return
+        if problem is not None and self._on_orphan is not None:
+            self.orphans += 1
+            self._on_orphan(grade_level, problem)
+
+    async def _acquire_rate(self):
+        await self._request_bucket.acquire(1)
+        await self._token_bucket.acquire(self.tokens_per_request)
+
+    async def _worker(self):
+        while True:
+            job = self._pop_job()
+            while job is None:
+                self._has_jobs.clear()
+                await self._has_jobs.wait()
+                job = self._pop_job()
+
+            grade_level, problem_type = job
+            self._running[grade_level] += 1
+            try:
+                await self._acquire_rate()
+                problem = await self._call(grade_level, problem_type)
+            finally:
+                self._running[grade_level] -= 1
+            self._deliver(grade_level, problem)
+
+    async def _call(self, grade_level, problem_type=None):
+        args = (grade_level,) if problem_type is None else (grade_level, problem_type)
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                await asyncio.sleep(delay)
+                await self._acquire_rate()
+                self.retries += 1
+
+            self.calls += 1
+            reported = []
+            context_token = _reported_tokens.set(reported)
+            try:
+                return await self._generate(*args)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    logger.error(f"Generation for grade {grade_level} failed: {str(e)}")
+                    self.failures += 1
+                    return None
+                logger.warning(f"Generation for grade {grade_level} failed, retrying: {str(e)}")
+            finally:
+                _reported_tokens.reset(context_token)
+                # Without a report (the call failed, or gave no usage) the estimate stands
+                if reported:
+                    self._token_bucket.refund(self.tokens_per_request - sum(reported))
+        return None
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "queued": {
+                "interactive": sum(n for (_, p), n in self._queued.items() if p == INTERACTIVE),
+                "background": sum(n for (_, p), n in self._queued.items() if p == BACKGROUND),
+            },
+            "running": sum(self._running.values()),
+            "waiting": {grade: self._live_waiters(grade) for grade in self._waiters},
+            "requested": self.requested,
+            "coalesced": self.coalesced,
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "orphans": self.orphans,
+        }
@@ -0,0 +1,72 @@
+import json
+
+
+class StreamingFieldParser:
+    """Scan a JSON object as it streams in and report top-level string fields as they close
+
+    Only string values directly inside the outer object are reported; nested
+    objects and arrays are skipped over. Text before the object (e.g. a
+    ```json fence) is ignored. Full validation is still done on the complete
+    text once the stream ends.
+    """
+
+    def __init__(self):
+        self.fields = {}
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._expect_key = False
+        self._key = None
+
+    def feed(self, chunk):
+        """Add streamed text; returns [(key, value)] for string fields completed by it"""
+        self._buffer += chunk
+        buffer = self._buffer
+        completed = []
+
+        for i in range(self._pos, len(buffer)):
+            c = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._string_closed(buffer[self._string_start:i + 1], completed)
+            elif c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c == "{" or c == "[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._expect_key = c == "{"
+            elif c == "}" or c == "]":
+                self._depth -= 1
+            elif self._depth == 1:
+                if c == ":":
+                    self._expect_key = False
+                elif c == ",":
+                    self._expect_key = True
+                    self._key = None
+
+        self._pos = len(buffer)
+        return completed
+
+    def _string_closed(self, raw, completed):
+        try:
+            text = json.loads(raw)
+        except ValueError:
+            # Leave malformed strings to the final parse
+            self._key = None
+            return
+        if self._expect_key:
+            self._key = text
+        elif self._key is not None:
+            self.fields[self._key] = text
+            completed.append((self._key, text))
+            self._key = None
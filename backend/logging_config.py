@@ -0,0 +1,129 @@
+"""Queue-backed logging for the server
+
+Log calls on the request path only format the record and put it on a bounded
+in-memory queue; a QueueListener thread does the actual writing. If the queue
+is full the record is dropped and counted rather than blocking the caller.
+
+Settings (environment):
+    LOG_LEVEL        root level, default INFO (DEBUG when DEBUG=true)
+    LOG_LEVELS       per-module levels, e.g. "problem_generator=DEBUG,httpx=WARNING"
+    LOG_SAMPLE_RATE  fraction of INFO and DEBUG records kept, default 1.0;
+                     warnings and errors are always kept
+    LOG_FORMAT       "text" (default) or "json", one object per line
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+
+# Libraries that log every HTTP call at INFO
+DEFAULT_MODULE_LEVELS = {"httpx": "WARNING", "openai": "WARNING"}
+QUEUE_SIZE = 10000
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_listener = None
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of erroring"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Records without args or exception info (the f-string style used
+        # here) are safe to hand over as they are; skip the copy and format
+        if not record.args and not record.exc_info and not record.stack_info:
+            return record
+        return super().prepare(record)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a random `rate` share of records at or below `max_level`; keep everything above"""
+
+    def __init__(self, rate, max_level=logging.INFO):
+        super().__init__()
+        self.rate = rate
+        self.max_level = max_level
+
+    def filter(self, record):
+        return record.levelno > self.max_level or random.random() < self.rate
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def parse_module_levels(text):
+    """Parse "a=DEBUG,b.c=WARNING" into {"a": "DEBUG", "b.c": "WARNING"}"""
+    levels = {}
+    for item in filter(None, (part.strip() for part in (text or "").split(","))):
+        name, _, level = item.partition("=")
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(level=None, module_levels=None, sample_rate=None, fmt=None, stream=None):
+    """Route all logging through a queue to a background writer; safe to call again"""
+    global _listener
+    debug = os.getenv("DEBUG", "false").lower() == "true"
+    level = level or os.getenv("LOG_LEVEL", "DEBUG" if debug else "INFO")
+    if module_levels is None:
+        module_levels = {**DEFAULT_MODULE_LEVELS, **parse_module_levels(os.getenv("LOG_LEVELS"))}
+    if sample_rate is None:
+        sample_rate = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+    fmt = fmt or os.getenv("LOG_FORMAT", "text")
+
+    shutdown_logging()
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JSONFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+    handler = DroppingQueueHandler(queue.Queue(QUEUE_SIZE))
+    if sample_rate < 1.0:
+        handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    for name, module_level in module_levels.items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    return handler
+
+
+def shutdown_logging():
+    """Stop the writer thread after it has flushed everything queued"""
+    global _listener
+    listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+
+
+atexit.register(shutdown_logging)
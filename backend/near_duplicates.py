@@ -0,0 +1,195 @@
+"""Near-duplicate detection for generated question text (MinHash + LSH)
+
+Each question is lower-cased, split into words and turned into overlapping
+word 3-grams. A MinHash signature of `num_perm` 16-bit values summarises that
+set: the share of positions two signatures agree on estimates the Jaccard
+similarity of their 3-gram sets. Signatures are cut into `bands`; questions
+that agree on a whole band land in the same LSH bucket, so a lookup only
+compares against the handful of stored questions sharing a bucket, not all
+of them.
+
+Memory is fixed when the index is created. Signatures sit in a ring of
+`capacity` rows (the oldest is overwritten when full), and each band has a
+direct-mapped table of slot numbers, one per bucket, where a newer question
+replaces an older one. A lost bucket entry can only cause a missed match,
+never a false one, since candidates are always confirmed against their
+signature. With the defaults that is about 45 MB for 200,000 questions.
+
+The index saves to an .npz file holding only the filled signature rows; the
+bucket tables are rebuilt on load.
+"""
+import logging
+import os
+import re
+import tempfile
+import zlib
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Mersenne prime; keeps a * hash + b below 2**63 for 32-bit hashes
+_PRIME = np.uint64((1 << 31) - 1)
+_WORD = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)*")
+# Odd 64-bit constants for mixing a band's rows into one bucket number
+_ROW_MULTIPLIERS = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9,
+                             0xD6E8FEB86659FD93, 0xFF51AFD7ED558CCD, 0xC4CEB9FE1A85EC53,
+                             0x94D049BB133111EB, 0xBF58476D1CE4E5B9], dtype=np.uint64)
+_FORMAT_VERSION = 1
+
+
+def shingles(text, size=3):
+    """Word `size`-grams of the lower-cased text; short texts give one shingle of every word"""
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class NearDuplicateIndex:
+    def __init__(self, capacity=200000, num_perm=60, bands=20, threshold=0.5, shingle_size=3, seed=1):
+        if num_perm % bands or num_perm // bands > len(_ROW_MULTIPLIERS):
+            raise ValueError(f"num_perm ({num_perm}) must split into {bands} bands of at most "
+                             f"{len(_ROW_MULTIPLIERS)} rows")
+        self.capacity = max(1, capacity)
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.seed = seed
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, int(_PRIME), size=(num_perm, 1), dtype=np.uint64)
+        self._b = rng.integers(0, int(_PRIME), size=(num_perm, 1), dtype=np.uint64)
+        self._row_multipliers = _ROW_MULTIPLIERS[:self.rows]
+
+        # Enough buckets per band for every stored question
+        self._bucket_bits = max(4, (self.capacity - 1).bit_length())
+        self._band_index = np.arange(bands)
+        # np.zeros pages memory in lazily, so an unused index costs little
+        self._signatures = np.zeros((self.capacity, num_perm), dtype=np.uint16)
+        self._tables = np.zeros((bands, 1 << self._bucket_bits), dtype=np.uint32)  # slot + 1; 0 = empty
+        self._next = 0
+        self._count = 0
+        self.dirty = False
+
+        self.checked = 0
+        self.duplicates = 0
+
+    def __len__(self):
+        return self._count
+
+    def signature(self, text):
+        hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles(text, self.shingle_size)),
+                             dtype=np.uint64)
+        # One universal hash per permutation; keep the low 16 bits of each minimum
+        return ((self._a * hashes + self._b) % _PRIME).min(axis=1).astype(np.uint16)
+
+    def _buckets(self, signatures):
+        """Bucket number in each band, for one signature or a (n, num_perm) array of them"""
+        rows = signatures.reshape(-1, self.bands, self.rows).astype(np.uint64)
+        keys = (rows * self._row_multipliers).sum(axis=2, dtype=np.uint64)
+        # Fibonacci hashing: the top bits of a multiplicative hash
+        return ((keys * _ROW_MULTIPLIERS[0]) >> np.uint64(64 - self._bucket_bits)).astype(np.intp)
+
+    def query(self, text=None, signature=None):
+        """(similarity, slot) of the most similar stored question, or (0.0, None) if nothing shares a bucket"""
+        if signature is None:
+            signature = self.signature(text)
+        candidates = self._tables[self._band_index, self._buckets(signature)[0]]
+        candidates = np.unique(candidates[candidates > 0]) - 1
+        if not len(candidates):
+            return 0.0, None
+        similarities = (self._signatures[candidates] == signature).mean(axis=1)
+        best = int(similarities.argmax())
+        return float(similarities[best]), int(candidates[best])
+
+    def add(self, text=None, signature=None):
+        """Store a question; returns its slot"""
+        if signature is None:
+            signature = self.signature(text)
+        slot = self._next
+        self._signatures[slot] = signature
+        self._tables[self._band_index, self._buckets(signature)[0]] = slot + 1
+        self._next = (slot + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+        self.dirty = True
+        return slot
+
+    def check_and_add(self, text):
+        """Similarity to the closest stored question if it's a near-duplicate (not stored), else None (stored)"""
+        self.checked += 1
+        signature = self.signature(text)
+        similarity, _ = self.query(signature=signature)
+        if similarity >= self.threshold:
+            self.duplicates += 1
+            return similarity
+        self.add(signature=signature)
+        return None
+
+    def stats(self):
+        return {
+            "size": self._count,
+            "capacity": self.capacity,
+            "threshold": self.threshold,
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+            "memory_bytes": self._signatures.nbytes + self._tables.nbytes,
+        }
+
+    def _params(self):
+        return np.array([_FORMAT_VERSION, self.num_perm, self.bands, self.shingle_size, self.seed], dtype=np.int64)
+
+    def snapshot(self):
+        """Copy of the state to save, in storage order (oldest first); cheap enough for the event loop"""
+        if self._count < self.capacity:
+            signatures = self._signatures[:self._count].copy()
+        else:
+            signatures = np.concatenate([self._signatures[self._next:], self._signatures[:self._next]])
+        self.dirty = False
+        return {"params": self._params(), "signatures": signatures}
+
+    def save(self, path, snapshot=None):
+        save_snapshot(path, snapshot if snapshot is not None else self.snapshot())
+
+    def restore(self, path):
+        """Load signatures saved by `save`; False if there's no file or it was made with other settings"""
+        if not os.path.exists(path):
+            return False
+        with np.load(path) as data:
+            if not np.array_equal(data["params"], self._params()):
+                logger.warning(f"Ignoring near-duplicate index at {path}: saved with different settings")
+                return False
+            signatures = data["signatures"][-self.capacity:]
+        count = len(signatures)
+        self._signatures[:count] = signatures
+        self._tables[:] = 0
+        if count:
+            buckets = self._buckets(signatures)
+            slots = np.arange(1, count + 1, dtype=np.uint32)
+            for band in range(self.bands):
+                # Later rows win a shared bucket, as they would have when added one by one
+                self._tables[band, buckets[:, band]] = slots
+        self._count = count
+        self._next = count % self.capacity
+        self.dirty = False
+        return True
+
+
+def save_snapshot(path, snapshot):
+    """Write a snapshot atomically; safe to run in a worker thread
+
+    Each call writes its own temporary file, so several server workers saving
+    to the same path at once can't interleave; the last rename wins.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **snapshot)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
@@ -0,0 +1,247 @@
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from sqlalchemy import (Column, Float, Integer, MetaData, String, Table, Text, create_engine,
+                        event, func, select)
+from sqlalchemy.exc import IntegrityError
+
+from problem_store import create_tables
+
+# Fields kept from a generated problem; everything else is per-serving state
+PAYLOAD_FIELDS = ("question", "answer", "explanation", "theme", "problem_type", "num_steps")
+
+
+def bucket_key(grade_level, theme, problem_type, prompt_version):
+    """Stable hash naming the prompt variant a problem was generated from"""
+    raw = f"{grade_level}|{theme}|{problem_type}|{prompt_version}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def content_hash(question):
+    """Hash of the whitespace- and case-normalised question text"""
+    normalized = " ".join(question.lower().split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class ProblemCorpus:
+    """Persistent corpus of validated generated problems, sampled instead of regenerating
+
+    Problems live in a WAL-mode SQLite file, deduplicated by question hash.
+    Each row records the bucket key of the prompt variant that produced it, so
+    a retired variant's problems can be found later; serving doesn't use it.
+    Row IDs are indexed in memory by grade, by grade and problem type, and by
+    grade, problem type and step count, so `sample` is a random pick plus one
+    primary-key lookup. Other workers' adds only show up after `reload`. Each
+    session can see the same problem at most `reuse_limit` times; the newest
+    `max_sessions` sessions are tracked.
+
+    `add` and `reload` may run on a worker thread while the event loop picks;
+    a lock keeps the index consistent between them.
+    """
+
+    def __init__(self, path, reuse_limit=1, max_sessions=10000, sample_attempts=8):
+        self.path = str(path)
+        self.reuse_limit = max(1, reuse_limit)
+        self.max_sessions = max(1, max_sessions)
+        self.sample_attempts = max(1, sample_attempts)
+
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._engine = create_engine(
+            f"sqlite:///{self.path}",
+            connect_args={"check_same_thread": False, "timeout": 30},
+        )
+
+        @event.listens_for(self._engine, "connect")
+        def _configure_connection(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.close()
+
+        metadata = MetaData()
+        self._table = Table(
+            "corpus", metadata,
+            Column("id", Integer, primary_key=True),
+            Column("bucket_key", String(16), nullable=False),
+            Column("content_hash", String(64), nullable=False, unique=True),
+            Column("grade_level", String(16), nullable=False, index=True),
+            Column("theme", String(64)),
+            Column("problem_type", String(64)),
+            Column("prompt_version", String(16)),
+            Column("payload", Text, nullable=False),
+            Column("created_at", Float, nullable=False),
+        )
+        create_tables(metadata, self._engine)
+
+        self._ids_by_grade = {}
+        # (grade, problem_type) and (grade, problem_type, num_steps) -> row IDs
+        self._ids_by_type = {}
+        self._ids_by_target = {}
+        self._indexed = set()
+        # Row IDs only grow, so reload only reads rows past the last one it saw
+        self._reloaded_up_to = 0
+        self._index_lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self.served = 0
+        self.exhausted = 0
+        self.added = 0
+        self.duplicates = 0
+        self.reload()
+
+    def reload(self):
+        """Index rows added since the last reload, e.g. by other workers; returns how many"""
+        table = self._table
+        num_steps = func.json_extract(table.c.payload, "$.num_steps")
+        with self._engine.connect() as conn:
+            rows = conn.execute(
+                select(table.c.id, table.c.grade_level, table.c.problem_type, num_steps)
+                .where(table.c.id > self._reloaded_up_to).order_by(table.c.id)
+            ).all()
+        indexed = 0
+        with self._index_lock:
+            for row_id, grade_level, problem_type, steps in rows:
+                indexed += self._index(row_id, grade_level, problem_type, steps)
+            if rows:
+                self._reloaded_up_to = max(self._reloaded_up_to, rows[-1][0])
+        return indexed
+
+    def _index(self, row_id, grade_level, problem_type, num_steps):
+        # Called with the index lock held; our own adds are already indexed
+        if row_id in self._indexed:
+            return False
+        self._indexed.add(row_id)
+        self._ids_by_grade.setdefault(grade_level, []).append(row_id)
+        self._ids_by_type.setdefault((grade_level, problem_type), []).append(row_id)
+        self._ids_by_target.setdefault((grade_level, problem_type, num_steps or 1), []).append(row_id)
+        return True
+
+    def count(self, grade_level=None):
+        with self._index_lock:
+            if grade_level is None:
+                return len(self._indexed)
+            return len(self._ids_by_grade.get(grade_level, ()))
+
+    def add(self, problem, grade_level, prompt_version=None):
+        """Add a validated problem; returns False if the question is already stored"""
+        prompt_version = prompt_version or problem.get("prompt_version", "unknown")
+        theme = problem.get("theme", "general")
+        problem_type = problem.get("problem_type", "math")
+        payload = {field: problem[field] for field in PAYLOAD_FIELDS if field in problem}
+        try:
+            with self._engine.begin() as conn:
+                result = conn.execute(self._table.insert().values(
+                    bucket_key=bucket_key(grade_level, theme, problem_type, prompt_version),
+                    content_hash=content_hash(problem["question"]),
+                    grade_level=grade_level,
+                    theme=theme,
+                    problem_type=problem_type,
+                    prompt_version=prompt_version,
+                    payload=json.dumps(payload),
+                    created_at=time.time(),
+                ))
+        except IntegrityError:
+            self.duplicates += 1
+            return False
+
+        with self._index_lock:
+            self._index(result.inserted_primary_key[0], grade_level, problem_type, problem.get("num_steps", 1))
+            self.added += 1
+        return True
+
+    def iter_questions(self, batch_size=1000):
+        """Yield every stored question text, oldest first"""
+        table = self._table
+        last_id = 0
+        while True:
+            with self._engine.connect() as conn:
+                rows = conn.execute(
+                    select(table.c.id, table.c.payload).where(table.c.id > last_id)
+                    .order_by(table.c.id).limit(batch_size)
+                ).all()
+            if not rows:
+                return
+            for row_id, payload in rows:
+                yield json.loads(payload)["question"]
+            last_id = rows[-1][0]
+
+    def sample(self, grade_level, session_id=None, problem_type=None, num_steps=None):
+        """Return a random stored problem for the grade, or None if none is eligible"""
+        row_id = self.pick(grade_level, session_id, problem_type, num_steps)
+        return self.load(row_id) if row_id is not None else None
+
+    def pick(self, grade_level, session_id=None, problem_type=None, num_steps=None):
+        """Choose the row ID `sample` would load, from memory only; None if none is eligible
+
+        With a problem type, only problems of that type are eligible: those
+        with `num_steps` steps first, then any step count. The pick counts
+        towards the session's reuse limit. Async callers pick on the event
+        loop and `load` from a worker thread.
+        """
+        with self._index_lock:
+            if problem_type is None:
+                candidates = [self._ids_by_grade.get(grade_level)]
+            else:
+                candidates = [self._ids_by_type.get((grade_level, problem_type))]
+                if num_steps is not None:
+                    candidates.insert(0, self._ids_by_target.get((grade_level, problem_type, num_steps)))
+            candidates = [ids for ids in candidates if ids]
+            if not candidates:
+                return None
+
+            seen = self._session_counts(session_id)
+            for ids in candidates:
+                for _ in range(self.sample_attempts):
+                    row_id = random.choice(ids)
+                    if seen is None or seen.get(row_id, 0) < self.reuse_limit:
+                        if seen is not None:
+                            seen[row_id] = seen.get(row_id, 0) + 1
+                        return row_id
+            self.exhausted += 1
+            return None
+
+    def load(self, row_id):
+        """Read one stored problem by row ID; None if it's gone"""
+        with self._engine.connect() as conn:
+            payload = conn.execute(
+                select(self._table.c.payload).where(self._table.c.id == row_id)
+            ).scalar_one_or_none()
+        if payload is None:
+            return None
+        self.served += 1
+        problem = json.loads(payload)
+        problem["source"] = "corpus"
+        return problem
+
+    def _session_counts(self, session_id):
+        if session_id is None:
+            return None
+        seen = self._sessions.get(session_id)
+        if seen is None:
+            seen = self._sessions[session_id] = {}
+            if len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(session_id)
+        return seen
+
+    def stats(self):
+        with self._index_lock:
+            sizes = {grade: len(ids) for grade, ids in self._ids_by_grade.items()}
+        return {
+            "path": self.path,
+            "sizes": sizes,
+            "reuse_limit": self.reuse_limit,
+            "sessions": len(self._sessions),
+            "served": self.served,
+            "exhausted": self.exhausted,
+            "added": self.added,
+            "duplicates": self.duplicates,
+        }
+
+    def close(self):
+        self._engine.dispose()
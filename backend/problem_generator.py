@@ -1,226 +1,346 @@
-from openai import OpenAI
+import asyncio
 import os
 from dotenv import load_dotenv
 import json
 import logging
+import random
+import re
+import time
+
+from generation_scheduler import report_tokens
+from json_stream import StreamingFieldParser
+from metrics import counter, histogram
+from prompts import (DEFAULT_PROMPT_VERSION, GRADE_DESCRIPTIONS, PROBLEM_TYPES, SOLVER_SYSTEM, THEMES,
+                     get_prompt, render_messages)
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-def get_fallback_problem():
-    """Return a pre-generated problem when API is unavailable"""
-    problems = [
-        {
-            "question": "A store sells notebooks for $2.50 each. If you have $15, how many notebooks can you buy?",
-            "answer": 6,
-            "explanation": "1. Money available = $15\n2. Cost per notebook = $2.50\n3. Number of notebooks = $15 ÷ $2.50 = 6",
-            "theme": "shopping",
-            "problem_type": "division",
-            "num_steps": 3
-        },
-        {
-            "question": "If a train travels 120 miles in 2 hours, what is its average speed in miles per hour?",
-            "answer": 60,
-            "explanation": "1. Speed = Distance ÷ Time\n2. Distance = 120 miles\n3. Time = 2 hours\n4. Speed = 120 ÷ 2 = 60 mph",
-            "theme": "travel",
-            "problem_type": "ratios",
-            "num_steps": 4
-        },
-        {
-            "question": "A rectangle has a length of 8 inches and a width of 5 inches. What is its area in square inches?",
-            "answer": 40,
-            "explanation": "1. Area of rectangle = length × width\n2. Area = 8 × 5 = 40 square inches",
-            "theme": "geometry",
-            "problem_type": "area calculation",
-            "num_steps": 2
-        }
-    ]
-    import random
-    return random.choice(problems)
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "o3-mini")
+# Cheaper model that re-solves generated problems to double-check their answers
+VERIFY_MODEL = os.getenv("VERIFY_MODEL", "gpt-4o-mini")
+# Which registered prompt to send (see prompts.py); stored with each problem
+PROMPT_VERSION = get_prompt(os.getenv("PROMPT_VERSION", DEFAULT_PROMPT_VERSION)).version
+
+# Seconds allowed for one generation, including time spent waiting for a slot
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))
+# Upper bound on simultaneous completions from this process, per backend:
+# each OpenAI model, and each model on a local server, has its own limit
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+LOCAL_MODEL_MAX_CONCURRENCY = int(os.getenv("LOCAL_MODEL_MAX_CONCURRENCY", "8"))
+
+GENERATION_STAGE_SECONDS = histogram(
+    "generation_stage_seconds", "Time spent in each stage of problem generation", ["stage"])
+OPENAI_REQUEST_SECONDS = histogram(
+    "openai_request_seconds", "Latency of OpenAI chat completion calls", ["model"])
+OPENAI_REQUESTS = counter("openai_requests_total", "OpenAI chat completion calls", ["model", "outcome"])
+OPENAI_TOKENS = counter("openai_tokens_total", "Tokens reported by OpenAI responses", ["model", "kind"])
+FALLBACK_PROBLEMS = counter("fallback_problems_total", "Problems generated by the local fallback",
+                            ["grade_level"])
+
+# Shared clients so every call reuses the same HTTP connection pool. The
+# openai SDK (and httpx under it) takes about half a second to import, so it's
+# only imported when the first client is built rather than at server start
+_async_client = None
+_local_clients = {}
+_generation_slots = {}
+
+def get_async_client():
+    """Return the shared AsyncOpenAI client, or None without an API key"""
+    global _async_client
+    api_key = os.getenv('OPENAI_API_KEY')
+    if not api_key:
+        return None
+    if _async_client is None:
+        import httpx
+        from openai import AsyncOpenAI
+        http_client = httpx.AsyncClient(
+            timeout=OPENAI_TIMEOUT,
+            # The per-model slots bound concurrency; a pool cap here would
+            # make hedges to a second model queue behind the first
+            limits=httpx.Limits(
+                max_connections=None,
+                max_keepalive_connections=OPENAI_MAX_CONCURRENCY,
+            ),
+        )
+        # Retries are left to the generation scheduler, which backs off with jitter
+        _async_client = AsyncOpenAI(api_key=api_key, timeout=OPENAI_TIMEOUT, max_retries=0,
+                                    http_client=http_client)
+    return _async_client
+
+def get_local_client(base_url):
+    """Return a shared AsyncOpenAI client for an OpenAI-compatible server at `base_url`
+
+    For local model servers (vLLM, llama.cpp, Ollama); LOCAL_MODEL_API_KEY is
+    sent if the server wants one.
+    """
+    client = _local_clients.get(base_url)
+    if client is None:
+        from openai import AsyncOpenAI
+        client = _local_clients[base_url] = AsyncOpenAI(
+            api_key=os.getenv("LOCAL_MODEL_API_KEY", "local"), base_url=base_url,
+            timeout=OPENAI_TIMEOUT, max_retries=0)
+    return client
+
+async def close_async_client():
+    """Close the shared async clients and their connection pools"""
+    global _async_client
+    clients = [_async_client, *_local_clients.values()]
+    _async_client = None
+    _local_clients.clear()
+    _generation_slots.clear()
+    for client in clients:
+        if client is not None:
+            await client.close()
+
+def _get_generation_slots(model, base_url=None):
+    """The concurrency limiter for one backend, so a saturated one doesn't hold up hedges to another"""
+    key = (base_url, model)
+    slots = _generation_slots.get(key)
+    if slots is None:
+        limit = LOCAL_MODEL_MAX_CONCURRENCY if base_url else OPENAI_MAX_CONCURRENCY
+        slots = _generation_slots[key] = asyncio.Semaphore(limit)
+    return slots
+
+def get_fallback_problem(grade_level="5-8", problem_type=None):
+    """Return a locally generated problem when the API is unavailable"""
+    from template_engine import generate_template_problem
+    FALLBACK_PROBLEMS.inc(grade_level)
+    problem = generate_template_problem(grade_level, problem_type)
+    problem["source"] = "fallback"
+    return problem
 
 def sanitize_json_string(s):
     """Clean up the string to make it valid JSON"""
     # Remove markdown code block indicators
     s = s.replace('```json', '').replace('```', '')
-    
+
     # Remove any control characters
-    import re
     s = re.sub(r'[\x00-\x1F\x7F-\x9F]', '', s)
-    
-    # Ensure proper quote usage
-    s = s.replace('"', '"').replace('"', '"')
-    
+
     # Remove any leading/trailing whitespace
-    s = s.strip()
-    
-    print("Sanitized content:", s)  # Debug print
-    return s
+    return s.strip()
+
+def record_usage(model, usage):
+    """Count the tokens a response reports, including prompt tokens served from cache"""
+    if usage is None:
+        return
+    # Older clients leave fields they don't model (like stream usage) as plain dicts
+    if not isinstance(usage, dict):
+        usage = usage.model_dump()
+    OPENAI_TOKENS.inc(model, "prompt", amount=usage.get("prompt_tokens") or 0)
+    OPENAI_TOKENS.inc(model, "completion", amount=usage.get("completion_tokens") or 0)
+    cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+    if cached:
+        OPENAI_TOKENS.inc(model, "cached_prompt", amount=cached)
+
+async def _create_completion(client, timeout, base_url=None, **kwargs):
+    """One chat completion under its backend's concurrency slot, with latency, outcome and usage recorded"""
+    model = kwargs["model"]
+    started = time.perf_counter()
+
+    async def request():
+        async with _get_generation_slots(model, base_url):
+            GENERATION_STAGE_SECONDS.observe("slot_wait", value=time.perf_counter() - started)
+            with OPENAI_REQUEST_SECONDS.time(model):
+                return await client.chat.completions.create(**kwargs)
 
-def generate_word_problem(grade_level="5-8"):
-    """Generate a math word problem using OpenAI"""
-    api_key = os.getenv('OPENAI_API_KEY')
-    if not api_key:
-        logger.error("OpenAI API key not found")
-        return get_fallback_problem()
+    try:
+        response = await asyncio.wait_for(request(), timeout=timeout)
+    except asyncio.TimeoutError:
+        OPENAI_REQUESTS.inc(model, "timeout")
+        raise
+    except Exception:
+        OPENAI_REQUESTS.inc(model, "error")
+        raise
+    OPENAI_REQUESTS.inc(model, "ok")
+    if not kwargs.get("stream"):
+        record_usage(model, response.usage)
+        # Only OpenAI calls count against the scheduler's TPM limit
+        if client is not _async_client:
+            report_tokens(0)
+        elif response.usage is not None:
+            report_tokens(response.usage.total_tokens)
+    return response
+
+def build_prompt(grade_level="5-8", prompt_version=None, problem_type=None):
+    """Pick a theme (and a problem type unless given) and return the chat messages for them"""
+    selected_theme = random.choice(THEMES)
+    selected_type = problem_type if problem_type in PROBLEM_TYPES else random.choice(PROBLEM_TYPES)
+    if grade_level not in GRADE_DESCRIPTIONS:
+        grade_level = "5-8"
+
+    cached = render_messages(prompt_version or PROMPT_VERSION, grade_level, selected_theme, selected_type)
+    messages = [dict(message) for message in cached]
+    return messages, selected_theme, selected_type
+
+def parse_problem_response(content, theme, problem_type):
+    """Validate a raw model response; returns the problem dict or None if unusable"""
+    logger.debug(f"Raw response: {content}")
 
     try:
-        client = OpenAI(api_key=api_key)
-
-        # Add variety with random themes and problem types
-        import random
-
-        themes = [
-            "sports and games",
-            "cooking and recipes",
-            "space and astronomy",
-            "animals and nature",
-            "technology and gaming",
-            "art and music",
-            "travel and adventure"
-        ]
-
-        problem_types = [
-            "algebra with unknowns",
-            "ratios and proportions",
-            "geometry and spatial reasoning",
-            "number theory and patterns",
-            "logic puzzles with constraints",
-            "combinatorics and counting"
-        ]
-
-        selected_theme = random.choice(themes)
-        selected_type = random.choice(problem_types)
-
-        # Build a more structured prompt with grade-appropriate settings
-        grade_descriptions = {
-            "1-2": {
-                "description": "1st-2nd grade students",
-                "steps": "1-2 steps",
-                "complexity": "simple addition, subtraction, and basic counting",
-                "max_number": "Keep numbers under 100"
-            },
-            "3-5": {
-                "description": "3rd-5th grade students",
-                "steps": "2-3 steps",
-                "complexity": "multiplication, division, fractions, and basic decimals",
-                "max_number": "Keep numbers under 1000"
-            },
-            "5-8": {
-                "description": "5th-8th grade students",
-                "steps": "3-5 steps",
-                "complexity": "algebra, ratios, percentages, and multi-step reasoning",
-                "max_number": "Numbers can be larger but keep them reasonable"
-            }
-        }
-
-        grade_info = grade_descriptions.get(grade_level, grade_descriptions["5-8"])
-
-        system_message = f"""You are an expert math educator creating engaging problems for talented {grade_info['description']}.
-Your problems should be challenging but solvable, creative but grounded in real-world contexts."""
-
-        prompt = f"""Create a math word problem with these specifications:
-
-CONTEXT & ENGAGEMENT:
-- Theme: {selected_theme}
-- Problem type: {selected_type}
-- Make it story-driven with a clear scenario
-- Use specific numbers and concrete details
-- Avoid generic situations - be creative and fun!
-
-MATHEMATICAL REQUIREMENTS:
-- Suitable for {grade_info['description']}
-- Focus on: {grade_info['complexity']}
-- {grade_info['max_number']}
-- Answer must be a single numeric value (integer or decimal)
-- Problem should require {grade_info['steps']} to solve
-- Avoid problems requiring outside knowledge (no obscure facts)
-
-VERIFICATION (CRITICAL):
-After generating the problem:
-1. Solve it yourself step-by-step
-2. Verify your arithmetic is correct
-3. Check that the answer matches the question asked
-4. If anything doesn't work, revise the problem
-
-Return ONLY valid JSON in this exact format:
-{{
-    "question": "A clear, engaging word problem with specific numbers and context",
-    "answer": numeric_value_only,
-    "explanation": "Step-by-step solution showing all work clearly"
-}}
-
-GOOD EXAMPLES:
-
-{{
-    "question": "Maya is training for a marathon. On Monday she runs 3 miles. Each day after that, she runs 1.5 times as far as the previous day. How many total miles will she have run after 4 days of training?",
-    "answer": 24.375,
-    "explanation": "Day 1: 3 miles\\nDay 2: 3 × 1.5 = 4.5 miles\\nDay 3: 4.5 × 1.5 = 6.75 miles\\nDay 4: 6.75 × 1.5 = 10.125 miles\\nTotal: 3 + 4.5 + 6.75 + 10.125 = 24.375 miles"
-}}
-
-{{
-    "question": "A baker makes cookies that weigh 25 grams each. She packs them in boxes of 12. If a customer orders 7 boxes, what is the total weight in kilograms?",
-    "answer": 2.1,
-    "explanation": "1. Cookies per order: 12 × 7 = 84 cookies\\n2. Total weight in grams: 84 × 25 = 2,100 grams\\n3. Convert to kilograms: 2,100 ÷ 1,000 = 2.1 kg"
-}}
-
-{{
-    "question": "In a witch's garden there are 30 animals: dogs, cats and mice. The witch changes 6 dogs into cats and then 5 cats into mice. Now there is an equal number of dogs, cats and mice. How many cats were there to start with?",
-    "answer": 8,
-    "explanation": "1. Let d, c, m be the initial counts\\n2. Initial: d + c + m = 30\\n3. After transformations: d-6 dogs, c+6-5=c+1 cats, m+5 mice\\n4. Equal numbers means: d-6 = c+1 = m+5\\n5. From d-6 = c+1: d = c+7\\n6. From c+1 = m+5: m = c-4\\n7. Substitute into total: (c+7) + c + (c-4) = 30\\n8. Solve: 3c + 3 = 30, so c = 9... Wait, let me recalculate.\\n9. Actually: d-6 = c+1 gives d = c+7. And c+1 = m+5 gives m = c-4\\n10. But (c+7) + c + (c-4) = 30 gives 3c + 3 = 30, c = 9. Let me verify: d=16, c=9, m=5. After changes: 10 dogs, 10 cats, 10 mice. But 16+9+5=30. So this works but let me recalculate from the original problem constraint.\\n11. Correct approach: After changes we have equal numbers (each is 10). So d-6=10, c+1=10, m+5=10. This gives d=16, c=9, m=5. Check: 16+9+5=30. But wait, cats: c+6-5 = c+1 = 10, so c=9. Actually this problem has an error in my example. Let me use the simpler algebraic solution: d-6 = c-5+6 = m+5; with d+c+m=30 and final count is 10 each. Working backward: d=16, c=9, m=5 doesn't give c=8. Let me just use c=8 as in original.\\n12. Using the constraint that final = 10 each: d-6=10 → d=16; For cats: start with c, lose 5, gain 6, end with 10: c+1=10 → c=9. Hmm, this gives 9 not 8.\\n13. Let me recalculate the original correctly: If we end with equal numbers n each: d-6=n, c+6-5=n, m+5=n. So d=n+6, c=n-1, m=n-5. Total: (n+6)+(n-1)+(n-5)=30 → 3n=30 → n=10. So c=9 not 8. There's an error in the original example."
-}}
-
-Wait, I see an issue with that last example. Let me provide a corrected version:
-
-{{
-    "question": "A video game costs $45. During a sale, the price is reduced by 20%, and then a coupon gives an additional $5 off. If you buy 3 copies at this discounted price, how much do you spend in total?",
-    "answer": 93,
-    "explanation": "1. Original price: $45\\n2. After 20% reduction: $45 × 0.80 = $36\\n3. After $5 coupon: $36 - $5 = $31 per game\\n4. Cost for 3 games: $31 × 3 = $93"
-}}
-
-Now generate a new problem following these guidelines."""
-
-        response = client.chat.completions.create(
-            model="o3-mini",
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": prompt}
-            ],
+        result = json.loads(content)
+    except json.JSONDecodeError:
+        # Models sometimes wrap the object in a code fence
+        result = json.loads(sanitize_json_string(content))
+
+    # Validate the response
+    if not all(key in result for key in ["question", "answer", "explanation"]):
+        logger.warning("Missing required fields in response")
+        return None
+
+    if not isinstance(result["question"], str) or not result["question"].strip():
+        logger.warning("Question is missing or not text")
+        return None
+
+    # Validate answer is numeric
+    if not isinstance(result["answer"], (int, float)):
+        logger.warning(f"Answer is not numeric: {result['answer']}")
+        return None
+
+    # Add metadata about the problem
+    result["theme"] = theme
+    result["problem_type"] = problem_type
+    result["source"] = "openai"
+    result["prompt_version"] = PROMPT_VERSION
+
+    # Calculate number of steps from explanation
+    explanation = result.get("explanation", "")
+    # Count numbered steps (e.g., "1.", "2.", etc.)
+    step_matches = re.findall(r'^\s*(\d+)\.', explanation, re.MULTILINE)
+    num_steps = len(step_matches) if step_matches else 1
+    result["num_steps"] = num_steps
+
+    return result
+
+async def request_word_problem(grade_level="5-8", problem_type=None, model=None, base_url=None):
+    """Make one async generation request without any fallback
+
+    Raises on API errors and timeouts so callers can decide whether to retry;
+    returns None if the model's response fails validation. `model` defaults to
+    OPENAI_MODEL; with `base_url` the request goes to that OpenAI-compatible
+    server instead of OpenAI.
+    """
+    model = model or OPENAI_MODEL
+    client = get_local_client(base_url) if base_url else get_async_client()
+    if client is None:
+        raise RuntimeError("OpenAI API key not found")
+
+    with GENERATION_STAGE_SECONDS.time("build_prompt"):
+        messages, theme, problem_type = build_prompt(grade_level, problem_type=problem_type)
+
+    with GENERATION_STAGE_SECONDS.time("api_call"):
+        response = await _create_completion(
+            client,
+            OPENAI_TIMEOUT,
+            base_url=base_url,
+            model=model,
+            messages=messages,
             response_format={"type": "json_object"}
         )
 
-        print(f"Used model: {response.model}")
-
-        content = response.choices[0].message.content
-        print("Raw response:", content)
-
-        result = json.loads(content)
-
-        # Validate the response
-        if not all(key in result for key in ["question", "answer", "explanation"]):
-            print("Missing required fields in response")
-            return get_fallback_problem()
-
-        # Validate answer is numeric
-        if not isinstance(result["answer"], (int, float)):
-            print(f"Answer is not numeric: {result['answer']}")
-            return get_fallback_problem()
-
-        # Add metadata about the problem
-        result["theme"] = selected_theme
-        result["problem_type"] = selected_type
-
-        # Calculate number of steps from explanation
-        explanation = result.get("explanation", "")
-        # Count numbered steps (e.g., "1.", "2.", etc.)
-        import re
-        step_matches = re.findall(r'^\s*(\d+)\.', explanation, re.MULTILINE)
-        num_steps = len(step_matches) if step_matches else 1
-        result["num_steps"] = num_steps
-
-        return result
-
-    except Exception as e:
-        logger.error(f"Error generating problem: {str(e)}")
-        return get_fallback_problem() 
-    
+    logger.debug(f"Used model: {response.model}")
+
+    with GENERATION_STAGE_SECONDS.time("parse"):
+        return parse_problem_response(response.choices[0].message.content, theme, problem_type)
+
+async def stream_word_problem(grade_level="5-8", problem_type=None):
+    """Stream one generation without any fallback
+
+    Yields ("question", text) as soon as the model has finished writing the
+    question, then ("problem", result) once the whole response has arrived,
+    where result is the validated problem dict or None. Raises on API errors
+    and timeouts, like request_word_problem.
+    """
+    client = get_async_client()
+    if client is None:
+        raise RuntimeError("OpenAI API key not found")
+
+    with GENERATION_STAGE_SECONDS.time("build_prompt"):
+        messages, theme, problem_type = build_prompt(grade_level, problem_type=problem_type)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    deadline = started + OPENAI_TIMEOUT
+    parser = StreamingFieldParser()
+    parts = []
+
+    async with _get_generation_slots(OPENAI_MODEL):
+        GENERATION_STAGE_SECONDS.observe("slot_wait", value=loop.time() - started)
+        requested = loop.time()
+        # Left as None if the consumer abandons the stream, like a cancelled call
+        outcome = None
+        try:
+            stream = await asyncio.wait_for(
+                client.chat.completions.create(
+                    model=OPENAI_MODEL,
+                    messages=messages,
+                    response_format={"type": "json_object"},
+                    stream=True,
+                    # Passed through the body so older clients don't reject the option
+                    extra_body={"stream_options": {"include_usage": True}}
+                ),
+                timeout=deadline - loop.time()
+            )
+            try:
+                chunks = stream.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout=deadline - loop.time())
+                    except StopAsyncIteration:
+                        break
+                    # With include_usage the last chunk carries usage and no choices
+                    record_usage(OPENAI_MODEL, getattr(chunk, "usage", None))
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if not delta:
+                        continue
+                    parts.append(delta)
+                    for key, value in parser.feed(delta):
+                        if key == "question":
+                            GENERATION_STAGE_SECONDS.observe("stream_question", value=loop.time() - started)
+                            yield "question", value
+            finally:
+                await stream.close()
+            outcome = "ok"
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            if outcome is not None:
+                OPENAI_REQUESTS.inc(OPENAI_MODEL, outcome)
+            OPENAI_REQUEST_SECONDS.observe(OPENAI_MODEL, value=loop.time() - requested)
+
+    with GENERATION_STAGE_SECONDS.time("parse"):
+        result = parse_problem_response("".join(parts), theme, problem_type)
+    yield "problem", result
+
+async def solve_problem(question):
+    """Ask VERIFY_MODEL for the answer to a question; None if it gives no number
+
+    Raises on API errors and timeouts.
+    """
+    client = get_async_client()
+    if client is None:
+        raise RuntimeError("OpenAI API key not found")
+
+    response = await _create_completion(
+        client,
+        OPENAI_TIMEOUT,
+        model=VERIFY_MODEL,
+        messages=[
+            {"role": "system", "content": SOLVER_SYSTEM},
+            {"role": "user", "content": question}
+        ],
+        response_format={"type": "json_object"}
+    )
+    content = response.choices[0].message.content
+    try:
+        answer = json.loads(sanitize_json_string(content)).get("answer")
+    except (ValueError, AttributeError):
+        return None
+    if isinstance(answer, bool) or not isinstance(answer, (int, float, str)):
+        return None
+    return answer
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+GRADE_LEVELS = ("1-2", "3-5", "5-8")
+
+# Returned by `generate` for a problem that was made fine but shouldn't be
+# pooled (a near-duplicate, an unconfirmed answer): not a failure, no backoff
+DISCARDED = object()
+
+
+def _mismatch(problem, problem_type, num_steps):
+    """Sort key: problems of another type rank after every problem of the wanted type"""
+    type_miss = problem_type is not None and problem.get("problem_type") != problem_type
+    step_miss = abs(problem.get("num_steps", 1) - num_steps) if num_steps is not None else 0
+    return type_miss, step_miss
+
+
+class ProblemPool:
+    """Bounded per-grade queues of pre-generated problems, topped up in the background
+
+    Requests take from the pool without waiting on the model. Once a grade drops
+    below `low_water`, background workers refill it up to `depth`, with at most
+    `refill_concurrency` generations running at a time across all grades.
+    """
+
+    def __init__(self, generate, grade_levels=GRADE_LEVELS, depth=10, low_water=5,
+                 refill_concurrency=2, retry_delay=5.0):
+        # `generate` is an async callable(grade_level) -> problem dict, None on
+        # failure, or DISCARDED
+        self._generate = generate
+        self.depth = max(1, depth)
+        self.low_water = max(0, min(low_water, self.depth))
+        self.refill_concurrency = max(1, refill_concurrency)
+        self.retry_delay = retry_delay
+
+        self._queues = {grade: deque(maxlen=self.depth) for grade in grade_levels}
+        self._inflight = {grade: 0 for grade in grade_levels}
+        self._refilling = set()
+        self._wakeup = None
+        self._workers = []
+
+        self.hits = 0
+        self.misses = 0
+        self.matched = 0
+        self.generated = 0
+        self.discarded = 0
+        self.failures = 0
+
+    @property
+    def running(self):
+        return bool(self._workers)
+
+    def take(self, grade_level, problem_type=None, num_steps=None):
+        """Pop a ready problem for the grade, or return None if the pool is empty
+
+        With a problem type or step count, the closest match in the grade's
+        queue is taken (type first, then steps); otherwise the oldest.
+        """
+        queue = self._queues.get(grade_level)
+        if not queue:
+            self.misses += 1
+            self._wake()
+            return None
+
+        self.hits += 1
+        if problem_type is None and num_steps is None:
+            problem = queue.popleft()
+        else:
+            index, problem = min(enumerate(queue), key=lambda item: _mismatch(item[1], problem_type, num_steps))
+            del queue[index]
+            if problem_type is None or problem.get("problem_type") == problem_type:
+                self.matched += 1
+        if len(queue) < self.low_water:
+            self._wake()
+        return problem
+
+    def put(self, grade_level, problem):
+        """Add a problem to the grade's queue; returns False if the queue is full"""
+        queue = self._queues.get(grade_level)
+        if queue is None or len(queue) >= self.depth:
+            return False
+        queue.append(problem)
+        return True
+
+    def size(self, grade_level):
+        queue = self._queues.get(grade_level)
+        return len(queue) if queue is not None else 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "running": self.running,
+            "depth": self.depth,
+            "low_water": self.low_water,
+            "refill_concurrency": self.refill_concurrency,
+            "sizes": {grade: len(queue) for grade, queue in self._queues.items()},
+            "inflight": dict(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "matched": self.matched,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "generated": self.generated,
+            "discarded": self.discarded,
+            "failures": self.failures,
+        }
+
+    async def start(self):
+        if self._workers:
+            return
+        self._wakeup = asyncio.Event()
+        self._workers = [
+            asyncio.create_task(self._refill_worker(), name=f"problem-pool-{i}")
+            for i in range(self.refill_concurrency)
+        ]
+        logger.info(f"Problem pool started (depth={self.depth}, low_water={self.low_water}, "
+                    f"workers={self.refill_concurrency})")
+
+    async def stop(self):
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._wakeup = None
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _next_grade(self):
+        """Pick the emptiest grade that is being refilled, or None if all are topped up"""
+        chosen, chosen_level = None, None
+        for grade, queue in self._queues.items():
+            level = len(queue) + self._inflight[grade]
+            if level < self.low_water:
+                self._refilling.add(grade)
+            elif level >= self.depth:
+                self._refilling.discard(grade)
+            if grade in self._refilling and (chosen is None or level < chosen_level):
+                chosen, chosen_level = grade, level
+        return chosen
+
+    async def _refill_worker(self):
+        while True:
+            grade = self._next_grade()
+            if grade is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            self._inflight[grade] += 1
+            try:
+                problem = await self._generate(grade)
+            except Exception as e:
+                logger.error(f"Pool refill for grade {grade} failed: {str(e)}")
+                problem = None
+            finally:
+                self._inflight[grade] -= 1
+
+            if problem is DISCARDED:
+                self.discarded += 1
+                continue
+            # Canned fallbacks mean the generator is unavailable; don't hoard them
+            if problem is None or problem.get("source") == "fallback":
+                self.failures += 1
+                await asyncio.sleep(self.retry_delay)
+                continue
+
+            self.generated += 1
+            self.put(grade, problem)
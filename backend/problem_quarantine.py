@@ -0,0 +1,83 @@
+import json
+import time
+from pathlib import Path
+
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, Text, create_engine, event, func, select
+
+from problem_store import create_tables
+
+
+class ProblemQuarantine:
+    """Generated problems whose answers failed verification, kept for review
+
+    Rows live in a WAL-mode SQLite file and are never served. Only the newest
+    `max_rows` are kept.
+    """
+
+    def __init__(self, path, max_rows=5000):
+        self.path = str(path)
+        self.max_rows = max(1, max_rows)
+
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._engine = create_engine(
+            f"sqlite:///{self.path}",
+            connect_args={"check_same_thread": False, "timeout": 30},
+        )
+
+        @event.listens_for(self._engine, "connect")
+        def _configure_connection(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.close()
+
+        metadata = MetaData()
+        self._table = Table(
+            "quarantine", metadata,
+            Column("id", Integer, primary_key=True),
+            Column("grade_level", String(16), nullable=False),
+            Column("prompt_version", String(16)),
+            Column("reason", Text, nullable=False),
+            Column("payload", Text, nullable=False),
+            Column("created_at", Float, nullable=False),
+        )
+        create_tables(metadata, self._engine)
+        self.added = 0
+
+    def add(self, grade_level, problem, reason):
+        table = self._table
+        with self._engine.begin() as conn:
+            result = conn.execute(table.insert().values(
+                grade_level=grade_level,
+                prompt_version=problem.get("prompt_version"),
+                reason=reason,
+                payload=json.dumps(problem),
+                created_at=time.time(),
+            ))
+            row_id = result.inserted_primary_key[0]
+            if row_id > self.max_rows:
+                conn.execute(table.delete().where(table.c.id <= row_id - self.max_rows))
+        self.added += 1
+
+    def count(self):
+        with self._engine.connect() as conn:
+            return conn.execute(select(func.count()).select_from(self._table)).scalar_one()
+
+    def recent(self, limit=20):
+        """Newest quarantined problems first"""
+        table = self._table
+        query = (select(table.c.grade_level, table.c.reason, table.c.payload, table.c.created_at)
+                 .order_by(table.c.id.desc()).limit(limit))
+        with self._engine.connect() as conn:
+            rows = conn.execute(query).all()
+        return [
+            {"grade_level": grade_level, "reason": reason, "problem": json.loads(payload),
+             "created_at": created_at}
+            for grade_level, reason, payload, created_at in rows
+        ]
+
+    def stats(self):
+        return {"path": self.path, "size": self.count(), "added": self.added}
+
+    def close(self):
+        self._engine.dispose()
@@ -0,0 +1,412 @@
+import abc
+import json
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from sqlalchemy import (BigInteger, Column, Float, Integer, MetaData, String, Table, Text,
+                        create_engine, event, func, select)
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+# IDs stay below 2**53 so they survive a round trip through JavaScript numbers
+MAX_PROBLEM_ID = 2 ** 53 - 1
+
+
+class ProblemRecord:
+    """Everything check_answer needs to know about one served problem"""
+
+    __slots__ = ("problem_id", "answer", "explanation", "grade_level", "theme",
+                 "problem_type", "num_steps", "source", "created_at", "touched_at")
+
+    def __init__(self, problem_id, answer, explanation, grade_level=None, theme=None,
+                 problem_type=None, num_steps=1, source=None, created_at=None):
+        self.problem_id = problem_id
+        self.answer = answer
+        self.explanation = explanation
+        self.grade_level = grade_level
+        self.theme = theme
+        self.problem_type = problem_type
+        self.num_steps = num_steps
+        self.source = source
+        self.created_at = created_at if created_at is not None else time.time()
+        self.touched_at = self.created_at
+
+    @classmethod
+    def from_problem(cls, problem_id, problem, grade_level=None):
+        return cls(
+            problem_id,
+            problem["answer"],
+            problem.get("explanation", "No explanation available"),
+            grade_level=grade_level,
+            theme=problem.get("theme", "general"),
+            problem_type=problem.get("problem_type", "math"),
+            num_steps=problem.get("num_steps", 1),
+            source=problem.get("source"),
+        )
+
+
+def new_problem_id():
+    """Random non-zero ID; 53 random bits make clashes between workers negligible"""
+    return secrets.randbelow(MAX_PROBLEM_ID) + 1
+
+
+def create_tables(metadata, engine, attempts=10, retry_delay=0.05):
+    """Create any missing tables, tolerating other workers doing the same
+
+    Every worker creates the schema when it starts. On a fresh file they race:
+    one gets "table already exists" after its existence check, or "database
+    is locked" while another switches the file to WAL. Checking again after a
+    short wait finds the tables the winner made.
+    """
+    for attempt in range(attempts):
+        try:
+            metadata.create_all(engine)
+            return
+        except OperationalError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(retry_delay)
+
+
+class ProblemStore(abc.ABC):
+    """Interface shared by the problem store backends
+
+    Every backend is bounded by `max_size` and expires records that have not
+    been looked up for `ttl` seconds. Lookups for unknown, evicted and expired
+    IDs all return None; callers cannot (and should not) tell them apart.
+    """
+
+    # Whether calls touch the disk, so async callers should make them from a worker thread
+    blocking = False
+
+    @abc.abstractmethod
+    def __len__(self):
+        """Number of records currently held"""
+
+    def size_estimate(self):
+        """Record count that is cheap enough to read on the event loop, e.g. for metrics"""
+        return len(self)
+
+    @abc.abstractmethod
+    def add(self, problem, grade_level=None):
+        """Store a generated problem and return its new problem ID"""
+
+    def add_many(self, problems, grade_level=None):
+        """Store several problems at once and return their IDs in order"""
+        return [self.add(problem, grade_level) for problem in problems]
+
+    @abc.abstractmethod
+    def get(self, problem_id):
+        """Return the ProblemRecord for an ID, or None if unknown, evicted or expired"""
+
+    @abc.abstractmethod
+    def prune(self):
+        """Drop expired records and return how many were dropped"""
+
+    @abc.abstractmethod
+    def clear(self):
+        """Drop every record"""
+
+    @abc.abstractmethod
+    def stats(self):
+        """Size, hit and eviction counters for /api/store/stats"""
+
+    def close(self):
+        pass
+
+
+class MemoryProblemStore(ProblemStore):
+    """Bounded in-memory store of served problems with LRU and idle-TTL eviction
+
+    Records are kept in least-recently-used order. Adding beyond `max_size`
+    drops the least recently used record, and a record that has not been
+    looked up for `ttl` seconds expires. State is private to the process, so
+    use SQLiteProblemStore when running more than one worker.
+    """
+
+    def __init__(self, max_size=10000, ttl=7200.0, clock=time.time):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._clock = clock
+        self._records = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.expired = 0
+
+    def __len__(self):
+        return len(self._records)
+
+    def add(self, problem, grade_level=None):
+        self.prune()
+
+        problem_id = new_problem_id()
+        while problem_id in self._records:
+            problem_id = new_problem_id()
+
+        record = ProblemRecord.from_problem(problem_id, problem, grade_level)
+        record.created_at = record.touched_at = self._clock()
+        self._records[problem_id] = record
+
+        while len(self._records) > self.max_size:
+            self._records.popitem(last=False)
+            self.evicted += 1
+        return problem_id
+
+    def get(self, problem_id):
+        record = self._records.get(problem_id)
+        if record is None:
+            self.misses += 1
+            return None
+
+        now = self._clock()
+        if self.ttl and now - record.touched_at > self.ttl:
+            del self._records[problem_id]
+            self.expired += 1
+            self.misses += 1
+            return None
+
+        record.touched_at = now
+        self._records.move_to_end(problem_id)
+        self.hits += 1
+        return record
+
+    def prune(self):
+        """Drop expired records; LRU order means they are all at the front"""
+        if not self.ttl:
+            return 0
+        cutoff = self._clock() - self.ttl
+        dropped = 0
+        while self._records:
+            record = next(iter(self._records.values()))
+            if record.touched_at >= cutoff:
+                break
+            self._records.popitem(last=False)
+            dropped += 1
+        self.expired += dropped
+        return dropped
+
+    def clear(self):
+        self._records.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": "memory",
+            "size": len(self._records),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evicted": self.evicted,
+            "expired": self.expired,
+        }
+
+
+class SQLiteProblemStore(ProblemStore):
+    """Problem store in a WAL-mode SQLite file shared by every worker on the host
+
+    Workers open the same database through their own pooled connections, so a
+    problem served by one worker can be checked by another, and served
+    problems survive a restart. Size and TTL limits are enforced by a prune
+    pass every `prune_every` inserts rather than on each write. A write can
+    wait up to `busy_timeout` seconds for another worker's lock, which is why
+    the server calls the store from a worker thread. `size_estimate` is a
+    running count of this worker's changes, corrected from the table at each
+    prune, so it doesn't touch the database. The server calls the store from
+    several threads at once, so that count and the inserts-since-prune count
+    are only changed under a lock.
+    """
+
+    blocking = True
+
+    def __init__(self, path, max_size=10000, ttl=7200.0, clock=time.time,
+                 pool_size=5, prune_every=256, busy_timeout=5.0):
+        self.path = str(path)
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._clock = clock
+        self._prune_every = max(1, prune_every)
+        self._inserts_since_prune = 0
+        self._counts_lock = threading.Lock()
+
+        self._engine = create_engine(
+            f"sqlite:///{self.path}",
+            pool_size=pool_size,
+            connect_args={"check_same_thread": False, "timeout": busy_timeout},
+        )
+
+        @event.listens_for(self._engine, "connect")
+        def _configure_connection(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.close()
+
+        metadata = MetaData()
+        self._table = Table(
+            "problems", metadata,
+            Column("problem_id", BigInteger, primary_key=True, autoincrement=False),
+            Column("answer", Text, nullable=False),
+            Column("explanation", Text, nullable=False),
+            Column("grade_level", String(16)),
+            Column("theme", String(64)),
+            Column("problem_type", String(64)),
+            Column("num_steps", Integer),
+            Column("source", String(32)),
+            Column("created_at", Float, nullable=False),
+            Column("touched_at", Float, nullable=False, index=True),
+        )
+        create_tables(metadata, self._engine)
+        self._size = len(self)
+
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.expired = 0
+
+    def __len__(self):
+        with self._engine.connect() as conn:
+            return conn.execute(select(func.count()).select_from(self._table)).scalar_one()
+
+    def size_estimate(self):
+        return self._size
+
+    def _row(self, problem, grade_level, now):
+        return {
+            "problem_id": new_problem_id(),
+            "answer": json.dumps(problem["answer"]),
+            "explanation": problem.get("explanation", "No explanation available"),
+            "grade_level": grade_level,
+            "theme": problem.get("theme", "general"),
+            "problem_type": problem.get("problem_type", "math"),
+            "num_steps": problem.get("num_steps", 1),
+            "source": problem.get("source"),
+            "created_at": now,
+            "touched_at": now,
+        }
+
+    def add(self, problem, grade_level=None):
+        return self.add_many([problem], grade_level)[0]
+
+    def add_many(self, problems, grade_level=None):
+        """Insert all problems in a single transaction"""
+        now = self._clock()
+        rows = [self._row(problem, grade_level, now) for problem in problems]
+        while True:
+            try:
+                with self._engine.begin() as conn:
+                    conn.execute(self._table.insert(), rows)
+                break
+            except IntegrityError:
+                # An ID clashed with another worker's; draw fresh IDs and retry
+                for row in rows:
+                    row["problem_id"] = new_problem_id()
+
+        with self._counts_lock:
+            self._size += len(rows)
+            self._inserts_since_prune += len(rows)
+            # Only the thread that crosses the threshold prunes
+            due = self._inserts_since_prune >= self._prune_every
+            if due:
+                self._inserts_since_prune = 0
+        if due:
+            self.prune()
+        return [row["problem_id"] for row in rows]
+
+    def get(self, problem_id):
+        table = self._table
+        now = self._clock()
+        with self._engine.connect() as conn:
+            row = conn.execute(select(table).where(table.c.problem_id == problem_id)).first()
+        if row is None:
+            self.misses += 1
+            return None
+
+        if self.ttl and now - row.touched_at > self.ttl:
+            with self._engine.begin() as conn:
+                deleted = conn.execute(table.delete().where(table.c.problem_id == problem_id)).rowcount
+            with self._counts_lock:
+                self._size = max(0, self._size - deleted)
+            self.expired += 1
+            self.misses += 1
+            return None
+
+        # Refreshing the idle timer is a write, so only do it once it has
+        # drifted noticeably
+        if self.ttl and now - row.touched_at > self.ttl / 10:
+            with self._engine.begin() as conn:
+                conn.execute(table.update().where(table.c.problem_id == problem_id)
+                             .values(touched_at=now))
+
+        self.hits += 1
+        record = ProblemRecord(
+            row.problem_id, json.loads(row.answer), row.explanation,
+            grade_level=row.grade_level, theme=row.theme, problem_type=row.problem_type,
+            num_steps=row.num_steps, source=row.source, created_at=row.created_at,
+        )
+        record.touched_at = now
+        return record
+
+    def prune(self):
+        table = self._table
+        with self._counts_lock:
+            self._inserts_since_prune = 0
+        with self._engine.begin() as conn:
+            expired = 0
+            if self.ttl:
+                cutoff = self._clock() - self.ttl
+                expired = conn.execute(table.delete().where(table.c.touched_at < cutoff)).rowcount
+
+            size = conn.execute(select(func.count()).select_from(table)).scalar_one()
+            excess = size - self.max_size
+            evicted = 0
+            if excess > 0:
+                oldest = select(table.c.problem_id).order_by(table.c.touched_at).limit(excess)
+                evicted = conn.execute(table.delete().where(table.c.problem_id.in_(oldest))).rowcount
+
+        with self._counts_lock:
+            self._size = size - evicted
+        self.expired += expired
+        self.evicted += evicted
+        return expired
+
+    def clear(self):
+        with self._engine.begin() as conn:
+            conn.execute(self._table.delete())
+        with self._counts_lock:
+            self._size = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "size": len(self),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evicted": self.evicted,
+            "expired": self.expired,
+        }
+
+    def close(self):
+        self._engine.dispose()
+
+
+def create_problem_store(backend="memory", path=None, **kwargs):
+    """Build the problem store named by `backend` ("memory" or "sqlite")"""
+    if backend == "memory":
+        return MemoryProblemStore(**kwargs)
+    if backend == "sqlite":
+        if path is None:
+            raise ValueError("The sqlite problem store needs a database path")
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        return SQLiteProblemStore(path, **kwargs)
+    raise ValueError(f"Unknown problem store backend: {backend}")
@@ -0,0 +1,280 @@
+"""Checks that a generated problem's stored answer is actually right
+
+The arithmetic check re-evaluates every "expression = value" claim in the
+explanation with a restricted AST evaluator (numbers and + - * / ** only) and
+looks for the stated answer among the values the steps arrive at. It takes
+microseconds, so it also runs inline before an interactive problem is served.
+Stated values are read with answer_checker.parse_answer, so "3/4" and "2 1/2"
+are compared as exact fractions. A whole-number result of an inexact division
+("497 / 12 = 41", "146 ÷ 9 = 16 full boxes") is a quotient with a remainder;
+it can't be checked this way, so it's skipped rather than called wrong.
+A second, cheap model call that solves the question independently can be
+added on top; that only runs in the background VerificationPipeline.
+"""
+import ast
+import asyncio
+import logging
+import math
+import operator
+import re
+
+from answer_checker import check_answer, parse_answer
+
+logger = logging.getLogger(__name__)
+
+VERIFIED = "verified"
+# Nothing contradicts the answer, but nothing confirmed it either
+UNCONFIRMED = "unconfirmed"
+MISMATCH = "mismatch"
+
+_BINARY_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Pow: operator.pow,
+}
+_UNARY_OPS = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+MAX_EXPRESSION_LENGTH = 200
+MAX_EXPONENT = 10
+
+# Rewrites applied to each explanation line before looking for claims
+_MULTIPLY_RE = re.compile(r"(?<=[\d)])\s*[×x·*]\s*(?=[\d(])")
+_THOUSANDS_RE = re.compile(r"(?<=\d),(?=\d{3}(?!\d))")
+_PERCENT_RE = re.compile(r"(\d+(?:\.\d+)?)\s*%")
+_STEP_NUMBER_RE = re.compile(r"^\s*(?:step\s*)?\d+[.)]\s+", re.IGNORECASE)
+# The arithmetic run at the end of the text before "=", and the value after it:
+# a number, optionally as a fraction ("3/4") or mixed number ("2 1/2")
+_EXPRESSION_RE = re.compile(r"[\d.\s+\-*/()^]+$")
+_RESULT_RE = re.compile(r"^\s*(-?\d+(?:\.\d+)?)(?:\s*/\s*\d+|\s+\d+\s*/\s*\d+)?")
+
+
+def safe_eval(expression):
+    """Evaluate plain arithmetic; returns a float, or None for anything else"""
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        return None
+    try:
+        tree = ast.parse(expression.replace("^", "**"), mode="eval")
+        return float(_eval_node(tree.body))
+    except (SyntaxError, ValueError, TypeError, ZeroDivisionError, OverflowError):
+        return None
+
+
+def _eval_node(node):
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return node.value
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPS:
+        left, right = _eval_node(node.left), _eval_node(node.right)
+        if isinstance(node.op, ast.Pow) and abs(right) > MAX_EXPONENT:
+            raise ValueError("exponent too large")
+        return _BINARY_OPS[type(node.op)](left, right)
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPS:
+        return _UNARY_OPS[type(node.op)](_eval_node(node.operand))
+    raise ValueError(f"unsupported expression: {type(node).__name__}")
+
+
+def _normalize_line(line):
+    line = _STEP_NUMBER_RE.sub("", line)
+    line = line.replace("÷", "/").replace("−", "-").replace("$", "").replace("€", "").replace("£", "")
+    line = _THOUSANDS_RE.sub("", line)
+    line = _MULTIPLY_RE.sub(" * ", line)
+    return _PERCENT_RE.sub(r"(\1/100)", line)
+
+
+def arithmetic_claims(explanation):
+    """Yield (expression, computed, stated) for each "a op b = c" in the explanation
+
+    Claims that involve variables or words ("3c + 3 = 30") are skipped.
+    `stated` is the text of the value, e.g. "84", "3/4" or "2 1/2".
+    """
+    for line in explanation.splitlines():
+        parts = _normalize_line(line).split("=")
+        for index, (left, right) in enumerate(zip(parts, parts[1:])):
+            expression_match = _EXPRESSION_RE.search(left)
+            result_match = _RESULT_RE.match(right)
+            if expression_match is None or result_match is None:
+                continue
+            expression = expression_match.group().strip()
+            # "3c + 3" leaves just "+ 3": the expression is glued to a variable
+            start = expression_match.start()
+            if start and left[start - 1].isalpha() and expression[:1] in "+-*/^":
+                continue
+            if not any(op in expression.lstrip("-") for op in "+-*/^"):
+                continue
+            computed = safe_eval(expression)
+            if computed is None:
+                continue
+            stated = result_match.group().strip()
+            # In a chain like "3 × 4 = 12 / 2 = 6", "12 / 2" is also the next
+            # step's expression, so its first number may be the result
+            if (index + 2 < len(parts) and stated != result_match.group(1)
+                    and not check_answer(stated, computed)):
+                stated = result_match.group(1)
+            yield expression, computed, " ".join(stated.split())
+
+
+def is_integer_quotient(expression, computed, stated):
+    """True for a division step that states only the whole-number quotient"""
+    if "/" not in expression or computed == int(computed):
+        return False
+    parsed = parse_answer(stated)
+    return (parsed is not None and parsed.is_integer
+            and parsed.numerator // parsed.denominator == math.floor(computed))
+
+
+def check_arithmetic(problem):
+    """Return (status, reason) from the explanation's own arithmetic"""
+    claims = []
+    for expression, computed, stated in arithmetic_claims(problem.get("explanation", "")):
+        if check_answer(stated, computed):
+            claims.append((expression, computed, stated))
+        elif not is_integer_quotient(expression, computed, stated):
+            return MISMATCH, f"step {expression} = {stated} should be {computed:g}"
+    if not claims:
+        return UNCONFIRMED, "no arithmetic steps to check"
+
+    answer = problem["answer"]
+    if any(check_answer(stated, answer) for _, _, stated in claims):
+        return VERIFIED, "answer matches a checked step"
+    return UNCONFIRMED, "answer is not the result of any checked step"
+
+
+class ProblemVerifier:
+    """Combine the arithmetic check with an optional second model's answer
+
+    `confirm` is an async callable(problem) -> number or None that solves the
+    question independently. With `strict`, unconfirmed problems are treated
+    like mismatches.
+    """
+
+    def __init__(self, confirm=None, strict=False):
+        self._confirm = confirm
+        self.strict = strict
+
+    async def verify(self, problem):
+        status, reason = check_arithmetic(problem)
+        if status != MISMATCH and self._confirm is not None:
+            try:
+                model_answer = await self._confirm(problem)
+            except Exception as e:
+                logger.warning(f"Answer confirmation failed: {str(e)}")
+                model_answer = None
+            if model_answer is not None:
+                if check_answer(model_answer, problem["answer"]):
+                    status, reason = VERIFIED, "second model agrees"
+                else:
+                    status, reason = MISMATCH, f"second model answered {model_answer}"
+        if status == UNCONFIRMED and self.strict:
+            status = MISMATCH
+        return status, reason
+
+
+class VerificationPipeline:
+    """Background workers that verify generated problems before they're reused
+
+    `submit` queues a problem and returns a future for the problem, or None if
+    it wasn't verified (quarantined, unconfirmed) or couldn't be queued. Only
+    model-generated problems are checked; template and corpus problems pass
+    straight through, as does everything when `verifier` is None. Verified
+    problems go to `on_verified(grade_level, problem)`, rejected ones to
+    `on_quarantined(grade_level, problem, reason)`. Unconfirmed problems go to
+    neither: they may have been served once already, but aren't reused.
+    """
+
+    def __init__(self, verifier, workers=2, max_pending=100, on_verified=None, on_quarantined=None):
+        self._verifier = verifier
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self._on_verified = on_verified
+        self._on_quarantined = on_quarantined
+        self._loop = None
+        self._queue = None
+        self._tasks = []
+
+        self.verified = 0
+        self.unconfirmed = 0
+        self.quarantined = 0
+        self.dropped = 0
+
+    def _ensure_running(self):
+        # Workers belong to the loop that first needs them; a new loop gets fresh ones
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._tasks:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._tasks = [asyncio.create_task(self._worker(), name=f"verification-{i}")
+                       for i in range(self.workers)]
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._queue is not None:
+            while not self._queue.empty():
+                self._queue.get_nowait()[2].cancel()
+        self._loop = None
+        self._queue = None
+
+    def submit(self, grade_level, problem):
+        """Queue a problem for verification without waiting"""
+        self._ensure_running()
+        future = self._loop.create_future()
+        if problem.get("source") != "openai":
+            future.set_result(problem)
+            return future
+        if self._verifier is None:
+            # Verification is off: accept as is
+            if self._on_verified is not None:
+                self._on_verified(grade_level, problem)
+            future.set_result(problem)
+            return future
+        try:
+            self._queue.put_nowait((grade_level, problem, future))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            future.set_result(None)
+        return future
+
+    async def verify(self, grade_level, problem):
+        """Wait for a problem's verification; returns the problem or None"""
+        return await self.submit(grade_level, problem)
+
+    async def _worker(self):
+        while True:
+            grade_level, problem, future = await self._queue.get()
+            try:
+                status, reason = await self._verifier.verify(problem)
+            except Exception as e:
+                logger.error(f"Verification failed: {str(e)}")
+                status, reason = MISMATCH, f"verification error: {str(e)}"
+
+            if status == MISMATCH:
+                self.quarantined += 1
+                logger.warning(f"Quarantined a grade {grade_level} problem: {reason}")
+                if self._on_quarantined is not None:
+                    self._on_quarantined(grade_level, problem, reason)
+                result = None
+            elif status == UNCONFIRMED:
+                self.unconfirmed += 1
+                problem["verification"] = status
+                result = None
+            else:
+                self.verified += 1
+                problem["verification"] = status
+                if self._on_verified is not None:
+                    self._on_verified(grade_level, problem)
+                result = problem
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "verified": self.verified,
+            "unconfirmed": self.unconfirmed,
+            "quarantined": self.quarantined,
+            "dropped": self.dropped,
+        }
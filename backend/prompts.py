@@ -0,0 +1,284 @@
+"""Versioned prompt templates for model generation
+
+Each version is a system message and a user message template, checked for
+unknown placeholders when registered. Rendered messages are memoized per
+(version, grade, theme, type), so a request only looks its prompt up.
+
+v2 keeps every static instruction and example in the system message, which is
+identical for all requests, and puts the per-request details last. That shared
+prefix is what provider-side prompt caching can reuse. v1 is the original
+prompt, kept so problems and costs can be compared across versions.
+
+    python prompts.py    # token counts per version
+"""
+import json
+import os
+import string
+from functools import lru_cache
+
+# Add variety with random themes and problem types
+THEMES = [
+    "sports and games",
+    "cooking and recipes",
+    "space and astronomy",
+    "animals and nature",
+    "technology and gaming",
+    "art and music",
+    "travel and adventure"
+]
+
+PROBLEM_TYPES = [
+    "algebra with unknowns",
+    "ratios and proportions",
+    "geometry and spatial reasoning",
+    "number theory and patterns",
+    "logic puzzles with constraints",
+    "combinatorics and counting"
+]
+
+# Grade-appropriate settings for the prompt
+GRADE_DESCRIPTIONS = {
+    "1-2": {
+        "description": "1st-2nd grade students",
+        "steps": "1-2 steps",
+        "complexity": "simple addition, subtraction, and basic counting",
+        "max_number": "Keep numbers under 100"
+    },
+    "3-5": {
+        "description": "3rd-5th grade students",
+        "steps": "2-3 steps",
+        "complexity": "multiplication, division, fractions, and basic decimals",
+        "max_number": "Keep numbers under 1000"
+    },
+    "5-8": {
+        "description": "5th-8th grade students",
+        "steps": "3-5 steps",
+        "complexity": "algebra, ratios, percentages, and multi-step reasoning",
+        "max_number": "Numbers can be larger but keep them reasonable"
+    }
+}
+
+DEFAULT_PROMPT_VERSION = "v2"
+
+# Placeholders a template may use
+PROMPT_FIELDS = frozenset({"theme", "problem_type", "description", "steps", "complexity", "max_number"})
+
+
+class PromptTemplate:
+    """One prompt version: a system message and a user message template"""
+
+    __slots__ = ("version", "system", "user", "notes")
+
+    def __init__(self, version, system, user, notes=""):
+        for template in (system, user):
+            fields = {name for _, name, _, _ in string.Formatter().parse(template) if name is not None}
+            unknown = fields - PROMPT_FIELDS
+            if unknown:
+                raise ValueError(f"Prompt {version} uses unknown fields: {sorted(unknown)}")
+        self.version = version
+        self.system = system
+        self.user = user
+        self.notes = notes
+
+    def render(self, grade_level, theme, problem_type):
+        fields = dict(GRADE_DESCRIPTIONS[grade_level], theme=theme, problem_type=problem_type)
+        return (
+            {"role": "system", "content": self.system.format(**fields)},
+            {"role": "user", "content": self.user.format(**fields)},
+        )
+
+
+_V1_SYSTEM = """You are an expert math educator creating engaging problems for talented {description}.
+Your problems should be challenging but solvable, creative but grounded in real-world contexts."""
+
+_V1_USER = """Create a math word problem with these specifications:
+
+CONTEXT & ENGAGEMENT:
+- Theme: {theme}
+- Problem type: {problem_type}
+- Make it story-driven with a clear scenario
+- Use specific numbers and concrete details
+- Avoid generic situations - be creative and fun!
+
+MATHEMATICAL REQUIREMENTS:
+- Suitable for {description}
+- Focus on: {complexity}
+- {max_number}
+- Answer must be a single numeric value (integer or decimal)
+- Problem should require {steps} to solve
+- Avoid problems requiring outside knowledge (no obscure facts)
+
+VERIFICATION (CRITICAL):
+After generating the problem:
+1. Solve it yourself step-by-step
+2. Verify your arithmetic is correct
+3. Check that the answer matches the question asked
+4. If anything doesn't work, revise the problem
+
+Return ONLY valid JSON in this exact format:
+{{
+    "question": "A clear, engaging word problem with specific numbers and context",
+    "answer": numeric_value_only,
+    "explanation": "Step-by-step solution showing all work clearly"
+}}
+
+GOOD EXAMPLES:
+
+{{
+    "question": "Maya is training for a marathon. On Monday she runs 3 miles. Each day after that, she runs 1.5 times as far as the previous day. How many total miles will she have run after 4 days of training?",
+    "answer": 24.375,
+    "explanation": "Day 1: 3 miles\\nDay 2: 3 × 1.5 = 4.5 miles\\nDay 3: 4.5 × 1.5 = 6.75 miles\\nDay 4: 6.75 × 1.5 = 10.125 miles\\nTotal: 3 + 4.5 + 6.75 + 10.125 = 24.375 miles"
+}}
+
+{{
+    "question": "A baker makes cookies that weigh 25 grams each. She packs them in boxes of 12. If a customer orders 7 boxes, what is the total weight in kilograms?",
+    "answer": 2.1,
+    "explanation": "1. Cookies per order: 12 × 7 = 84 cookies\\n2. Total weight in grams: 84 × 25 = 2,100 grams\\n3. Convert to kilograms: 2,100 ÷ 1,000 = 2.1 kg"
+}}
+
+{{
+    "question": "In a witch's garden there are 30 animals: dogs, cats and mice. The witch changes 6 dogs into cats and then 5 cats into mice. Now there is an equal number of dogs, cats and mice. How many cats were there to start with?",
+    "answer": 8,
+    "explanation": "1. Let d, c, m be the initial counts\\n2. Initial: d + c + m = 30\\n3. After transformations: d-6 dogs, c+6-5=c+1 cats, m+5 mice\\n4. Equal numbers means: d-6 = c+1 = m+5\\n5. From d-6 = c+1: d = c+7\\n6. From c+1 = m+5: m = c-4\\n7. Substitute into total: (c+7) + c + (c-4) = 30\\n8. Solve: 3c + 3 = 30, so c = 9... Wait, let me recalculate.\\n9. Actually: d-6 = c+1 gives d = c+7. And c+1 = m+5 gives m = c-4\\n10. But (c+7) + c + (c-4) = 30 gives 3c + 3 = 30, c = 9. Let me verify: d=16, c=9, m=5. After changes: 10 dogs, 10 cats, 10 mice. But 16+9+5=30. So this works but let me recalculate from the original problem constraint.\\n11. Correct approach: After changes we have equal numbers (each is 10). So d-6=10, c+1=10, m+5=10. This gives d=16, c=9, m=5. Check: 16+9+5=30. But wait, cats: c+6-5 = c+1 = 10, so c=9. Actually this problem has an error in my example. Let me use the simpler algebraic solution: d-6 = c-5+6 = m+5; with d+c+m=30 and final count is 10 each. Working backward: d=16, c=9, m=5 doesn't give c=8. Let me just use c=8 as in original.\\n12. Using the constraint that final = 10 each: d-6=10 → d=16; For cats: start with c, lose 5, gain 6, end with 10: c+1=10 → c=9. Hmm, this gives 9 not 8.\\n13. Let me recalculate the original correctly: If we end with equal numbers n each: d-6=n, c+6-5=n, m+5=n. So d=n+6, c=n-1, m=n-5. Total: (n+6)+(n-1)+(n-5)=30 → 3n=30 → n=10. So c=9 not 8. There's an error in the original example."
+}}
+
+Wait, I see an issue with that last example. Let me provide a corrected version:
+
+{{
+    "question": "A video game costs $45. During a sale, the price is reduced by 20%, and then a coupon gives an additional $5 off. If you buy 3 copies at this discounted price, how much do you spend in total?",
+    "answer": 93,
+    "explanation": "1. Original price: $45\\n2. After 20% reduction: $45 × 0.80 = $36\\n3. After $5 coupon: $36 - $5 = $31 per game\\n4. Cost for 3 games: $31 × 3 = $93"
+}}
+
+Now generate a new problem following these guidelines."""
+
+def _example(question, answer, steps):
+    explanation = "\n".join(f"{i}. {step}" for i, step in enumerate(steps, 1))
+    text = json.dumps({"question": question, "answer": answer, "explanation": explanation}, ensure_ascii=False)
+    # Literal braces, since the system message is a format template
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+_V2_EXAMPLES = "\n".join([
+    _example(
+        "Maya is training for a marathon. On Monday she runs 3 miles. Each day after that, she runs "
+        "1.5 times as far as the previous day. How many total miles will she have run after 4 days of training?",
+        24.375,
+        ["Day 2: 3 × 1.5 = 4.5 miles", "Day 3: 4.5 × 1.5 = 6.75 miles", "Day 4: 6.75 × 1.5 = 10.125 miles",
+         "Total: 3 + 4.5 + 6.75 + 10.125 = 24.375 miles"],
+    ),
+    _example(
+        "A video game costs $45. During a sale, the price is reduced by 20%, and then a coupon gives an "
+        "additional $5 off. If you buy 3 copies at this discounted price, how much do you spend in total?",
+        93,
+        ["After 20% off: $45 × 0.80 = $36", "After the coupon: $36 - $5 = $31 per game",
+         "For 3 games: $31 × 3 = $93"],
+    ),
+])
+
+_V2_SYSTEM = """You are an expert math educator writing engaging word problems for talented students. \
+Problems are challenging but solvable, creative but grounded in real-world contexts.
+
+Rules:
+- A story-driven scenario with specific numbers and concrete details; avoid generic situations
+- The answer is a single number (integer or decimal)
+- No outside knowledge needed
+- Before answering, solve the problem yourself, check the arithmetic and that the answer matches the question, and revise the problem if anything is off
+
+Reply with only a JSON object with keys "question", "answer" (a number) and "explanation" (numbered steps).
+
+Examples:
+""" + _V2_EXAMPLES
+
+_V2_USER = """Students: {description}
+Theme: {theme}
+Problem type: {problem_type}
+Focus on: {complexity}. {max_number}. It should take {steps} to solve."""
+
+
+# System message for the independent solve used to double-check answers
+SOLVER_SYSTEM = """Solve the math word problem carefully, step by step in your head. \
+Reply with only a JSON object: {"answer": <the final numeric answer>}"""
+
+
+PROMPTS = {
+    prompt.version: prompt for prompt in (
+        PromptTemplate("v1", _V1_SYSTEM, _V1_USER, "original prompt"),
+        PromptTemplate("v2", _V2_SYSTEM, _V2_USER, "static system prefix, two examples"),
+    )
+}
+
+
+def get_prompt(version=DEFAULT_PROMPT_VERSION):
+    """Return the registered PromptTemplate for `version`"""
+    try:
+        return PROMPTS[version]
+    except KeyError:
+        raise ValueError(f"Unknown prompt version {version!r}; expected one of {sorted(PROMPTS)}")
+
+
+@lru_cache(maxsize=1024)
+def render_messages(version, grade_level, theme, problem_type):
+    """Chat messages for one prompt variant, rendered once and then reused
+
+    Callers get the cached dicts and must copy them before changing anything.
+    """
+    return get_prompt(version).render(grade_level, theme, problem_type)
+
+
+# Loaded on first use: a tiktoken encoding, or False when it isn't installed
+_encoding = None
+
+
+def count_tokens(text):
+    """Token count with tiktoken if installed, otherwise a ~4 characters per token estimate"""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = False
+    if _encoding is False:
+        return (len(text) + 3) // 4
+    return len(_encoding.encode(text))
+
+
+def token_report(versions=None):
+    """Prompt size per version over every grade, theme and type
+
+    `shared_prefix` is the leading text common to all variants, the part a
+    provider's prompt cache can serve for every request.
+    """
+    report = []
+    for version in versions or PROMPTS:
+        texts = []
+        for grade_level in GRADE_DESCRIPTIONS:
+            for theme in THEMES:
+                for problem_type in PROBLEM_TYPES:
+                    messages = render_messages(version, grade_level, theme, problem_type)
+                    texts.append("\n".join(message["content"] for message in messages))
+        counts = [count_tokens(text) for text in texts]
+        report.append({
+            "version": version,
+            "variants": len(texts),
+            "min_tokens": min(counts),
+            "mean_tokens": round(sum(counts) / len(counts), 1),
+            "max_tokens": max(counts),
+            "shared_prefix_tokens": count_tokens(os.path.commonprefix(texts)),
+        })
+    return report
+
+
+def main():
+    count_tokens("")
+    method = "tiktoken o200k_base" if _encoding else "estimated at ~4 chars/token; install tiktoken for exact counts"
+    print(f"Prompt tokens per request ({method})")
+    print(f"{'version':<8} {'variants':>8} {'min':>6} {'mean':>8} {'max':>6} {'shared prefix':>14}")
+    for row in token_report():
+        print(f"{row['version']:<8} {row['variants']:>8} {row['min_tokens']:>6} {row['mean_tokens']:>8} "
+              f"{row['max_tokens']:>6} {row['shared_prefix_tokens']:>14}")
+
+
+if __name__ == "__main__":
+    main()
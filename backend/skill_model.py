@@ -0,0 +1,243 @@
+"""Per-session attempt history and skill estimates, for choosing what to serve next
+
+Each session's recent attempts live in an AttemptLog: a ring buffer with one
+typed array per field, so a session costs a few hundred bytes no matter how
+long it runs. SkillEstimator folds every attempt in with O(1) work: an
+exponentially weighted accuracy per problem type, and a step-count level that
+rises after quick correct answers and drops after wrong ones. From those it
+picks the (problem type, step count) to serve next, favouring weak types.
+
+DemandTracker keeps decaying per-grade counts of the types being asked for,
+so pool refills generate what sessions will want rather than uniformly random
+types.
+"""
+import random
+import re
+import time
+from array import array
+from collections import OrderedDict
+
+from prompts import GRADE_DESCRIPTIONS, PROBLEM_TYPES, THEMES
+
+TYPE_INDEX = {problem_type: i for i, problem_type in enumerate(PROBLEM_TYPES)}
+THEME_INDEX = {theme: i for i, theme in enumerate(THEMES)}
+# Stored for types and themes outside the lists above (e.g. "math" on old records)
+UNKNOWN = 255
+
+# An answer within this many seconds per step counts as quick
+QUICK_SECONDS_PER_STEP = 30.0
+LEVEL_UP_QUICK = 0.5
+LEVEL_UP_SLOW = 0.15
+LEVEL_DOWN = 0.75
+# Added to every type's weight so strong types still come up now and then
+EXPLORE_WEIGHT = 0.15
+
+
+def step_range(grade_level):
+    """(fewest, most) solution steps the grade's prompt asks for, e.g. (2, 3) for grades 3-5"""
+    info = GRADE_DESCRIPTIONS.get(grade_level, GRADE_DESCRIPTIONS["5-8"])
+    low, high = (int(n) for n in re.findall(r"\d+", info["steps"])[:2])
+    return low, high
+
+
+class AttemptLog:
+    """The last `capacity` attempts of one session, oldest overwritten first"""
+
+    def __init__(self, capacity=64):
+        self.capacity = max(1, capacity)
+        self._problem_ids = array("q", [0]) * self.capacity
+        self._types = array("B", [UNKNOWN]) * self.capacity
+        self._themes = array("B", [UNKNOWN]) * self.capacity
+        self._steps = array("B", [0]) * self.capacity
+        self._correct = array("B", [0]) * self.capacity
+        self._seconds = array("f", [0.0]) * self.capacity
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, problem_id, problem_type, theme, num_steps, correct, seconds):
+        i = self._next
+        self._problem_ids[i] = problem_id
+        self._types[i] = TYPE_INDEX.get(problem_type, UNKNOWN)
+        self._themes[i] = THEME_INDEX.get(theme, UNKNOWN)
+        self._steps[i] = max(0, min(255, num_steps))
+        self._correct[i] = 1 if correct else 0
+        self._seconds[i] = seconds
+        self._next = (i + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def _indexes(self, newest_first=False):
+        start = self._next - self._count
+        order = range(self._count - 1, -1, -1) if newest_first else range(self._count)
+        return ((start + k) % self.capacity for k in order)
+
+    def has_problem(self, problem_id, lookback=16):
+        """Whether one of the last `lookback` attempts was at this problem"""
+        for n, i in enumerate(self._indexes(newest_first=True)):
+            if n >= lookback:
+                return False
+            if self._problem_ids[i] == problem_id:
+                return True
+        return False
+
+    def recent(self, limit=None):
+        """Attempts as dicts, newest first"""
+        attempts = []
+        for i in self._indexes(newest_first=True):
+            if limit is not None and len(attempts) >= limit:
+                break
+            type_index, theme_index = self._types[i], self._themes[i]
+            attempts.append({
+                "problem_id": self._problem_ids[i],
+                "problem_type": PROBLEM_TYPES[type_index] if type_index != UNKNOWN else None,
+                "theme": THEMES[theme_index] if theme_index != UNKNOWN else None,
+                "num_steps": self._steps[i],
+                "correct": bool(self._correct[i]),
+                "seconds": round(self._seconds[i], 1),
+            })
+        return attempts
+
+
+class SkillEstimator:
+    """Running skill estimate for one session; every update is O(1)"""
+
+    def __init__(self, alpha=0.3, prior=0.7, log_capacity=64):
+        self.alpha = alpha
+        self.accuracy = array("f", [prior]) * len(PROBLEM_TYPES)
+        self.attempts = array("I", [0]) * len(PROBLEM_TYPES)
+        # Step count the learner is handling; set by the first attempt
+        self.level = None
+        self.log = AttemptLog(log_capacity)
+        self.updated_at = time.time()
+
+    def update(self, problem_id, problem_type, theme, num_steps, correct, seconds):
+        self.log.append(problem_id, problem_type, theme, num_steps, correct, seconds)
+        index = TYPE_INDEX.get(problem_type)
+        if index is not None:
+            self.accuracy[index] += self.alpha * ((1.0 if correct else 0.0) - self.accuracy[index])
+            self.attempts[index] += 1
+
+        level = self.level if self.level is not None else float(num_steps)
+        if not correct:
+            level -= LEVEL_DOWN
+        elif seconds <= QUICK_SECONDS_PER_STEP * max(1, num_steps):
+            level += LEVEL_UP_QUICK
+        else:
+            level += LEVEL_UP_SLOW
+        self.level = max(1.0, min(8.0, level))
+        self.updated_at = time.time()
+
+    def choose(self, grade_level, rng=random):
+        """(problem_type, num_steps) to serve next: weaker types more often, steps at the learner's level"""
+        low, high = step_range(grade_level)
+        level = self.level if self.level is not None else (low + high) / 2
+        num_steps = max(low, min(high, round(level)))
+        weights = [1.0 - accuracy + EXPLORE_WEIGHT for accuracy in self.accuracy]
+        return rng.choices(PROBLEM_TYPES, weights)[0], num_steps
+
+    def summary(self):
+        return {
+            "level": round(self.level, 2) if self.level is not None else None,
+            "accuracy": {problem_type: round(self.accuracy[i], 3)
+                         for i, problem_type in enumerate(PROBLEM_TYPES) if self.attempts[i]},
+            "attempts": sum(self.attempts),
+            "recent": self.log.recent(10),
+        }
+
+
+class SkillTracker:
+    """Skill estimates for the `max_sessions` most recently active sessions"""
+
+    def __init__(self, max_sessions=10000, log_capacity=64, rng=None):
+        self.max_sessions = max(1, max_sessions)
+        self.log_capacity = log_capacity
+        self._rng = rng or random
+        self._sessions = OrderedDict()
+        self.recorded = 0
+        self.repeats = 0
+        self.adaptive_choices = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def record(self, session_id, record, correct, seconds):
+        """Log an answer to a served problem; repeat answers to the same problem are ignored"""
+        skill = self._sessions.get(session_id)
+        if skill is None:
+            skill = self._sessions[session_id] = SkillEstimator(log_capacity=self.log_capacity)
+            if len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(session_id)
+            # After the first check the response gave the answer away
+            if skill.log.has_problem(record.problem_id):
+                self.repeats += 1
+                return False
+        skill.update(record.problem_id, record.problem_type, record.theme, record.num_steps or 1,
+                     correct, seconds)
+        self.recorded += 1
+        return True
+
+    def choose(self, session_id, grade_level):
+        """(problem_type, num_steps) for the session's next problem, or (None, None) without history"""
+        skill = self._sessions.get(session_id) if session_id else None
+        if skill is None:
+            return None, None
+        self.adaptive_choices += 1
+        return skill.choose(grade_level, self._rng)
+
+    def session(self, session_id):
+        skill = self._sessions.get(session_id)
+        return skill.summary() if skill is not None else None
+
+    def stats(self):
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "recorded": self.recorded,
+            "repeats": self.repeats,
+            "adaptive_choices": self.adaptive_choices,
+        }
+
+
+class DemandTracker:
+    """Decaying per-grade counts of requested problem types
+
+    Each request adds 1 to its type's count; every `half_life` requests all
+    counts are halved (amortized O(1)), so demand from an hour ago fades.
+    """
+
+    def __init__(self, half_life=200, rng=None):
+        self.half_life = max(1, half_life)
+        self._rng = rng or random
+        self._counts = {}
+        self._since_decay = 0
+
+    def note(self, grade_level, problem_type):
+        index = TYPE_INDEX.get(problem_type)
+        if index is None:
+            return
+        counts = self._counts.get(grade_level)
+        if counts is None:
+            counts = self._counts[grade_level] = array("f", [0.0]) * len(PROBLEM_TYPES)
+        counts[index] += 1.0
+        self._since_decay += 1
+        if self._since_decay >= self.half_life:
+            self._since_decay = 0
+            for grade_counts in self._counts.values():
+                for i in range(len(grade_counts)):
+                    grade_counts[i] *= 0.5
+
+    def next_type(self, grade_level):
+        """A problem type to generate for the grade, weighted by demand; None without any"""
+        counts = self._counts.get(grade_level)
+        if counts is None:
+            return None
+        # +1 so types nobody asked for lately still get the odd refill
+        return self._rng.choices(PROBLEM_TYPES, [count + 1.0 for count in counts])[0]
+
+    def stats(self):
+        return {grade: {problem_type: round(counts[i], 2) for i, problem_type in enumerate(PROBLEM_TYPES)}
+                for grade, counts in self._counts.items()}
@@ -0,0 +1,222 @@
+"""Serving the built frontend: in-memory index, ETags, long-lived caching, precompressed files
+
+The build directory is scanned once. Every file gets a strong ETag from a hash
+of its contents; files whose names carry a build hash (main.3f2a9c1b.js) are
+sent with an immutable one-year Cache-Control, everything else must be
+revalidated, which costs a 304 when nothing changed. When `name.br` or
+`name.gz` sits next to a file (see `python static_assets.py <build dir>`) and
+the client accepts that encoding, the compressed file is sent as is.
+
+index.html and its compressed forms are held in memory, since every page load
+that isn't a static asset ends up there.
+"""
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import sys
+from pathlib import Path
+
+from fastapi.responses import FileResponse, Response
+
+try:
+    import brotli
+except ImportError:  # optional; only gzip variants are written without it
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# CRA puts an 8+ hex digit content hash before the extension
+HASHED_NAME = re.compile(r"\.[0-9a-f]{8,}\.(chunk\.)?[a-z0-9]+$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+# Content-Encoding token -> suffix of the precompressed file, in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "application/manifest+json",
+                      "image/svg+xml", "application/xml")
+MIN_COMPRESS_SIZE = 256
+
+mimetypes.add_type("application/javascript", ".js")
+mimetypes.add_type("application/manifest+json", ".webmanifest")
+
+
+def _etag(data):
+    return '"' + hashlib.blake2b(data, digest_size=16).hexdigest() + '"'
+
+
+def _content_type(name):
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if content_type.startswith("text/") or content_type == "application/javascript":
+        content_type += "; charset=utf-8"
+    return content_type
+
+
+def accepted_encodings(header):
+    """Content codings the client accepts, from an Accept-Encoding header
+
+    "*" stands for every coding the header doesn't name (RFC 9110 12.5.3), so
+    "*" accepts all of ENCODINGS and "br;q=0, *" all but br.
+    """
+    qualities = {}
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            qualities[coding] = quality
+    accepted = {coding for coding, quality in qualities.items() if quality > 0 and coding != "*"}
+    if qualities.get("*", 0) > 0:
+        accepted.update(coding for coding, _ in ENCODINGS if coding not in qualities)
+    return accepted
+
+
+def etag_matches(header, etag):
+    """Whether an If-None-Match header matches `etag` (weak comparison, as RFC 9110 asks)"""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+class _Variant:
+    __slots__ = ("path", "stat", "etag", "body")
+
+    def __init__(self, path, etag, body=None):
+        self.path = path
+        self.stat = path.stat()
+        self.etag = etag
+        self.body = body
+
+
+class _Asset:
+    __slots__ = ("content_type", "cache_control", "variants")
+
+    def __init__(self, content_type, cache_control, variants):
+        self.content_type = content_type
+        self.cache_control = cache_control
+        # Content-Encoding ("identity", "br", "gzip") -> _Variant
+        self.variants = variants
+
+
+class StaticAssets:
+    def __init__(self, root, index_name="index.html"):
+        self.root = Path(root)
+        self._assets = {}
+        self._index = None
+        if not self.root.is_dir():
+            logger.warning(f"Frontend build not found at {self.root}")
+            return
+
+        for path in sorted(self.root.rglob("*")):
+            if not path.is_file() or path.suffix in (".br", ".gz"):
+                continue
+            name = path.relative_to(self.root).as_posix()
+            in_memory = name == index_name
+            self._assets[name] = self._load(path, in_memory)
+        self._index = self._assets.get(index_name)
+        if self._index is None:
+            logger.warning(f"{index_name} not found in {self.root}")
+
+    def _load(self, path, in_memory):
+        data = path.read_bytes()
+        etag = _etag(data)
+        variants = {"identity": _Variant(path, etag, data if in_memory else None)}
+        for encoding, suffix in ENCODINGS:
+            compressed = path.with_name(path.name + suffix)
+            if compressed.is_file():
+                # A different representation needs a different strong ETag
+                variants[encoding] = _Variant(compressed, etag[:-1] + f'-{encoding}"',
+                                              compressed.read_bytes() if in_memory else None)
+        cache_control = IMMUTABLE if HASHED_NAME.search(path.name) else REVALIDATE
+        return _Asset(_content_type(path.name), cache_control, variants)
+
+    @property
+    def has_index(self):
+        return self._index is not None
+
+    def __contains__(self, name):
+        return name in self._assets
+
+    def __len__(self):
+        return len(self._assets)
+
+    def stats(self):
+        compressed = sum(len(asset.variants) > 1 for asset in self._assets.values())
+        return {"root": str(self.root), "files": len(self._assets), "precompressed": compressed,
+                "index": self.has_index}
+
+    def response(self, name, headers):
+        """Response for the asset `name` given the request headers, or None if there's no such file"""
+        asset = self._assets.get(name)
+        return None if asset is None else self._respond(asset, headers)
+
+    def index_response(self, headers):
+        return None if self._index is None else self._respond(self._index, headers)
+
+    def _respond(self, asset, headers):
+        encoding = "identity"
+        if len(asset.variants) > 1:
+            accepted = accepted_encodings(headers.get("accept-encoding"))
+            encoding = next((coding for coding, _ in ENCODINGS
+                             if coding in asset.variants and coding in accepted), "identity")
+        variant = asset.variants[encoding]
+
+        response_headers = {"etag": variant.etag, "cache-control": asset.cache_control}
+        if len(asset.variants) > 1:
+            response_headers["vary"] = "Accept-Encoding"
+        if etag_matches(headers.get("if-none-match"), variant.etag):
+            return Response(status_code=304, headers=response_headers)
+        if encoding != "identity":
+            response_headers["content-encoding"] = encoding
+
+        if variant.body is not None:
+            return Response(variant.body, media_type=asset.content_type, headers=response_headers)
+        return FileResponse(variant.path, media_type=asset.content_type, headers=response_headers,
+                            stat_result=variant.stat)
+
+
+def compress_directory(root, min_size=MIN_COMPRESS_SIZE):
+    """Write .gz (and .br when brotli is installed) next to each compressible file under `root`
+
+    A compressed file is only kept if it is smaller than the original.
+    Returns the number of files written.
+    """
+    written = 0
+    for path in sorted(Path(root).rglob("*")):
+        if not path.is_file() or path.suffix in (".br", ".gz"):
+            continue
+        if not _content_type(path.name).startswith(COMPRESSIBLE_TYPES):
+            continue
+        data = path.read_bytes()
+        if len(data) < min_size:
+            continue
+        outputs = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            outputs[".br"] = brotli.compress(data, quality=11)
+        for suffix, compressed in outputs.items():
+            if len(compressed) < len(data):
+                path.with_name(path.name + suffix).write_bytes(compressed)
+                written += 1
+    return written
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    root = argv[0] if argv else os.path.join(os.path.dirname(__file__), "..", "frontend", "build")
+    written = compress_directory(root)
+    note = "" if brotli is not None else " (brotli not installed, gzip only)"
+    print(f"Wrote {written} precompressed files under {root}{note}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,417 @@
+import random
+import time
+
+from prompts import GRADE_DESCRIPTIONS, PROBLEM_TYPES
+
+
+class Template:
+    """A parametric word problem whose answer is computed exactly in code
+
+    `ranges` maps each grade level the template suits to inclusive integer
+    ranges for its free parameters. `derived` is an ordered list of
+    (name, formula) pairs computed from the values so far; formulas only use
+    + - * // % so they give exact integers and work unchanged on NumPy
+    arrays. `question` and `steps` are format strings over all values.
+    """
+
+    __slots__ = ("problem_type", "theme", "ranges", "derived", "answer", "question", "steps")
+
+    def __init__(self, problem_type, theme, ranges, derived, answer, question, steps):
+        self.problem_type = problem_type
+        self.theme = theme
+        self.ranges = ranges
+        self.derived = derived
+        self.answer = answer
+        self.question = question
+        self.steps = steps
+
+    @property
+    def grade_levels(self):
+        return tuple(self.ranges)
+
+    def sample(self, grade_level, rng):
+        """Draw parameters for the grade and return the full set of values"""
+        values = {name: rng.randint(low, high) for name, (low, high) in self.ranges[grade_level].items()}
+        return self.solve(values)
+
+    def solve(self, values):
+        for name, formula in self.derived:
+            values[name] = formula(values)
+        return values
+
+    def render(self, values):
+        steps = [f"{number}. {step.format(**values)}" for number, step in enumerate(self.steps, 1)]
+        return {
+            "question": self.question.format(**values),
+            "answer": values[self.answer],
+            "explanation": "\n".join(steps),
+            "theme": self.theme,
+            "problem_type": self.problem_type,
+            "num_steps": len(steps),
+            "source": "template",
+        }
+
+
+TEMPLATES = [
+    # Algebra with unknowns
+    Template(
+        "algebra with unknowns", "sports and games",
+        ranges={
+            "1-2": {"first": (5, 40), "second": (5, 40)},
+            "3-5": {"first": (20, 200), "second": (20, 200)},
+            "5-8": {"first": (50, 500), "second": (50, 500)},
+        },
+        derived=[("total", lambda v: v["first"] + v["second"])],
+        answer="first",
+        question=("Jada scored some points in the first half of a basketball game and {second} points "
+                  "in the second half. She scored {total} points in all. How many points did she "
+                  "score in the first half?"),
+        steps=[
+            "Let x be the points scored in the first half: x + {second} = {total}",
+            "x = {total} - {second} = {first} points",
+        ],
+    ),
+    Template(
+        "algebra with unknowns", "technology and gaming",
+        ranges={
+            "3-5": {"count": (2, 6), "price": (8, 40), "extra": (10, 60)},
+            "5-8": {"count": (3, 12), "price": (15, 90), "extra": (20, 150)},
+        },
+        derived=[
+            ("rest", lambda v: v["count"] * v["price"]),
+            ("total", lambda v: v["rest"] + v["extra"]),
+        ],
+        answer="price",
+        question=("Leo buys {count} identical game controllers and a headset that costs ${extra}. "
+                  "He spends ${total} in all. How many dollars does one controller cost?"),
+        steps=[
+            "Let c be the cost of one controller: {count}c + {extra} = {total}",
+            "Subtract the headset: {count}c = {total} - {extra} = {rest}",
+            "Divide by {count}: c = {rest} ÷ {count} = {price} dollars",
+        ],
+    ),
+    Template(
+        "algebra with unknowns", "animals and nature",
+        ranges={
+            "5-8": {"chickens": (5, 60), "cows": (3, 40)},
+        },
+        derived=[
+            ("heads", lambda v: v["chickens"] + v["cows"]),
+            ("legs", lambda v: 2 * v["chickens"] + 4 * v["cows"]),
+            ("double_heads", lambda v: 2 * v["heads"]),
+            ("extra_legs", lambda v: v["legs"] - v["double_heads"]),
+        ],
+        answer="cows",
+        question=("A farm has only chickens and cows. Altogether the animals have {heads} heads "
+                  "and {legs} legs. How many cows are on the farm?"),
+        steps=[
+            "Let c be the number of cows, so there are {heads} - c chickens",
+            "Count legs: 2({heads} - c) + 4c = {legs}",
+            "Simplify: {double_heads} + 2c = {legs}",
+            "2c = {legs} - {double_heads} = {extra_legs}",
+            "c = {extra_legs} ÷ 2 = {cows} cows",
+        ],
+    ),
+
+    # Ratios and proportions
+    Template(
+        "ratios and proportions", "cooking and recipes",
+        ranges={
+            "1-2": {"flour": (2, 4), "sugar": (2, 3), "batches": (2, 4)},
+            "3-5": {"flour": (2, 6), "sugar": (2, 5), "batches": (3, 12)},
+            "5-8": {"flour": (3, 9), "sugar": (2, 7), "batches": (6, 25)},
+        },
+        derived=[
+            ("sugar_used", lambda v: v["sugar"] * v["batches"]),
+            ("flour_used", lambda v: v["flour"] * v["batches"]),
+        ],
+        answer="flour_used",
+        question=("A cookie recipe uses {flour} cups of flour for every {sugar} cups of sugar. "
+                  "If a baker uses {sugar_used} cups of sugar, how many cups of flour does she need?"),
+        steps=[
+            "The recipe is made {sugar_used} ÷ {sugar} = {batches} times over",
+            "Flour needed: {batches} × {flour} = {flour_used} cups",
+        ],
+    ),
+    Template(
+        "ratios and proportions", "travel and adventure",
+        ranges={
+            "3-5": {"speed": (20, 70), "hours": (2, 4), "extra_hours": (1, 5)},
+            "5-8": {"speed": (35, 95), "hours": (2, 6), "extra_hours": (2, 9)},
+        },
+        derived=[
+            ("distance", lambda v: v["speed"] * v["hours"]),
+            ("new_hours", lambda v: v["hours"] + v["extra_hours"]),
+            ("new_distance", lambda v: v["speed"] * v["new_hours"]),
+        ],
+        answer="new_distance",
+        question=("A train travels {distance} miles in {hours} hours. At the same speed, how many "
+                  "miles does it travel in {new_hours} hours?"),
+        steps=[
+            "Speed = {distance} ÷ {hours} = {speed} miles per hour",
+            "Distance in {new_hours} hours = {speed} × {new_hours} = {new_distance} miles",
+        ],
+    ),
+
+    # Geometry and spatial reasoning
+    Template(
+        "geometry and spatial reasoning", "art and music",
+        ranges={
+            "1-2": {"length": (3, 20), "width": (2, 15)},
+            "3-5": {"length": (12, 90), "width": (8, 60)},
+        },
+        derived=[
+            ("half", lambda v: v["length"] + v["width"]),
+            ("perimeter", lambda v: 2 * v["half"]),
+        ],
+        answer="perimeter",
+        question=("A painting has a rectangular frame that is {length} inches long and {width} inches "
+                  "wide. How many inches of ribbon does it take to go all the way around the frame?"),
+        steps=[
+            "One length and one width: {length} + {width} = {half} inches",
+            "Both pairs of sides: {half} + {half} = {perimeter} inches",
+        ],
+    ),
+    Template(
+        "geometry and spatial reasoning", "sports and games",
+        ranges={
+            "3-5": {"length": (10, 30), "width": (8, 20), "side": (2, 7)},
+            "5-8": {"length": (30, 120), "width": (20, 80), "side": (5, 19)},
+        },
+        derived=[
+            ("field_area", lambda v: v["length"] * v["width"]),
+            ("square_area", lambda v: v["side"] * v["side"]),
+            ("remaining", lambda v: v["field_area"] - v["square_area"]),
+        ],
+        answer="remaining",
+        question=("A rectangular soccer field is {length} meters long and {width} meters wide. A square "
+                  "practice area {side} meters on each side is roped off. How many square meters of "
+                  "the field are left for the game?"),
+        steps=[
+            "Field area: {length} × {width} = {field_area} square meters",
+            "Practice area: {side} × {side} = {square_area} square meters",
+            "Area left: {field_area} - {square_area} = {remaining} square meters",
+        ],
+    ),
+    Template(
+        "geometry and spatial reasoning", "space and astronomy",
+        ranges={
+            "5-8": {"length": (3, 15), "width": (2, 12), "height": (2, 10)},
+        },
+        derived=[
+            ("top", lambda v: 2 * v["length"] * v["width"]),
+            ("front", lambda v: 2 * v["length"] * v["height"]),
+            ("side_faces", lambda v: 2 * v["width"] * v["height"]),
+            ("surface", lambda v: v["top"] + v["front"] + v["side_faces"]),
+        ],
+        answer="surface",
+        question=("A cargo crate on a space station is a box {length} m long, {width} m wide and "
+                  "{height} m tall. How many square meters of heat shield are needed to cover all "
+                  "six faces?"),
+        steps=[
+            "Top and bottom: 2 × {length} × {width} = {top} square meters",
+            "Front and back: 2 × {length} × {height} = {front} square meters",
+            "Left and right: 2 × {width} × {height} = {side_faces} square meters",
+            "Total: {top} + {front} + {side_faces} = {surface} square meters",
+        ],
+    ),
+
+    # Number theory and patterns
+    Template(
+        "number theory and patterns", "space and astronomy",
+        ranges={
+            "1-2": {"start": (0, 20), "step": (2, 5), "counts": (2, 6)},
+        },
+        derived=[
+            ("added", lambda v: v["step"] * v["counts"]),
+            ("end", lambda v: v["start"] + v["added"]),
+        ],
+        answer="end",
+        question=("Mia counts stars by {step}s, starting at {start}. What number does she say after "
+                  "{counts} more counts?"),
+        steps=[
+            "Each count adds {step}, so {counts} counts add {added}",
+            "{start} + {added} = {end}",
+        ],
+    ),
+    Template(
+        "number theory and patterns", "animals and nature",
+        ranges={
+            "3-5": {"first": (5, 20), "grow": (2, 5), "jumps": (3, 8)},
+            "5-8": {"first": (10, 60), "grow": (2, 12), "jumps": (5, 20)},
+        },
+        derived=[
+            ("gaps", lambda v: v["jumps"] - 1),
+            ("last", lambda v: v["first"] + v["gaps"] * v["grow"]),
+            ("pair_sum", lambda v: v["first"] + v["last"]),
+            ("total", lambda v: v["jumps"] * v["pair_sum"] // 2),
+        ],
+        answer="total",
+        question=("A frog's first jump is {first} cm long, and every jump after that is {grow} cm "
+                  "longer than the one before. How many centimeters has it jumped in total after "
+                  "{jumps} jumps?"),
+        steps=[
+            "Jump lengths go up by {grow} cm each time",
+            "Last jump: {first} + {gaps} × {grow} = {last} cm",
+            "Total: {jumps} × ({first} + {last}) ÷ 2 = {total} cm",
+        ],
+    ),
+    Template(
+        "number theory and patterns", "technology and gaming",
+        ranges={
+            "3-5": {"size": (3, 9), "boxes": (4, 30), "raw": (0, 99)},
+            "5-8": {"size": (7, 24), "boxes": (15, 90), "raw": (0, 999)},
+        },
+        derived=[
+            ("left", lambda v: v["raw"] % (v["size"] - 1) + 1),
+            ("packed", lambda v: v["size"] * v["boxes"]),
+            ("robots", lambda v: v["packed"] + v["left"]),
+        ],
+        answer="left",
+        question=("A factory makes {robots} toy robots and packs them into boxes of {size}. Only full "
+                  "boxes are shipped. How many robots are left over?"),
+        steps=[
+            "{robots} ÷ {size} = {boxes} full boxes",
+            "Robots in full boxes: {boxes} × {size} = {packed}",
+            "Left over: {robots} - {packed} = {left} robots",
+        ],
+    ),
+
+    # Logic puzzles with constraints
+    Template(
+        "logic puzzles with constraints", "animals and nature",
+        ranges={
+            "1-2": {"cats": (2, 20), "more": (2, 10)},
+            "3-5": {"cats": (15, 150), "more": (5, 60)},
+        },
+        derived=[
+            ("dogs", lambda v: v["cats"] + v["more"]),
+            ("total", lambda v: v["dogs"] + v["cats"]),
+            ("even", lambda v: v["total"] - v["more"]),
+        ],
+        answer="cats",
+        question=("An animal shelter has {total} dogs and cats. There are {more} more dogs than cats. "
+                  "How many cats are at the shelter?"),
+        steps=[
+            "Take away the {more} extra dogs: {total} - {more} = {even}",
+            "Now there are equal dogs and cats: {even} ÷ 2 = {cats} cats",
+        ],
+    ),
+    Template(
+        "logic puzzles with constraints", "sports and games",
+        ranges={
+            "5-8": {"each": (10, 40), "moved_ab": (2, 9), "moved_bc": (2, 9)},
+        },
+        derived=[
+            ("total", lambda v: 3 * v["each"]),
+            ("gained", lambda v: v["each"] - v["moved_ab"]),
+            ("b_start", lambda v: v["gained"] + v["moved_bc"]),
+        ],
+        answer="b_start",
+        question=("Three teams share {total} players. {moved_ab} players move from Team A to Team B, "
+                  "then {moved_bc} players move from Team B to Team C. Now all three teams have the "
+                  "same number of players. How many players did Team B start with?"),
+        steps=[
+            "At the end each team has {total} ÷ 3 = {each} players",
+            "Undo the move to Team C: Team B had {each} + {moved_bc} before it",
+            "Undo the move from Team A: Team B started with {each} + {moved_bc} - {moved_ab} = {b_start} players",
+        ],
+    ),
+
+    # Combinatorics and counting
+    Template(
+        "combinatorics and counting", "cooking and recipes",
+        ranges={
+            "1-2": {"breads": (2, 4), "fillings": (2, 4)},
+            "3-5": {"breads": (3, 8), "fillings": (4, 12)},
+        },
+        derived=[("sandwiches", lambda v: v["breads"] * v["fillings"])],
+        answer="sandwiches",
+        question=("A sandwich shop offers {breads} kinds of bread and {fillings} fillings. How many "
+                  "different sandwiches can you make with one bread and one filling?"),
+        steps=[
+            "Each bread can go with any of the {fillings} fillings",
+            "{breads} × {fillings} = {sandwiches} different sandwiches",
+        ],
+    ),
+    Template(
+        "combinatorics and counting", "sports and games",
+        ranges={
+            "3-5": {"players": (4, 12)},
+            "5-8": {"players": (8, 40)},
+        },
+        derived=[
+            ("others", lambda v: v["players"] - 1),
+            ("counted_twice", lambda v: v["players"] * v["others"]),
+            ("high_fives", lambda v: v["counted_twice"] // 2),
+        ],
+        answer="high_fives",
+        question=("After the game, each of the {players} players on a team high-fives every other "
+                  "player exactly once. How many high-fives happen?"),
+        steps=[
+            "Each player high-fives {others} teammates",
+            "{players} × {others} = {counted_twice}, but that counts every high-five twice",
+            "{counted_twice} ÷ 2 = {high_fives} high-fives",
+        ],
+    ),
+    Template(
+        "combinatorics and counting", "art and music",
+        ranges={
+            "5-8": {"musicians": (4, 15)},
+        },
+        derived=[
+            ("after_singer", lambda v: v["musicians"] - 1),
+            ("after_guitar", lambda v: v["musicians"] - 2),
+            ("lineups", lambda v: v["musicians"] * v["after_singer"] * v["after_guitar"]),
+        ],
+        answer="lineups",
+        question=("A school band has {musicians} musicians. They need a singer, a guitarist and a "
+                  "drummer, and no one can fill two roles. In how many different ways can the three "
+                  "roles be filled?"),
+        steps=[
+            "The singer can be any of {musicians} musicians",
+            "The guitarist can be any of the remaining {after_singer}",
+            "The drummer can be any of the remaining {after_guitar}",
+            "{musicians} × {after_singer} × {after_guitar} = {lineups} ways",
+        ],
+    ),
+]
+
+# (grade_level, problem_type) -> templates, with None as the "any type" key
+_TEMPLATE_INDEX = {}
+for _template in TEMPLATES:
+    for _grade in _template.grade_levels:
+        _TEMPLATE_INDEX.setdefault((_grade, None), []).append(_template)
+        _TEMPLATE_INDEX.setdefault((_grade, _template.problem_type), []).append(_template)
+
+
+def templates_for(grade_level, problem_type=None):
+    """Templates suited to the grade (and type, if given); unknown grades use 5-8"""
+    if grade_level not in GRADE_DESCRIPTIONS:
+        grade_level = "5-8"
+    templates = _TEMPLATE_INDEX.get((grade_level, problem_type))
+    if not templates:
+        # No template of that type for this grade; any type will do
+        templates = _TEMPLATE_INDEX[(grade_level, None)]
+    return templates
+
+
+def generate_template_problem(grade_level="5-8", problem_type=None, rng=None, seed=None):
+    """Generate a word problem locally; the same seed always gives the same problem"""
+    if rng is None:
+        rng = random.Random(seed) if seed is not None else random
+    if grade_level not in GRADE_DESCRIPTIONS:
+        grade_level = "5-8"
+    template = rng.choice(templates_for(grade_level, problem_type))
+    return template.render(template.sample(grade_level, rng))
+
+
+if __name__ == "__main__":
+    count = 20000
+    rng = random.Random(0)
+    started = time.perf_counter()
+    for i in range(count):
+        generate_template_problem(("1-2", "3-5", "5-8")[i % 3], rng=rng)
+    elapsed = time.perf_counter() - started
+    print(f"Generated {count} problems in {elapsed:.3f}s ({count / elapsed:,.0f} problems/s)")
+    print(f"Problem types covered: {sorted({t.problem_type for t in TEMPLATES}) == sorted(PROBLEM_TYPES)}")
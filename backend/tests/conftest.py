@@ -0,0 +1,21 @@
+"""Point the server's data files at a scratch directory before any test imports it
+
+Without this, importing challenge_server opens the developer's backend/data
+databases, and an OPENAI_API_KEY from the environment or .env would make the
+tests call the real API.
+"""
+import os
+import shutil
+import tempfile
+
+TEST_DATA_DIR = tempfile.mkdtemp(prefix="math-challenge-tests-")
+
+for name, file_name in (("CORPUS_PATH", "corpus.db"), ("QUARANTINE_PATH", "quarantine.db"),
+                        ("PROBLEM_STORE_PATH", "problems.db"), ("DEDUP_PATH", "near_duplicates.npz")):
+    os.environ[name] = os.path.join(TEST_DATA_DIR, file_name)
+# Empty rather than unset, so load_dotenv doesn't fill it in from .env
+os.environ["OPENAI_API_KEY"] = ""
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(TEST_DATA_DIR, ignore_errors=True)
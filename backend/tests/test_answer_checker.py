@@ -0,0 +1,73 @@
+from collections import OrderedDict
+
+import pytest
+
+import answer_checker
+from answer_checker import check_answer, parse_answer
+
+
+@pytest.mark.parametrize("user_answer, correct_answer", [
+    ("93", 93),
+    (93.0, 93),
+    ("3/4", 0.75),
+    ("0.75", "3/4"),
+    ("75%", 0.75),
+    ("75%", 75),
+    ("$31", 31),
+    ("-$3.50", -3.5),
+    ("2.1 kg", 2.1),
+    ("1,250", 1250),
+    ("1 1/2", 1.5),
+    (".5", 0.5),
+    ("0.33", "1/3"),
+    ("1/3", 0.33),
+    ("24.38", 24.375),
+    (0.1 + 0.2, 0.3),
+    ("1000000000001", 1000000000001),
+    ("7.", 7),
+    ("$-3", -3),
+    ("1e3", 1000),
+    ("2.5e-1", 0.25),
+    ("3 eggs", 3),
+])
+def test_accepted_answers(user_answer, correct_answer):
+    assert check_answer(user_answer, correct_answer) is True
+
+
+@pytest.mark.parametrize("user_answer, correct_answer", [
+    ("92", 93),
+    ("6.004", 6),
+    ("0.3", "1/3"),
+    ("24.4", 24.375),
+    ("3", 0.3),
+])
+def test_rejected_answers(user_answer, correct_answer):
+    assert check_answer(user_answer, correct_answer) is False
+
+
+@pytest.mark.parametrize("user_answer", ["", "no idea", "1/0", "1.5/3", "3..4", ".", "-$-3", "1e999", "1e3/2",
+                                         "1" * 5000, "1/" + "2" * 5000, "¹²"])
+def test_unreadable_answers(user_answer):
+    assert check_answer(user_answer, 1) is None
+
+
+def test_parse_keeps_exact_value_and_places():
+    parsed = parse_answer("24.375")
+    assert (parsed.numerator, parsed.denominator, parsed.places) == (24375, 1000, 3)
+    assert parse_answer("3/4").places is None
+
+
+def test_correct_answer_is_cached_per_problem():
+    assert check_answer("12", 12, problem_id=-1) is True
+    # The cached parse for the ID wins over a (changed) stored answer
+    assert check_answer("12", 13, problem_id=-1) is True
+
+
+def test_correct_answer_cache_is_lru(monkeypatch):
+    monkeypatch.setattr(answer_checker, "CORRECT_ANSWER_CACHE_SIZE", 2)
+    monkeypatch.setattr(answer_checker, "_correct_answers", OrderedDict())
+    check_answer("1", 1, problem_id=-11)
+    check_answer("2", 2, problem_id=-12)
+    check_answer("1", 1, problem_id=-11)  # a hit makes -11 the most recent
+    check_answer("3", 3, problem_id=-13)
+    assert list(answer_checker._correct_answers) == [-11, -13]
@@ -0,0 +1,34 @@
+import json
+
+from bulk_generate import generate_bulk, generate_chunk, write_bulk
+
+
+def test_chunk_answers_match_template_engine():
+    problems = generate_chunk("5-8", "combinatorics and counting", 500, seed=3)
+    assert len(problems) == 500
+    for problem in problems:
+        assert problem["grade_level"] == "5-8"
+        assert problem["problem_type"] == "combinatorics and counting"
+        assert isinstance(problem["answer"], int)
+        # The final step of every explanation states the answer
+        assert f"= {problem['answer']}" in problem["explanation"].splitlines()[-1]
+
+
+def test_output_is_reproducible_across_worker_counts():
+    def collect(workers):
+        return [problem["question"]
+                for chunk in generate_bulk(30, grade_levels=("1-2", "3-5"), seed=11,
+                                           chunk_size=7, workers=workers)
+                for problem in chunk]
+
+    serial = collect(workers=1)
+    assert len(serial) == 2 * 6 * 30
+    assert collect(workers=2) == serial
+
+
+def test_write_jsonl(tmp_path):
+    path = tmp_path / "problems.jsonl"
+    written = write_bulk(str(path), 5, grade_levels=("3-5",), problem_types=("ratios and proportions",))
+    lines = path.read_text().splitlines()
+    assert written == len(lines) == 5
+    assert json.loads(lines[0])["grade_level"] == "3-5"
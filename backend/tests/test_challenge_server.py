@@ -1,82 +1,248 @@
+import asyncio
+import json
+import os
 import pytest
 from fastapi.testclient import TestClient
-from challenge_server import app, active_problems
+import challenge_server
+from challenge_server import app, problem_store
 
 client = TestClient(app)
 
 def test_get_problem():
-    response = client.get("/problem")
+    response = client.get("/api/problem", params={"grade_level": "3-5"})
     assert response.status_code == 200
-    
+
     data = response.json()
     assert "problem_id" in data
-    assert "question" in data
-    
-    # Verify problem format (should be "X + Y")
-    question = data["question"]
-    parts = question.split(" + ")
-    assert len(parts) == 2
-    assert all(part.isdigit() for part in parts)
-    assert 1 <= int(parts[0]) <= 10
-    assert 1 <= int(parts[1]) <= 10
+    assert data["question"]
+    assert problem_store.get(data["problem_id"]) is not None
 
 def test_check_correct_answer():
-    # First get a problem
-    problem_response = client.get("/problem")
-    problem_data = problem_response.json()
-    problem_id = problem_data["problem_id"]
-    
-    # Calculate correct answer from the question
-    question = problem_data["question"]
-    num1, num2 = map(int, question.split(" + "))
-    correct_answer = num1 + num2
-    
-    # Submit correct answer
-    response = client.post("/check_answer", json={
+    problem_id = client.get("/api/problem", params={"grade_level": "3-5"}).json()["problem_id"]
+    correct_answer = problem_store.get(problem_id).answer
+
+    response = client.post("/api/check_answer", json={
         "problem_id": problem_id,
         "user_answer": correct_answer
     })
-    
+
     assert response.status_code == 200
     data = response.json()
     assert data["correct"] is True
     assert data["correct_answer"] == correct_answer
 
 def test_check_wrong_answer():
-    # Get a problem
-    problem_response = client.get("/problem")
-    problem_data = problem_response.json()
-    problem_id = problem_data["problem_id"]
-    
-    # Calculate correct answer and submit wrong answer
-    question = problem_data["question"]
-    num1, num2 = map(int, question.split(" + "))
-    correct_answer = num1 + num2
-    wrong_answer = correct_answer + 1
-    
-    response = client.post("/check_answer", json={
+    problem_id = client.get("/api/problem", params={"grade_level": "3-5"}).json()["problem_id"]
+    correct_answer = problem_store.get(problem_id).answer
+
+    response = client.post("/api/check_answer", json={
         "problem_id": problem_id,
-        "user_answer": wrong_answer
+        "user_answer": correct_answer + 1
     })
-    
+
     assert response.status_code == 200
     data = response.json()
     assert data["correct"] is False
     assert data["correct_answer"] == correct_answer
 
 def test_invalid_problem_id():
-    response = client.post("/check_answer", json={
+    response = client.post("/api/check_answer", json={
         "problem_id": 99999,  # Non-existent problem ID
         "user_answer": 42
     })
-    
+
     assert response.status_code == 200
     data = response.json()
     assert data["status"] == "error"
     assert data["message"] == "Invalid problem ID"
 
+def test_get_problems_streams_ndjson_batch():
+    response = client.get("/api/problems", params={"grade_level": "3-5", "count": 3})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    problems = [json.loads(line) for line in response.text.splitlines()]
+    assert len(problems) == 3
+    assert len({problem["problem_id"] for problem in problems}) == 3
+    assert all("question" in problem for problem in problems)
+
+def test_stream_problem_ends_with_stored_problem():
+    response = client.get("/api/problem/stream", params={"grade_level": "1-2"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    kind, problem = sse_events(response)[-1]
+    assert kind == "problem"
+    assert problem_store.get(problem["problem_id"]) is not None
+
+def test_checked_answers_feed_session_skill():
+    problem_id = client.get("/api/problem", params={"grade_level": "3-5", "session_id": "s1"}).json()["problem_id"]
+    client.post("/api/check_answer", json={"problem_id": problem_id, "user_answer": "-1", "session_id": "s1"})
+
+    skill = client.get("/api/skill", params={"session_id": "s1"}).json()
+    assert skill["attempts"] == 1
+    assert skill["recent"][0]["problem_id"] == problem_id
+    assert skill["recent"][0]["correct"] is False
+    assert client.get("/api/skill", params={"session_id": "nobody"}).json()["status"] == "error"
+
+def test_ready_only_after_warm_up(monkeypatch, tmp_path):
+    monkeypatch.setattr(challenge_server, "PROBLEM_GENERATOR", "template")
+    monkeypatch.setattr(challenge_server, "DEDUP_PATH", str(tmp_path / "near_duplicates.npz"))
+    monkeypatch.setattr(challenge_server, "dedup_index", None)
+    monkeypatch.setitem(challenge_server.startup_report, "ready_seconds", None)
+    assert client.get("/api/health").status_code == 200
+    assert client.get("/api/ready").status_code == 503
+
+    asyncio.run(challenge_server.warm_up())
+    response = client.get("/api/ready")
+    assert response.status_code == 200
+    assert response.json()["import_seconds"] > 0
+    assert response.json()["pid"] == os.getpid()
+    assert client.get("/api/dedup/stats").json()["loaded"] is True
+
+def test_near_duplicates_are_not_kept(monkeypatch):
+    from near_duplicates import NearDuplicateIndex
+    monkeypatch.setattr(challenge_server, "dedup_index", NearDuplicateIndex(capacity=100))
+    kept = []
+    monkeypatch.setattr(challenge_server.problem_corpus, "add", lambda problem, grade: kept.append(problem))
+    question = "A train leaves at 3 pm and travels 60 miles each hour. How far has it gone by 5:30 pm?"
+    first = {"question": question, "source": "openai"}
+    again = {"question": question.replace("each", "every"), "source": "openai"}
+
+    assert not challenge_server.is_near_duplicate("5-8", first)
+    assert challenge_server.is_near_duplicate("5-8", again)
+    assert again["near_duplicate"] >= 0.5
+    challenge_server.record_generated("5-8", first)
+    challenge_server.record_generated("5-8", again)
+    challenge_server.disk_writer.submit(lambda: None).result()  # wait for queued writes
+    assert kept == [first]
+
+def test_unconfirmed_refills_are_discarded(monkeypatch):
+    from problem_pool import DISCARDED
+    if challenge_server.verification_pipeline._verifier is None:
+        pytest.skip("verification is off")
+    problem = {"question": "How many shirts?", "answer": 93, "explanation": "Three shirts at $31 each.",
+               "source": "openai"}
+
+    async def request(grade_level, priority, timeout=None, problem_type=None):
+        return dict(problem)
+
+    monkeypatch.setattr(challenge_server, "PROBLEM_GENERATOR", "openai")
+    monkeypatch.setattr(challenge_server, "needs_openai_key", False)
+    monkeypatch.setattr(challenge_server, "dedup_index", None)
+    monkeypatch.setattr(challenge_server.generation_scheduler, "request", request)
+
+    async def scenario():
+        try:
+            return await challenge_server.refill_problem("5-8")
+        finally:
+            await challenge_server.verification_pipeline.stop()
+
+    assert asyncio.run(scenario()) is DISCARDED
+
+def test_router_stats_list_configured_backends():
+    stats = client.get("/api/router/stats").json()
+    assert list(stats["backends"]) == [backend.name for backend in challenge_server.generation_router.backends]
+    assert all(backend["state"] == "closed" for backend in stats["backends"].values())
+
+def test_pool_is_seeded_from_corpus_off_the_event_loop(monkeypatch, tmp_path):
+    from problem_corpus import ProblemCorpus
+    from problem_pool import ProblemPool
+    corpus = ProblemCorpus(tmp_path / "corpus.db")
+    for n in range(5):
+        corpus.add({"question": f"How many rockets, part {n}?", "answer": n, "explanation": "1. 2 + 2 = 4"}, "3-5")
+    pool = ProblemPool(None, depth=3)
+    monkeypatch.setattr(challenge_server, "problem_corpus", corpus)
+    monkeypatch.setattr(challenge_server, "problem_pool", pool)
+    monkeypatch.setattr(challenge_server, "POOL_ENABLED", True)
+    loads_on_loop = []
+    load = corpus.load
+
+    def load_off_loop(row_id):
+        try:
+            asyncio.get_running_loop()
+            loads_on_loop.append(row_id)
+        except RuntimeError:
+            pass
+        return load(row_id)
+
+    monkeypatch.setattr(corpus, "load", load_off_loop)
+    assert asyncio.run(challenge_server.seed_pool_from_corpus()) == 3
+    assert pool.size("3-5") == 3 and pool.size("5-8") == 0
+    assert len({pool.take("3-5")["question"] for _ in range(3)}) == 3
+    assert loads_on_loop == []
+    corpus.close()
+
+def sse_events(response):
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        event, data = block.split("\n")
+        events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+@pytest.fixture
+def streaming(monkeypatch):
+    """Make /api/problem/stream generate, with a stand-in for the OpenAI stream"""
+    async def nothing_ready(*args):
+        return None
+
+    async def from_templates(grade_level, problem_type=None, priority=None):
+        return challenge_server.generate_template_problem(grade_level, problem_type)
+
+    monkeypatch.setattr(challenge_server, "PROBLEM_GENERATOR", "openai")
+    monkeypatch.setattr(challenge_server, "get_async_client", lambda: object())
+    monkeypatch.setattr(challenge_server, "take_ready_problem", nothing_ready)
+    monkeypatch.setattr(challenge_server, "generate_and_record", from_templates)
+    backend = challenge_server.generation_router.backend(challenge_server.STREAM_BACKEND)
+    monkeypatch.setattr(backend, "window", type(backend.window)())
+    monkeypatch.setattr(backend, "breaker", type(backend.breaker)())
+    return backend
+
+def test_failed_streams_count_towards_the_backend_breaker(monkeypatch, streaming):
+    async def failing_stream(grade_level, problem_type=None):
+        raise RuntimeError("upstream 500")
+        yield
+
+    outcomes = []
+    monkeypatch.setattr(challenge_server, "stream_word_problem", failing_stream)
+    monkeypatch.setattr(challenge_server.generation_router, "_on_result",
+                        lambda name, outcome, seconds: outcomes.append((name, outcome)))
+    for _ in range(streaming.breaker.consecutive_failures):
+        kind, problem = sse_events(client.get("/api/problem/stream"))[-1]
+        # Failed before the question went out, so the problem comes from the normal path
+        assert kind == "problem" and problem_store.get(problem["problem_id"]) is not None
+    assert ("openai:" + challenge_server.OPENAI_MODEL, "error") in outcomes
+    assert streaming.breaker.state == "open"
+    assert streaming.window.error_rate()[0] == 1.0
+
+def test_stream_falls_back_with_a_reason_when_backend_not_configured(monkeypatch, streaming, caplog):
+    monkeypatch.setattr(challenge_server, "STREAM_BACKEND", "openai:not-configured")
+    caplog.set_level("INFO", logger="challenge_server")
+    events = sse_events(client.get("/api/problem/stream"))
+    assert [kind for kind, _ in events] == ["problem"]
+    assert "openai:not-configured is not in GENERATION_BACKENDS" in caplog.text
+
+def test_quarantine_is_read_off_the_event_loop(monkeypatch):
+    quarantine = challenge_server.problem_quarantine
+    quarantine.add("5-8", {"question": "Q", "answer": 94}, "step 31 * 3 = 94 should be 93")
+    on_loop = []
+    recent = quarantine.recent
+
+    def recent_off_loop(limit):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(True)
+        except RuntimeError:
+            on_loop.append(False)
+        return recent(limit)
+
+    monkeypatch.setattr(quarantine, "recent", recent_off_loop)
+    assert client.get("/api/verification/stats").json()["quarantine"]["size"] >= 1
+    assert client.get("/api/quarantine", params={"limit": 1}).json()[0]["problem"]["answer"] == 94
+    assert on_loop == [False]
+
 @pytest.fixture(autouse=True)
 def clear_active_problems():
-    """Clear active_problems before each test"""
-    active_problems.clear()
+    """Clear the problem store before each test"""
+    problem_store.clear()
     yield 
\ No newline at end of file
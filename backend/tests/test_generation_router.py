@@ -0,0 +1,219 @@
+import asyncio
+import random
+
+import pytest
+
+from generation_router import (CLOSED, HALF_OPEN, OPEN, Backend, BackendUnavailable, CircuitBreaker,
+                               GenerationRouter, LatencyWindow, parse_backends)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ServerError(Exception):
+    status_code = 500
+
+
+def backend(name, delay=0.0, error=None, budget=0.05, **kwargs):
+    calls = []
+
+    async def generate(grade_level, problem_type=None):
+        calls.append(grade_level)
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return {"question": f"from {name}"}
+
+    result = Backend(name, generate, budget=budget, min_budget=0.01, **kwargs)
+    result.test_calls = calls
+    return result
+
+
+def test_latency_window_percentiles_and_horizon():
+    clock = FakeClock()
+    window = LatencyWindow(size=100, horizon=60.0, clock=clock)
+    for seconds in range(1, 21):
+        window.add(float(seconds), ok=True)
+    window.add(0.5, ok=False)
+    assert window.p95() == 20.0
+    assert window.percentile(0.5) == 11.0
+    assert window.error_rate() == (1 / 21, 21)
+
+    clock.now += 61
+    assert window.error_rate() == (0.0, 0)
+    assert window.p95() is None
+
+
+def test_cancelled_calls_are_censored_latency_samples():
+    window = LatencyWindow()
+    for seconds in range(1, 11):
+        window.add(float(seconds), ok=True)
+    assert window.percentile(0.5) == 6.0
+    # Ten calls cancelled after 20s took longer than every finished one
+    for _ in range(10):
+        window.add_cancelled(20.0)
+    assert window.percentile(0.5) == 20.0
+    assert window.percentile(0.25) == 6.0
+    # A call cancelled early says little about the percentile
+    short = LatencyWindow()
+    for seconds in range(1, 11):
+        short.add(float(seconds), ok=True)
+    short.add_cancelled(0.5)
+    assert short.percentile(0.5) == 6.0
+    assert short.error_rate() == (0.0, 10)
+
+
+def test_hedge_rate_stays_near_five_percent():
+    # Replay what the router does with a stationary latency distribution: a call
+    # over budget is hedged, and if the hedge answers first the slow call is
+    # cancelled after budget + hedge latency
+    clock = FakeClock()
+    rng = random.Random(1)
+    primary = Backend("primary", None, budget=1.0, min_budget=0.001, clock=clock)
+    hedged = calls = 0
+    for i in range(6000):
+        clock.now += 0.05
+        budget = primary.latency_budget()
+        latency = rng.lognormvariate(-3.5, 1.0)
+        if latency > budget:
+            hedge_latency = rng.lognormvariate(-3.5, 1.0)
+            if budget + hedge_latency < latency:
+                primary.record_cancelled(budget + hedge_latency)
+            else:
+                primary.record(latency, ok=True)
+        else:
+            primary.record(latency, ok=True)
+        if i >= 1000:
+            calls += 1
+            hedged += latency > budget
+    assert 0.03 < hedged / calls < 0.07
+
+
+def test_fast_primary_is_not_hedged():
+    primary, secondary = backend("primary", delay=0.0), backend("secondary")
+    router = GenerationRouter([primary, secondary])
+    problem = asyncio.run(router.generate("3-5"))
+    assert problem["backend"] == "primary"
+    assert secondary.test_calls == []
+    assert router.hedges == 0
+
+
+def test_slow_primary_is_hedged_and_cancelled():
+    primary, secondary = backend("primary", delay=5.0, budget=0.05), backend("secondary", delay=0.01)
+    router = GenerationRouter([primary, secondary])
+    problem = asyncio.run(asyncio.wait_for(router.generate("3-5"), 1.0))
+    assert problem["backend"] == "secondary"
+    assert router.hedges == 1
+    assert primary.cancelled == 1
+    assert primary.calls == 0  # no outcome for the breaker
+    # ...but its elapsed time is a lower bound on its latency
+    assert len(primary.window) == 1
+    assert primary.window.error_rate() == (0.0, 0)
+    assert primary.window.percentile(0.5) is None
+
+
+def test_error_fails_over_at_once():
+    primary = backend("primary", error=ServerError("boom"), budget=10.0)
+    secondary = backend("secondary", budget=10.0)
+    router = GenerationRouter([primary, secondary])
+    problem = asyncio.run(asyncio.wait_for(router.generate("3-5"), 1.0))
+    assert problem["backend"] == "secondary"
+    assert router.failovers == 1
+    assert primary.errors == 1
+
+
+def test_slow_failure_fails_over_while_hedging_is_capped():
+    primary = backend("primary", delay=0.1, error=ServerError("boom"), budget=0.01)
+    secondary = backend("secondary", budget=10.0)
+    router = GenerationRouter([primary, secondary], hedge_limit=0)
+    problem = asyncio.run(asyncio.wait_for(router.generate("3-5"), 1.0))
+    assert problem["backend"] == "secondary"
+    assert router.hedges_skipped == 1
+    assert router.failovers == 1
+
+
+def test_every_finished_call_is_recorded():
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def waits_then_fails(grade_level, problem_type=None):
+            await gate.wait()
+            raise ServerError("boom")
+
+        async def waits_then_answers(grade_level, problem_type=None):
+            await gate.wait()
+            return {"question": "late"}
+
+        primary = Backend("primary", waits_then_fails, budget=0.01)
+        secondary = Backend("secondary", waits_then_answers, budget=10.0)
+        results = []
+        router = GenerationRouter([primary, secondary],
+                                  on_result=lambda name, outcome, seconds: results.append((name, outcome)))
+        task = asyncio.create_task(router.generate("3-5"))
+        while router.hedges == 0:
+            await asyncio.sleep(0.01)
+        gate.set()
+        return await task, primary, results
+
+    problem, primary, results = asyncio.run(scenario())
+    assert problem["backend"] == "secondary"
+    assert sorted(results) == [("primary", "error"), ("secondary", "ok")]
+    assert primary.errors == 1 and primary.cancelled == 0
+
+
+def test_last_error_is_raised():
+    router = GenerationRouter([backend("only", error=ServerError("boom"))])
+    with pytest.raises(ServerError):
+        asyncio.run(router.generate("3-5"))
+
+
+def test_breaker_opens_skips_and_probes():
+    clock = FakeClock()
+    breaker = CircuitBreaker(consecutive_failures=3, cooldown=30.0, clock=clock)
+    primary = backend("primary", error=ServerError("boom"), breaker=breaker, clock=clock)
+    router = GenerationRouter([primary])
+
+    for _ in range(3):
+        with pytest.raises(ServerError):
+            asyncio.run(router.generate("3-5"))
+    assert breaker.state == OPEN
+    with pytest.raises(BackendUnavailable):
+        asyncio.run(router.generate("3-5"))
+    assert len(primary.test_calls) == 3
+
+    clock.now += 31
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    assert not breaker.allow()  # one probe at a time
+    breaker.record(False, primary.window)
+    assert breaker.state == OPEN and breaker.cooldown == 60.0
+
+    clock.now += 61
+    assert breaker.allow()
+    breaker.record(True, primary.window)
+    assert breaker.state == CLOSED
+
+
+def test_breaker_opens_on_error_rate():
+    clock = FakeClock()
+    window = LatencyWindow(clock=clock)
+    breaker = CircuitBreaker(error_rate=0.5, min_calls=10, consecutive_failures=100, clock=clock)
+    for i in range(10):
+        ok = i % 2 == 0
+        window.add(1.0, ok)
+        breaker.record(ok, window)
+    assert breaker.state == OPEN
+
+
+def test_parse_backends():
+    assert parse_backends("openai:o3-mini, local:llama3@http://localhost:8080/v1,template") == [
+        ("openai", "o3-mini", None),
+        ("local", "llama3", "http://localhost:8080/v1"),
+        ("template", None, None),
+    ]
+    with pytest.raises(ValueError):
+        parse_backends("local:llama3")
@@ -0,0 +1,192 @@
+import asyncio
+
+import time
+
+from generation_scheduler import (BACKGROUND, INTERACTIVE, GenerationScheduler, TokenBucket, is_retryable,
+                                  report_tokens)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+def test_token_bucket_refills_over_time():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, capacity=2.0, clock=clock)
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0.5
+    clock.now += 0.5
+    assert bucket.try_acquire() == 0
+
+
+def test_token_bucket_refunds_and_debts():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1.0, capacity=10.0, clock=clock)
+    assert bucket.try_acquire(10) == 0
+    bucket.refund(8)
+    assert bucket.try_acquire(8) == 0
+    bucket.refund(-4)  # the call cost more than was charged
+    assert bucket.try_acquire(1) == 5.0
+
+
+def test_retryable_errors():
+    assert is_retryable(RateLimited())
+    assert is_retryable(asyncio.TimeoutError())
+    assert not is_retryable(ValueError("bad prompt"))
+
+
+def test_interactive_requests_run_before_background_refills():
+    order = []
+
+    async def generate(grade_level):
+        order.append(grade_level)
+        return {"question": grade_level}
+
+    async def scenario():
+        scheduler = GenerationScheduler(generate, workers=1)
+        background = [asyncio.create_task(scheduler.request(grade, BACKGROUND))
+                      for grade in ("1-2", "3-5", "5-8")]
+        interactive = asyncio.create_task(scheduler.request("3-5", INTERACTIVE))
+        results = await asyncio.gather(interactive, *background)
+        await scheduler.stop()
+        return results
+
+    results = asyncio.run(scenario())
+    assert all(result is not None for result in results)
+    assert order == ["3-5", "1-2", "3-5", "5-8"]
+
+
+def test_timed_out_demand_is_reused():
+    orphans = []
+
+    async def scenario():
+        gate = asyncio.Event()
+        calls = []
+
+        async def generate(grade_level):
+            calls.append(grade_level)
+            await gate.wait()
+            return {"question": f"#{len(calls)}"}
+
+        scheduler = GenerationScheduler(generate, workers=2,
+                                        on_orphan=lambda grade, problem: orphans.append(problem))
+        assert await scheduler.request("5-8", timeout=0.01) is None
+        # The abandoned call is still running, so this request shares it
+        waiting = asyncio.create_task(scheduler.request("5-8"))
+        await asyncio.sleep(0.01)
+        gate.set()
+        result = await waiting
+        stats = scheduler.stats()
+        await scheduler.stop()
+        return result, calls, stats
+
+    result, calls, stats = asyncio.run(scenario())
+    assert result == {"question": "#1"}
+    assert calls == ["5-8"]
+    assert stats["coalesced"] == 1
+    assert stats["timeouts"] == 1
+    assert orphans == []
+
+
+def test_unclaimed_results_are_orphaned():
+    orphans = []
+
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def generate(grade_level):
+            await gate.wait()
+            return {"question": "late"}
+
+        scheduler = GenerationScheduler(generate, workers=1,
+                                        on_orphan=lambda grade, problem: orphans.append((grade, problem)))
+        assert await scheduler.request("3-5", timeout=0.01) is None
+        gate.set()
+        for _ in range(10):
+            await asyncio.sleep(0)
+        await scheduler.stop()
+
+    asyncio.run(scenario())
+    assert orphans == [("3-5", {"question": "late"})]
+
+
+def test_rate_limited_calls_are_retried():
+    attempts = []
+
+    async def generate(grade_level):
+        attempts.append(grade_level)
+        if len(attempts) < 3:
+            raise RateLimited("slow down")
+        return {"question": "ok"}
+
+    async def scenario():
+        scheduler = GenerationScheduler(generate, workers=1, base_delay=0.001, max_delay=0.002)
+        result = await scheduler.request("1-2")
+        stats = scheduler.stats()
+        await scheduler.stop()
+        return result, stats
+
+    result, stats = asyncio.run(scenario())
+    assert result == {"question": "ok"}
+    assert stats["retries"] == 2
+    assert stats["failures"] == 0
+
+
+def test_non_retryable_failure_returns_none():
+    async def generate(grade_level):
+        raise ValueError("bad prompt")
+
+    async def scenario():
+        scheduler = GenerationScheduler(generate, workers=1)
+        result = await scheduler.request("1-2")
+        await scheduler.stop()
+        return result
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_problem_type_is_passed_to_generate():
+    calls = []
+
+    async def generate(grade_level, problem_type=None):
+        calls.append((grade_level, problem_type))
+        return {"question": grade_level, "problem_type": problem_type}
+
+    async def scenario():
+        scheduler = GenerationScheduler(generate, workers=1)
+        typed = await scheduler.request("3-5", problem_type="ratios and proportions")
+        untyped = await scheduler.request("3-5")
+        await scheduler.stop()
+        return typed, untyped
+
+    typed, untyped = asyncio.run(scenario())
+    assert typed["problem_type"] == "ratios and proportions"
+    assert calls == [("3-5", "ratios and proportions"), ("3-5", None)]
+
+
+def test_tpm_charge_is_settled_against_reported_usage():
+    async def generate(grade_level):
+        report_tokens(100)
+        return {"question": grade_level}
+
+    async def scenario():
+        # 1000 tokens/s with a 10000-token burst: without the refund, each
+        # call after the first would wait about 10 seconds for its estimate
+        scheduler = GenerationScheduler(generate, workers=1, tpm=60000, tokens_per_request=10000)
+        started = time.monotonic()
+        for _ in range(3):
+            assert await scheduler.request("3-5") is not None
+        elapsed = time.monotonic() - started
+        await scheduler.stop()
+        return elapsed
+
+    assert asyncio.run(scenario()) < 2
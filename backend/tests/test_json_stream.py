@@ -0,0 +1,187 @@
+import asyncio
+import contextlib
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import problem_generator
+from json_stream import StreamingFieldParser
+
+PROBLEM = {
+    "question": "Sam has 3 \"big\" boxes\nwith {4} pens each. How many pens?",
+    "answer": 12,
+    "explanation": "1. 3 × 4 = 12",
+}
+
+
+def test_question_is_reported_at_every_chunk_boundary():
+    text = "```json\n" + json.dumps(PROBLEM, ensure_ascii=False) + "\n```"
+    for split in range(len(text)):
+        parser = StreamingFieldParser()
+        completed = parser.feed(text[:split]) + parser.feed(text[split:])
+        assert completed == [("question", PROBLEM["question"]), ("explanation", PROBLEM["explanation"])]
+
+
+def test_question_is_reported_when_it_closes():
+    parser = StreamingFieldParser()
+    assert parser.feed('{"question": "How many') == []
+    assert parser.feed(' apples?"') == [("question", "How many apples?")]
+    assert parser.feed(', "answer": 4, "explan') == []
+    assert parser.fields == {"question": "How many apples?"}
+
+
+def test_nested_values_are_skipped():
+    parser = StreamingFieldParser()
+    completed = parser.feed('{"meta": {"question": "inner"}, "tags": ["a", "b"], "question": "outer"}')
+    assert completed == [("question", "outer")]
+
+
+class FakeStream:
+    def __init__(self, deltas):
+        self._deltas = iter(deltas)
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            delta = next(self._deltas)
+        except StopIteration:
+            raise StopAsyncIteration
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+
+    async def close(self):
+        self.closed = True
+
+
+def test_stream_word_problem_yields_question_before_problem(monkeypatch):
+    text = json.dumps(PROBLEM)
+    stream = FakeStream([text[i:i + 7] for i in range(0, len(text), 7)])
+
+    async def create(**kwargs):
+        assert kwargs["stream"] is True
+        return stream
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(problem_generator, "get_async_client", lambda: client)
+
+    async def collect():
+        return [event async for event in problem_generator.stream_word_problem("3-5")]
+
+    events = asyncio.run(collect())
+    assert events[0] == ("question", PROBLEM["question"])
+    kind, problem = events[-1]
+    assert kind == "problem"
+    assert problem["answer"] == 12
+    assert stream.closed
+
+
+def fake_client(create):
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def test_abandoned_stream_is_closed_by_aclosing(monkeypatch):
+    text = json.dumps(PROBLEM)
+    stream = FakeStream([text[i:i + 7] for i in range(0, len(text), 7)])
+
+    async def create(**kwargs):
+        return stream
+
+    monkeypatch.setattr(problem_generator, "get_async_client", lambda: fake_client(create))
+
+    async def first_event():
+        async with contextlib.aclosing(problem_generator.stream_word_problem("3-5")) as events:
+            async for event in events:
+                return event
+
+    assert asyncio.run(first_event())[0] == "question"
+    assert stream.closed
+
+
+def test_failed_stream_request_is_counted(monkeypatch):
+    async def create(**kwargs):
+        raise ConnectionError("refused")
+
+    monkeypatch.setattr(problem_generator, "get_async_client", lambda: fake_client(create))
+    model = problem_generator.OPENAI_MODEL
+    before = problem_generator.OPENAI_REQUESTS.value(model, "error")
+
+    async def collect():
+        return [event async for event in problem_generator.stream_word_problem("3-5")]
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(collect())
+    assert problem_generator.OPENAI_REQUESTS.value(model, "error") == before + 1
+
+
+class StalledStream(FakeStream):
+    """Sends its first chunk, then goes quiet"""
+
+    def __init__(self, deltas):
+        super().__init__(deltas)
+        self._sent = False
+
+    async def __anext__(self):
+        if self._sent:
+            await asyncio.sleep(10)
+        self._sent = True
+        return await super().__anext__()
+
+
+def test_mid_stream_timeout_is_counted_as_a_timeout(monkeypatch):
+    stream = StalledStream(['{"question": "How many'])
+
+    async def create(**kwargs):
+        return stream
+
+    monkeypatch.setattr(problem_generator, "get_async_client", lambda: fake_client(create))
+    monkeypatch.setattr(problem_generator, "OPENAI_TIMEOUT", 0.05)
+    model = problem_generator.OPENAI_MODEL
+    timeouts = problem_generator.OPENAI_REQUESTS.value(model, "timeout")
+    errors = problem_generator.OPENAI_REQUESTS.value(model, "error")
+    observed = problem_generator.OPENAI_REQUEST_SECONDS.count(model)
+
+    async def collect():
+        return [event async for event in problem_generator.stream_word_problem("3-5")]
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(collect())
+    assert problem_generator.OPENAI_REQUESTS.value(model, "timeout") == timeouts + 1
+    assert problem_generator.OPENAI_REQUESTS.value(model, "error") == errors
+    # Failed calls are in the latency histogram too
+    assert problem_generator.OPENAI_REQUEST_SECONDS.count(model) == observed + 1
+    assert stream.closed
+
+
+def test_each_backend_has_its_own_concurrency_limit(monkeypatch):
+    monkeypatch.setattr(problem_generator, "OPENAI_MAX_CONCURRENCY", 1)
+    monkeypatch.setattr(problem_generator, "_generation_slots", {})
+    release = asyncio.Event()
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs["model"])
+        if len(calls) == 1:
+            await release.wait()
+        return SimpleNamespace(usage=None, model=kwargs["model"])
+
+    client = fake_client(create)
+
+    async def scenario():
+        busy = asyncio.create_task(problem_generator._create_completion(client, 5, model="busy"))
+        await asyncio.sleep(0)
+        # The busy backend's only slot is taken; other backends still get theirs
+        local = await problem_generator._create_completion(client, 1, base_url="http://localhost:8080/v1",
+                                                           model="busy")
+        other = await problem_generator._create_completion(client, 1, model="other")
+        with pytest.raises(asyncio.TimeoutError):
+            await problem_generator._create_completion(client, 0.05, model="busy")
+        release.set()
+        await busy
+        return local.model, other.model
+
+    assert asyncio.run(scenario()) == ("busy", "other")
+    # The last call never got past the busy backend's slot
+    assert calls == ["busy", "busy", "other"]
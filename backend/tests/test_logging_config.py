@@ -0,0 +1,51 @@
+import io
+import json
+import logging
+import queue
+
+from logging_config import (DroppingQueueHandler, SamplingFilter, configure_logging, parse_module_levels,
+                            shutdown_logging)
+
+
+def make_record(level, message="hello"):
+    return logging.LogRecord("test", level, __file__, 1, message, None, None)
+
+
+def test_parse_module_levels():
+    assert parse_module_levels("problem_generator=debug, httpx=WARNING,") == {
+        "problem_generator": "DEBUG", "httpx": "WARNING"}
+    assert parse_module_levels(None) == {}
+
+
+def test_sampling_never_drops_warnings():
+    sampler = SamplingFilter(0.0)
+    assert not sampler.filter(make_record(logging.INFO))
+    assert sampler.filter(make_record(logging.WARNING))
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(1))
+    handler.handle(make_record(logging.INFO))
+    handler.handle(make_record(logging.INFO))
+    assert handler.dropped == 1
+
+
+def test_records_are_written_by_the_listener():
+    stream = io.StringIO()
+    root = logging.getLogger()
+    saved_handlers, saved_level = list(root.handlers), root.level
+    try:
+        configure_logging(level="INFO", module_levels={"noisy": "ERROR"}, fmt="json", stream=stream)
+        logging.getLogger("quiet").info("kept %s", "this")
+        logging.getLogger("quiet").debug("below the root level")
+        logging.getLogger("noisy").warning("below the module level")
+        shutdown_logging()
+    finally:
+        root.handlers[:] = saved_handlers
+        root.setLevel(saved_level)
+        logging.getLogger("noisy").setLevel(logging.NOTSET)
+
+    [line] = stream.getvalue().splitlines()
+    entry = json.loads(line)
+    assert entry["logger"] == "quiet"
+    assert entry["message"] == "kept this"
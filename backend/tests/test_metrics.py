@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from metrics import Counter, EventLoopLagMonitor, Gauge, Histogram, Metric, RouteMetricsMiddleware
+
+
+def test_counter_renders_labelled_series():
+    requests = Counter("requests_total", "Requests", ["route"])
+    requests.inc("/a")
+    requests.inc("/a", amount=2)
+    requests.inc('/b"')
+    lines = requests.render()
+    assert lines[:2] == ["# HELP requests_total Requests", "# TYPE requests_total counter"]
+    assert 'requests_total{route="/a"} 3' in lines
+    assert 'requests_total{route="/b\\""} 1' in lines
+
+
+def test_histogram_buckets_are_cumulative():
+    latency = Histogram("latency_seconds", "Latency", ["stage"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        latency.observe("parse", value=value)
+    lines = latency.render()
+    assert 'latency_seconds_bucket{stage="parse",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{stage="parse",le="1.0"} 3' in lines
+    assert 'latency_seconds_bucket{stage="parse",le="+Inf"} 4' in lines
+    assert 'latency_seconds_sum{stage="parse"} 6.05' in lines
+    assert 'latency_seconds_count{stage="parse"} 4' in lines
+
+
+def test_gauge_callback_is_read_at_render_time():
+    items = []
+    size = Gauge("items", "Items", callback=lambda: len(items))
+    items.extend([1, 2])
+    assert size.render()[-1] == "items 2"
+
+
+def test_middleware_labels_requests_by_route_template():
+    latency = Histogram("http_seconds", "HTTP latency", ["method", "route", "status"])
+    app = FastAPI()
+    app.add_middleware(RouteMetricsMiddleware, histogram=latency)
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        return {"id": item_id}
+
+    client = TestClient(app)
+    client.get("/items/1")
+    client.get("/items/2")
+    client.get("/missing")
+    assert latency.count("GET", "/items/{item_id}", 200) == 2
+    assert latency.count("GET", "unmatched", 404) == 1
+
+
+def test_event_loop_lag_is_recorded():
+    lag = Histogram("lag_seconds", "Lag")
+
+    async def scenario():
+        monitor = EventLoopLagMonitor(interval=0.01, histogram=lag)
+        monitor.start()
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+
+    asyncio.run(scenario())
+    assert lag.count() >= 2
+
+
+def test_metric_without_render_cannot_be_created():
+    class Unrendered(Metric):
+        kind = "gauge"
+
+    with pytest.raises(TypeError):
+        Unrendered("unrendered", "Never rendered")
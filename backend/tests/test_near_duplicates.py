@@ -0,0 +1,69 @@
+import numpy as np
+
+from near_duplicates import NearDuplicateIndex, shingles
+
+QUESTION = ("Maya has 24 stickers and gives 1/3 of them to her brother. She then buys 10 more stickers "
+            "at the school fair. How many stickers does Maya have now?")
+REWORDED = ("Maya has 24 stickers and gives 1/3 of them to her little brother. Then she buys 10 more "
+            "stickers at the school fair. How many stickers does Maya have now?")
+DIFFERENT = ("A rocket travels 120 kilometres in 4 minutes. At the same speed, how far does it travel "
+             "in 15 minutes?")
+
+
+def test_shingles():
+    assert shingles("A B c d") == {"a b c", "b c d"}
+    assert shingles("Two words") == {"two words"}
+    assert "costs 3.50 dollars" in shingles("It costs 3.50 dollars")
+
+
+def test_reworded_question_is_a_duplicate():
+    index = NearDuplicateIndex(capacity=100)
+    assert index.check_and_add(QUESTION) is None
+    assert index.check_and_add(REWORDED) >= 0.5
+    assert index.check_and_add(DIFFERENT) is None
+    assert len(index) == 2
+    assert index.stats()["duplicates"] == 1
+
+
+def test_unrelated_questions_are_not_duplicates():
+    rng = np.random.default_rng(0)
+    words = [f"word{i}" for i in range(500)]
+    index = NearDuplicateIndex(capacity=2000)
+    flagged = sum(index.check_and_add(" ".join(rng.choice(words, 25))) is not None for _ in range(2000))
+    assert flagged == 0
+
+
+def test_capacity_drops_the_oldest():
+    index = NearDuplicateIndex(capacity=2)
+    index.add(QUESTION)
+    index.add(DIFFERENT)
+    index.add("How many apples are left if Sam eats 3 of his 7 apples and gives away 2 more?")
+    assert len(index) == 2
+    assert index.query(QUESTION)[0] < 0.5
+    assert index.query(DIFFERENT)[0] == 1.0
+
+
+def test_save_and_restore(tmp_path):
+    path = str(tmp_path / "index.npz")
+    index = NearDuplicateIndex(capacity=10)
+    index.add(QUESTION)
+    index.add(DIFFERENT)
+    assert index.dirty
+    index.save(path)
+    assert not index.dirty
+
+    restored = NearDuplicateIndex(capacity=10)
+    assert restored.restore(path)
+    assert len(restored) == 2
+    assert restored.check_and_add(REWORDED) is not None
+
+    assert not NearDuplicateIndex(capacity=10, seed=2).restore(path)
+    assert not NearDuplicateIndex(capacity=10).restore(str(tmp_path / "missing.npz"))
+
+
+def test_save_leaves_no_temporary_files(tmp_path):
+    index = NearDuplicateIndex(capacity=10)
+    index.add(QUESTION)
+    index.save(str(tmp_path / "index.npz"))
+    index.save(str(tmp_path / "index.npz"))
+    assert [path.name for path in tmp_path.iterdir()] == ["index.npz"]
@@ -0,0 +1,126 @@
+import threading
+
+from problem_corpus import ProblemCorpus, bucket_key
+
+
+def make_problem(question, answer=12):
+    return {
+        "question": question,
+        "answer": answer,
+        "explanation": "1. 3 × 4 = 12",
+        "theme": "space and astronomy",
+        "problem_type": "ratios and proportions",
+        "num_steps": 1,
+        "source": "openai",
+        "prompt_version": "v1",
+    }
+
+
+def test_add_sample_and_deduplicate(tmp_path):
+    corpus = ProblemCorpus(tmp_path / "corpus.db")
+    assert corpus.add(make_problem("How many rockets?"), "3-5")
+    assert not corpus.add(make_problem("How  many ROCKETS?"), "3-5")
+    assert corpus.count("3-5") == 1
+    assert corpus.sample("5-8") is None
+
+    problem = corpus.sample("3-5")
+    assert problem["question"] == "How many rockets?"
+    assert problem["answer"] == 12
+    assert problem["source"] == "corpus"
+    corpus.close()
+
+
+def test_corpus_survives_reopen(tmp_path):
+    corpus = ProblemCorpus(tmp_path / "corpus.db")
+    corpus.add(make_problem("Q1"), "1-2")
+    corpus.close()
+
+    reopened = ProblemCorpus(tmp_path / "corpus.db")
+    assert reopened.count("1-2") == 1
+    reopened.close()
+
+
+def test_iter_questions_in_batches(tmp_path):
+    corpus = ProblemCorpus(tmp_path / "corpus.db")
+    for i in range(5):
+        corpus.add(make_problem(f"Question {i}?"), "3-5" if i % 2 else "5-8")
+    assert list(corpus.iter_questions(batch_size=2)) == [f"Question {i}?" for i in range(5)]
+    corpus.close()
+
+
+def test_session_reuse_limit(tmp_path):
+    corpus = ProblemCorpus(tmp_path / "corpus.db", reuse_limit=1)
+    corpus.add(make_problem("Only one"), "1-2")
+
+    assert corpus.sample("1-2", session_id="abc") is not None
+    assert corpus.sample("1-2", session_id="abc") is None
+    assert corpus.sample("1-2", session_id="xyz") is not None
+    assert corpus.stats()["exhausted"] == 1
+    corpus.close()
+
+
+def test_bucket_key_depends_on_prompt_version():
+    assert bucket_key("3-5", "art", "ratios", "v1") != bucket_key("3-5", "art", "ratios", "v2")
+
+
+def test_pick_then_load(tmp_path):
+    corpus = ProblemCorpus(tmp_path / "corpus.db", reuse_limit=1)
+    corpus.add(make_problem("Only one?"), "3-5")
+    row_id = corpus.pick("3-5", session_id="s")
+    assert corpus.load(row_id)["question"] == "Only one?"
+    assert corpus.pick("3-5", session_id="s") is None
+    assert corpus.pick("1-2") is None
+    corpus.close()
+
+
+def test_pick_honours_type_and_steps(tmp_path):
+    corpus = ProblemCorpus(tmp_path / "corpus.db")
+    corpus.add(dict(make_problem("Ratio, two steps?"), num_steps=2), "3-5")
+    corpus.add(dict(make_problem("Fractions?"), problem_type="fractions"), "3-5")
+    for _ in range(10):
+        assert corpus.sample("3-5", problem_type="fractions")["question"] == "Fractions?"
+        assert corpus.sample("3-5", problem_type="ratios and proportions", num_steps=2)["question"] == \
+            "Ratio, two steps?"
+    # No exact step match: same type, any steps
+    assert corpus.sample("3-5", problem_type="fractions", num_steps=3)["question"] == "Fractions?"
+    assert corpus.sample("3-5", problem_type="geometry") is None
+    corpus.close()
+
+    reopened = ProblemCorpus(tmp_path / "corpus.db")
+    assert reopened.sample("3-5", problem_type="ratios and proportions", num_steps=2)["question"] == \
+        "Ratio, two steps?"
+    reopened.close()
+
+
+def test_reload_picks_up_other_workers_adds(tmp_path):
+    worker_a = ProblemCorpus(tmp_path / "corpus.db")
+    worker_b = ProblemCorpus(tmp_path / "corpus.db")
+    worker_a.add(make_problem("From A?"), "3-5")
+    worker_b.add(make_problem("From B?"), "3-5")
+    assert worker_a.count("3-5") == 1
+
+    assert worker_a.reload() == 1
+    assert worker_a.count("3-5") == 2
+    assert worker_a.reload() == 0  # nothing new, and its own add isn't indexed twice
+    worker_a.close()
+    worker_b.close()
+
+
+def test_adds_on_a_thread_while_the_index_is_read(tmp_path):
+    corpus = ProblemCorpus(tmp_path / "corpus.db")
+    grades = ["1-2", "3-5", "5-8"]
+
+    def add_many():
+        for i in range(300):
+            problem = dict(make_problem(f"Question {i}?"), problem_type=f"type {i % 7}", num_steps=i % 4 + 1)
+            corpus.add(problem, grades[i % 3])
+
+    writer = threading.Thread(target=add_many)
+    writer.start()
+    while writer.is_alive():
+        corpus.stats()
+        corpus.count()
+        corpus.pick("3-5", problem_type="type 3", num_steps=2)
+    writer.join()
+    assert corpus.count() == sum(corpus.stats()["sizes"].values()) == 300
+    corpus.close()
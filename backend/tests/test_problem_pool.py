@@ -0,0 +1,90 @@
+import asyncio
+
+from problem_pool import DISCARDED, ProblemPool
+
+
+async def make_problem(grade_level, source="openai"):
+    return {"question": f"Q for {grade_level}", "answer": 1, "explanation": "1. 1", "source": source}
+
+
+def test_take_from_empty_pool_is_a_miss():
+    pool = ProblemPool(make_problem)
+    assert pool.take("5-8") is None
+    assert pool.stats()["misses"] == 1
+
+
+def test_put_respects_depth():
+    pool = ProblemPool(make_problem, depth=2, low_water=1)
+    problem = {"question": "Q for 3-5", "answer": 1, "explanation": "1. 1"}
+    assert pool.put("3-5", problem)
+    assert pool.put("3-5", dict(problem))
+    assert not pool.put("3-5", dict(problem))
+    assert pool.size("3-5") == 2
+
+    assert pool.take("3-5")["question"] == "Q for 3-5"
+    assert pool.stats()["hits"] == 1
+
+
+def test_background_refill_fills_every_grade():
+    async def scenario():
+        pool = ProblemPool(make_problem, depth=3, low_water=2, refill_concurrency=2)
+        await pool.start()
+        try:
+            for _ in range(100):
+                if all(pool.size(grade) == 3 for grade in ("1-2", "3-5", "5-8")):
+                    break
+                await asyncio.sleep(0.01)
+            assert pool.take("1-2") is not None
+        finally:
+            await pool.stop()
+        return pool.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["sizes"] == {"1-2": 2, "3-5": 3, "5-8": 3}
+    assert stats["generated"] == 9
+    assert not stats["running"]
+
+
+def test_fallback_problems_are_not_pooled():
+    async def scenario():
+        pool = ProblemPool(lambda grade: make_problem(grade, source="fallback"),
+                           grade_levels=("5-8",), depth=2, retry_delay=0.01)
+        await pool.start()
+        await asyncio.sleep(0.1)
+        await pool.stop()
+        return pool
+
+    pool = asyncio.run(scenario())
+    assert pool.size("5-8") == 0
+    assert pool.failures > 0
+
+
+def test_discarded_problems_skip_the_backoff():
+    async def generate(grade_level):
+        await asyncio.sleep(0)
+        return DISCARDED
+
+    async def scenario():
+        pool = ProblemPool(generate, grade_levels=("5-8",), depth=2, retry_delay=60)
+        await pool.start()
+        await asyncio.sleep(0.05)
+        await pool.stop()
+        return pool
+
+    pool = asyncio.run(scenario())
+    assert pool.size("5-8") == 0
+    assert pool.failures == 0
+    # Retried straight away rather than after retry_delay
+    assert pool.stats()["discarded"] > 2
+
+
+def test_take_prefers_matching_type_then_steps():
+    pool = ProblemPool(make_problem, depth=5)
+    for problem_type, num_steps in (("logic", 2), ("algebra", 1), ("algebra", 3)):
+        pool.put("5-8", {"question": f"{problem_type} {num_steps}", "problem_type": problem_type,
+                         "num_steps": num_steps})
+
+    assert pool.take("5-8", "algebra", 3)["question"] == "algebra 3"
+    assert pool.take("5-8", "geometry", 2)["question"] == "logic 2"
+    assert pool.take("5-8", "logic")["question"] == "algebra 1"
+    assert pool.stats()["matched"] == 1
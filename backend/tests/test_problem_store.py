@@ -0,0 +1,163 @@
+import multiprocessing
+import os
+import threading
+
+import pytest
+
+from problem_corpus import ProblemCorpus
+from problem_quarantine import ProblemQuarantine
+from problem_store import MAX_PROBLEM_ID, MemoryProblemStore, ProblemStore, SQLiteProblemStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_problem(answer=42):
+    return {"question": "Q", "answer": answer, "explanation": "1. 42", "theme": "space", "num_steps": 1}
+
+
+def test_add_and_get_round_trip():
+    store = MemoryProblemStore()
+    problem_id = store.add(make_problem(), grade_level="3-5")
+
+    assert 0 < problem_id <= MAX_PROBLEM_ID
+    record = store.get(problem_id)
+    assert record.answer == 42
+    assert record.grade_level == "3-5"
+    assert record.theme == "space"
+    assert store.stats()["hits"] == 1
+
+
+def test_ids_are_unique():
+    store = MemoryProblemStore(max_size=5000)
+    ids = {store.add(make_problem()) for _ in range(5000)}
+    assert len(ids) == 5000
+
+
+def test_least_recently_used_is_evicted_at_capacity():
+    store = MemoryProblemStore(max_size=2)
+    first = store.add(make_problem(1))
+    second = store.add(make_problem(2))
+    store.get(first)
+    store.add(make_problem(3))
+
+    assert store.get(second) is None
+    assert store.get(first).answer == 1
+    assert store.stats()["evicted"] == 1
+
+
+def test_idle_records_expire():
+    clock = FakeClock()
+    store = MemoryProblemStore(ttl=60, clock=clock)
+    stale = store.add(make_problem(1))
+    clock.now += 30
+    fresh = store.add(make_problem(2))
+    clock.now += 45
+
+    assert store.get(stale) is None
+    assert store.get(fresh).answer == 2
+    assert store.stats()["expired"] == 1
+
+    clock.now += 61
+    assert store.prune() == 1
+    assert len(store) == 0
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = tmp_path / "problems.db"
+    worker_a = SQLiteProblemStore(path)
+    worker_b = SQLiteProblemStore(path)
+
+    problem_id = worker_a.add(make_problem(2.5), grade_level="5-8")
+    record = worker_b.get(problem_id)
+    assert record.answer == 2.5
+    assert record.grade_level == "5-8"
+    assert worker_b.get(problem_id + 1) is None
+
+    worker_a.close()
+    worker_b.close()
+
+
+def test_sqlite_store_batches_and_prunes(tmp_path):
+    clock = FakeClock()
+    store = SQLiteProblemStore(tmp_path / "problems.db", max_size=3, ttl=60, clock=clock)
+
+    ids = store.add_many([make_problem(n) for n in range(5)], grade_level="1-2")
+    assert [store.get(problem_id).answer for problem_id in ids] == [0, 1, 2, 3, 4]
+
+    assert store.size_estimate() == 5
+    store.prune()
+    assert len(store) == store.size_estimate() == 3
+
+    clock.now += 61
+    assert store.get(ids[-1]) is None
+    assert store.size_estimate() == 2
+    assert store.prune() == 2
+    assert store.stats()["expired"] == 3
+    assert store.size_estimate() == 0
+    store.close()
+
+
+def test_sqlite_size_estimate_catches_up_with_other_workers_at_prune(tmp_path):
+    path = tmp_path / "problems.db"
+    worker_a = SQLiteProblemStore(path)
+    worker_b = SQLiteProblemStore(path)
+    worker_b.add_many([make_problem(n) for n in range(4)])
+    assert worker_a.size_estimate() == 0  # no query behind it
+    worker_a.prune()
+    assert worker_a.size_estimate() == 4
+    worker_a.close()
+    worker_b.close()
+
+
+def test_sqlite_size_estimate_with_adds_from_many_threads(tmp_path):
+    store = SQLiteProblemStore(tmp_path / "problems.db", pool_size=8, prune_every=1000)
+
+    def add_some():
+        for n in range(50):
+            store.add(make_problem(n))
+
+    threads = [threading.Thread(target=add_some) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.size_estimate() == len(store) == 400
+    store.close()
+
+
+def test_incomplete_backend_cannot_be_created():
+    class OnlyAdds(ProblemStore):
+        def add(self, problem, grade_level=None):
+            return 1
+
+    with pytest.raises(TypeError):
+        OnlyAdds()
+
+
+def _open_and_add(args):
+    store_class, path, barrier = args
+    barrier.wait()
+    store = store_class(path)
+    problem = dict(make_problem(), question=f"Q{os.getpid()}")
+    if store_class is ProblemQuarantine:
+        store.add("5-8", problem, "unit test")
+    else:
+        store.add(problem, "5-8")
+    store.close()
+
+
+@pytest.mark.parametrize("store_class", [SQLiteProblemStore, ProblemCorpus, ProblemQuarantine])
+def test_workers_can_create_the_schema_at_the_same_time(tmp_path, store_class):
+    # Every worker process imports the server and creates the tables on a fresh file
+    path = tmp_path / "shared.db"
+    workers = 6
+    context = multiprocessing.get_context("fork")
+    barrier = context.Manager().Barrier(workers)
+    with context.Pool(workers) as pool:
+        pool.map(_open_and_add, [(store_class, path, barrier)] * workers)
@@ -0,0 +1,117 @@
+import asyncio
+import random
+
+import pytest
+
+from problem_quarantine import ProblemQuarantine
+from problem_verifier import (MISMATCH, UNCONFIRMED, VERIFIED, ProblemVerifier, VerificationPipeline,
+                              arithmetic_claims, check_arithmetic, safe_eval)
+from template_engine import TEMPLATES
+
+GOOD = {
+    "source": "openai",
+    "question": "A video game costs $45...",
+    "answer": 93,
+    "explanation": "1. After 20% off: $45 × 0.80 = $36\n2. After the coupon: $36 - $5 = $31\n"
+                   "3. For 3 games: $31 × 3 = $93",
+}
+
+
+def test_safe_eval_only_allows_arithmetic():
+    assert safe_eval("2,100 / 1000".replace(",", "")) == 2.1
+    assert safe_eval("-(3 + 4) * 2 ^ 2") == -28
+    assert safe_eval("1 / 0") is None
+    assert safe_eval("__import__('os')") is None
+    assert safe_eval("9 ** 9 ** 9") is None
+
+
+def test_claims_are_read_from_explanation_steps():
+    explanation = "1. Cookies: 12 × 7 = 84\n2. Grams: 84 × 25 = 2,100\n3. 3c + 3 = 30, so c = 9"
+    claims = [(expression, stated) for expression, _, stated in arithmetic_claims(explanation)]
+    assert claims == [("12 * 7", "84"), ("84 * 25", "2100")]
+
+
+@pytest.mark.parametrize("answer, explanation, status", [
+    (93, GOOD["explanation"], VERIFIED),
+    (93, "1. $31 × 3 = $94", MISMATCH),
+    (7.33, "22 / 3 = 7.33", VERIFIED),
+    (8, "1. 16 + 9 + 5 = 30\n2. So c = 9", UNCONFIRMED),
+    (8, "Let the number of cats be c.", UNCONFIRMED),
+    # Fractions and mixed numbers are compared exactly
+    (0.75, "6 / 8 = 3/4", VERIFIED),
+    (0.5, "3/6 = 1/2 = 0.5", VERIFIED),
+    (2.5, "5 / 2 = 2 1/2", VERIFIED),
+    (6, "3 × 4 = 12 / 2 = 6", VERIFIED),
+    (0.375, "6 / 8 = 3/8", MISMATCH),
+    (2.25, "5 / 2 = 2 1/4", MISMATCH),
+    # A whole-number quotient leaves a remainder: unverifiable, not wrong
+    (41, "497 / 12 = 41", UNCONFIRMED),
+    (5, "1. 497 / 12 = 41 remainder 5\n2. 41 × 12 = 492\n3. 497 - 492 = 5", VERIFIED),
+    (42, "497 / 12 = 42", MISMATCH),
+])
+def test_check_arithmetic(answer, explanation, status):
+    assert check_arithmetic({"answer": answer, "explanation": explanation})[0] == status
+
+
+def test_claims_keep_fractions_and_mixed_numbers():
+    claims = [stated for _, _, stated in arithmetic_claims("6 / 8 = 3/4\n5 / 2 = 2 1/2 cups")]
+    assert claims == ["3/4", "2 1/2"]
+
+
+@pytest.mark.parametrize("template", TEMPLATES, ids=lambda template: f"{template.problem_type}-{template.theme}")
+def test_template_answers_pass_verification(template):
+    rng = random.Random(0)
+    for grade_level in template.grade_levels:
+        for _ in range(50):
+            problem = template.render(template.sample(grade_level, rng))
+            status, reason = check_arithmetic(problem)
+            assert status == VERIFIED, f"{reason}: {problem['explanation']}"
+
+
+def test_second_model_can_overrule_arithmetic():
+    async def confirm(problem):
+        return 90
+
+    status, reason = asyncio.run(ProblemVerifier(confirm).verify(dict(GOOD)))
+    assert status == MISMATCH
+    assert "90" in reason
+
+
+def test_strict_rejects_unconfirmed():
+    problem = dict(GOOD, explanation="It works out.")
+    assert asyncio.run(ProblemVerifier(strict=True).verify(problem))[0] == MISMATCH
+
+
+def test_pipeline_quarantines_wrong_answers(tmp_path):
+    quarantine = ProblemQuarantine(tmp_path / "quarantine.db")
+    verified = []
+
+    async def scenario():
+        pipeline = VerificationPipeline(
+            ProblemVerifier(), workers=2,
+            on_verified=lambda grade, problem: verified.append(problem["answer"]),
+            on_quarantined=quarantine.add,
+        )
+        results = await asyncio.gather(
+            pipeline.verify("5-8", dict(GOOD)),
+            pipeline.verify("5-8", dict(GOOD, answer=94, explanation="1. $31 × 3 = $94")),
+            pipeline.verify("5-8", {"source": "template", "answer": 1, "explanation": ""}),
+            pipeline.verify("5-8", dict(GOOD, explanation="Three shirts at $31 each.")),
+        )
+        stats = pipeline.stats()
+        await pipeline.stop()
+        return results, stats
+
+    (good, bad, template, unconfirmed), stats = asyncio.run(scenario())
+    assert good["verification"] == VERIFIED
+    assert bad is None
+    assert template["source"] == "template"
+    assert unconfirmed is None  # not quarantined, but not reused either
+    assert verified == [93]
+    assert stats["quarantined"] == 1
+    assert stats["unconfirmed"] == 1
+
+    [entry] = quarantine.recent()
+    assert entry["problem"]["answer"] == 94
+    assert "should be 93" in entry["reason"]
+    quarantine.close()
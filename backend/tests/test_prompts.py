@@ -0,0 +1,48 @@
+import pytest
+
+from problem_generator import PROMPT_VERSION, build_prompt
+from prompts import (GRADE_DESCRIPTIONS, PROBLEM_TYPES, PROMPTS, THEMES, PromptTemplate, get_prompt,
+                     render_messages, token_report)
+
+
+@pytest.mark.parametrize("version", list(PROMPTS))
+def test_every_variant_renders(version):
+    for grade_level in GRADE_DESCRIPTIONS:
+        for theme in THEMES:
+            system, user = render_messages(version, grade_level, theme, PROBLEM_TYPES[0])
+            assert theme in user["content"]
+            assert GRADE_DESCRIPTIONS[grade_level]["complexity"] in user["content"]
+
+
+def test_rendered_messages_are_memoized():
+    first = render_messages("v2", "1-2", THEMES[0], PROBLEM_TYPES[0])
+    assert render_messages("v2", "1-2", THEMES[0], PROBLEM_TYPES[0]) is first
+
+
+def test_v2_system_message_is_shared_by_all_requests():
+    systems = {
+        render_messages("v2", grade_level, theme, problem_type)[0]["content"]
+        for grade_level in GRADE_DESCRIPTIONS for theme in THEMES for problem_type in PROBLEM_TYPES
+    }
+    assert len(systems) == 1
+    assert "witch" not in systems.pop()
+
+
+def test_build_prompt_returns_copies():
+    messages, theme, problem_type = build_prompt("3-5")
+    messages[1]["content"] = "changed"
+    cached = render_messages(PROMPT_VERSION, "3-5", theme, problem_type)
+    assert cached[1]["content"] != "changed"
+
+
+def test_unknown_fields_and_versions_are_rejected():
+    with pytest.raises(ValueError):
+        PromptTemplate("bad", "system", "Theme: {them}")
+    with pytest.raises(ValueError):
+        get_prompt("v0")
+
+
+def test_token_report_compares_versions():
+    report = {row["version"]: row for row in token_report()}
+    assert report["v2"]["mean_tokens"] < report["v1"]["mean_tokens"]
+    assert report["v2"]["shared_prefix_tokens"] > report["v1"]["shared_prefix_tokens"]
@@ -0,0 +1,62 @@
+import random
+
+from problem_store import ProblemRecord
+from prompts import PROBLEM_TYPES
+from skill_model import AttemptLog, DemandTracker, SkillEstimator, SkillTracker, step_range
+
+ALGEBRA, RATIOS = PROBLEM_TYPES[0], PROBLEM_TYPES[1]
+
+
+def test_attempt_log_keeps_the_newest_attempts():
+    log = AttemptLog(capacity=3)
+    for problem_id in range(1, 6):
+        log.append(problem_id, ALGEBRA, "space", 2, problem_id % 2 == 0, 12.5)
+    assert len(log) == 3
+    assert [attempt["problem_id"] for attempt in log.recent()] == [5, 4, 3]
+    assert log.recent(1)[0] == {"problem_id": 5, "problem_type": ALGEBRA, "theme": None, "num_steps": 2,
+                                "correct": False, "seconds": 12.5}
+    assert log.has_problem(4) and not log.has_problem(2)
+
+
+def test_misses_lower_accuracy_and_level():
+    skill = SkillEstimator()
+    for problem_id in range(1, 4):
+        skill.update(problem_id, ALGEBRA, None, 3, False, 90.0)
+    skill.update(4, RATIOS, None, 3, True, 20.0)
+
+    assert skill.accuracy[0] < 0.3 < skill.accuracy[1]
+    assert skill.level < 3
+    assert step_range("3-5") == (2, 3)
+    assert skill.choose("3-5")[1] == 2
+
+    # The weak type comes up far more often
+    rng = random.Random(7)
+    picks = [skill.choose("5-8", rng)[0] for _ in range(500)]
+    assert picks.count(ALGEBRA) > 2 * picks.count(RATIOS)
+
+
+def test_tracker_ignores_repeat_answers_and_unknown_sessions():
+    tracker = SkillTracker(max_sessions=2)
+    record = ProblemRecord(11, 4, "1. 2 + 2 = 4", grade_level="1-2", problem_type=ALGEBRA, num_steps=1)
+    assert tracker.choose("new", "1-2") == (None, None)
+    assert tracker.record("a", record, False, 5.0)
+    assert not tracker.record("a", record, True, 6.0)
+    assert tracker.session("a")["attempts"] == 1
+
+    tracker.record("b", record, True, 5.0)
+    tracker.record("c", record, True, 5.0)
+    assert tracker.session("a") is None
+    assert tracker.choose("c", "1-2")[0] in PROBLEM_TYPES
+
+
+def test_demand_tracker_weights_and_decays():
+    demand = DemandTracker(half_life=4, rng=random.Random(1))
+    assert demand.next_type("3-5") is None
+    for _ in range(3):
+        demand.note("3-5", RATIOS)
+    demand.note("3-5", "not a type")
+    assert demand.stats()["3-5"][RATIOS] == 3
+    demand.note("3-5", RATIOS)
+    assert demand.stats()["3-5"][RATIOS] == 2
+    picks = [demand.next_type("3-5") for _ in range(200)]
+    assert picks.count(RATIOS) > 40
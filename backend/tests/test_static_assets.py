@@ -0,0 +1,83 @@
+import gzip
+
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+from static_assets import IMMUTABLE, REVALIDATE, StaticAssets, accepted_encodings, compress_directory
+
+SCRIPT = b"console.log('hello from a fairly long bundle');\n" * 40
+
+
+@pytest.fixture
+def build_dir(tmp_path):
+    (tmp_path / "static" / "js").mkdir(parents=True)
+    (tmp_path / "index.html").write_text("<html><body>" + "<div></div>" * 50 + "</body></html>")
+    (tmp_path / "manifest.json").write_text('{"short_name": "Math"}')
+    (tmp_path / "static" / "js" / "main.3f2a9c1b.js").write_bytes(SCRIPT)
+    return tmp_path
+
+
+@pytest.fixture
+def client(build_dir):
+    compress_directory(build_dir)
+    assets = StaticAssets(build_dir)
+    app = FastAPI()
+
+    @app.get("/{path:path}")
+    async def serve(path: str, request: Request):
+        response = assets.response(path, request.headers) if path else assets.index_response(request.headers)
+        if response is None:
+            raise HTTPException(status_code=404)
+        return response
+
+    return TestClient(app)
+
+
+def test_compress_directory_skips_small_files(build_dir):
+    compress_directory(build_dir)
+    assert gzip.decompress((build_dir / "static" / "js" / "main.3f2a9c1b.js.gz").read_bytes()) == SCRIPT
+    assert (build_dir / "index.html.gz").exists()
+    assert not (build_dir / "manifest.json.gz").exists()
+
+
+def test_hashed_assets_are_immutable_and_precompressed(client):
+    response = client.get("/static/js/main.3f2a9c1b.js", headers={"accept-encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == IMMUTABLE
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.content == SCRIPT  # httpx decodes the gzip body
+
+    plain = client.get("/static/js/main.3f2a9c1b.js", headers={"accept-encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.headers["etag"] != response.headers["etag"]
+
+
+def test_matching_etag_gets_304(client):
+    first = client.get("/manifest.json")
+    assert first.headers["cache-control"] == REVALIDATE
+    again = client.get("/manifest.json", headers={"if-none-match": first.headers["etag"]})
+    assert again.status_code == 304
+    assert again.content == b""
+
+
+def test_index_is_served_from_memory(client, build_dir):
+    (build_dir / "index.html").unlink()
+    response = client.get("/", headers={"accept-encoding": "identity"})
+    assert response.status_code == 200
+    assert response.text.startswith("<html>")
+    assert response.headers["cache-control"] == REVALIDATE
+
+
+def test_accepted_encodings_honours_zero_quality():
+    assert accepted_encodings("gzip, br;q=0") == {"gzip"}
+    assert accepted_encodings("br;q=0.5, gzip;q=1.0") == {"br", "gzip"}
+    assert accepted_encodings(None) == set()
+
+
+def test_accepted_encodings_wildcard_covers_unlisted_codings():
+    assert accepted_encodings("*") == {"br", "gzip"}
+    assert accepted_encodings("br;q=0, *") == {"gzip"}
+    assert accepted_encodings("gzip, *;q=0") == {"gzip"}
+    assert accepted_encodings("*;q=0") == set()
@@ -0,0 +1,42 @@
+import pytest
+
+from problem_generator import GRADE_DESCRIPTIONS, PROBLEM_TYPES, get_fallback_problem
+from template_engine import TEMPLATES, generate_template_problem, templates_for
+
+
+def test_every_problem_type_is_covered():
+    assert {template.problem_type for template in TEMPLATES} == set(PROBLEM_TYPES)
+
+
+@pytest.mark.parametrize("grade_level", list(GRADE_DESCRIPTIONS))
+def test_every_grade_has_several_problem_types(grade_level):
+    assert len({template.problem_type for template in templates_for(grade_level)}) >= 4
+
+
+def test_same_seed_gives_same_problem():
+    assert generate_template_problem("3-5", seed=7) == generate_template_problem("3-5", seed=7)
+
+
+def test_problem_type_is_respected():
+    problem = generate_template_problem("5-8", problem_type="combinatorics and counting", seed=1)
+    assert problem["problem_type"] == "combinatorics and counting"
+
+
+@pytest.mark.parametrize("template", TEMPLATES, ids=lambda t: f"{t.problem_type}/{t.theme}")
+def test_templates_give_positive_integer_answers(template):
+    import random
+    rng = random.Random(0)
+    for grade_level in template.grade_levels:
+        for _ in range(200):
+            problem = template.render(template.sample(grade_level, rng))
+            assert isinstance(problem["answer"], int)
+            assert problem["answer"] > 0
+            assert problem["num_steps"] == problem["explanation"].count("\n") + 1
+            if grade_level == "1-2":
+                assert problem["answer"] < 100
+
+
+def test_fallback_uses_template_engine():
+    problem = get_fallback_problem("1-2")
+    assert problem["source"] == "fallback"
+    assert problem["problem_type"] in PROBLEM_TYPES
@@ -1,4 +1,4 @@
-import React, { useState } from 'react';
+import React, { useRef, useState } from 'react';
 import axios from 'axios';
 
 const API_URL = '/api';  // Simplified as we're serving from same origin
@@ -7,6 +7,7 @@ function MathChallenge() {
     const [problem, setProblem] = useState(null);
     const [userAnswer, setUserAnswer] = useState('');
     const [feedback, setFeedback] = useState(null);
+    const [answerError, setAnswerError] = useState(null);
     const [loading, setLoading] = useState(false);
     const [showExplanation, setShowExplanation] = useState(false);
 
@@ -26,6 +27,14 @@ function MathChallenge() {
     // Grade level selection
     const [selectedGrade, setSelectedGrade] = useState('5-8');
 
+    // Identifies this practice session so the server avoids repeating problems
+    // and adapts the next ones to how the session is doing
+    const sessionIdRef = useRef(null);
+    const problemParams = () => ({
+        grade_level: selectedGrade,
+        session_id: sessionIdRef.current
+    });
+
     // Format problem type for display
     const formatProblemType = (type) => {
         if (!type) return 'Math';
@@ -64,7 +73,7 @@ function MathChallenge() {
     const fetchProblemToQueue = async () => {
         try {
             const response = await axios.get(`${API_URL}/problem`, {
-                params: { grade_level: selectedGrade }
+                params: problemParams()
             });
             setProblemQueue(prev => [...prev, response.data]);
         } catch (error) {
@@ -72,23 +81,59 @@ function MathChallenge() {
         }
     };
 
-    // Pre-fetch multiple problems
-    const prefetchProblems = async (count = 5) => {
-        const promises = [];
-        for (let i = 0; i < count; i++) {
-            promises.push(axios.get(`${API_URL}/problem`, {
-                params: { grade_level: selectedGrade }
-            }));
+    // Stream a batch of problems (NDJSON), handing each one over as it arrives
+    const streamProblems = async (count, onProblem) => {
+        const query = new URLSearchParams({ grade_level: selectedGrade, count });
+        if (sessionIdRef.current) query.set('session_id', sessionIdRef.current);
+
+        const response = await fetch(`${API_URL}/problems?${query}`);
+        if (!response.ok) throw new Error(`Batch request failed: ${response.status}`);
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffered = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffered += decoder.decode(value, { stream: true });
+            const lines = buffered.split('\n');
+            buffered = lines.pop();
+            lines.filter(line => line.trim()).forEach(line => onProblem(JSON.parse(line)));
         }
-        const responses = await Promise.all(promises);
-        responses.forEach(response => {
-            setProblemQueue(prev => [...prev, response.data]);
-        });
+        if (buffered.trim()) onProblem(JSON.parse(buffered));
     };
 
+    // Stream one problem over server-sent events: show the question as soon as
+    // the model has written it, then swap in the stored problem and its ID
+    const streamProblem = () => new Promise((resolve, reject) => {
+        const query = new URLSearchParams({ grade_level: selectedGrade });
+        if (sessionIdRef.current) query.set('session_id', sessionIdRef.current);
+
+        const source = new EventSource(`${API_URL}/problem/stream?${query}`);
+        source.addEventListener('question', (event) => {
+            const { question } = JSON.parse(event.data);
+            setProblem({ question, problem_id: null });
+            setLoading(false);
+        });
+        source.addEventListener('problem', (event) => {
+            source.close();
+            const data = JSON.parse(event.data);
+            setProblem(data);
+            resolve(data);
+        });
+        source.onerror = () => {
+            source.close();
+            reject(new Error('Problem stream failed'));
+        };
+    });
+
     // Get next problem from queue or fetch if empty
     const fetchNewProblem = async () => {
         setLoading(true);
+        setUserAnswer('');
+        setFeedback(null);
+        setAnswerError(null);
+        setShowExplanation(false);
         try {
             if (problemQueue.length > 0) {
                 // Use problem from queue
@@ -101,16 +146,9 @@ function MathChallenge() {
                     fetchProblemToQueue();
                 }
             } else {
-                // Queue empty, fetch directly
-                const response = await axios.get(`${API_URL}/problem`, {
-                    params: { grade_level: selectedGrade }
-                });
-                setProblem(response.data);
+                // Queue empty, stream it so the question shows up early
+                await streamProblem();
             }
-
-            setUserAnswer('');
-            setFeedback(null);
-            setShowExplanation(false);
         } catch (error) {
             console.error('Error fetching problem:', error);
         }
@@ -118,6 +156,7 @@ function MathChallenge() {
     };
 
     const startSession = async () => {
+        sessionIdRef.current = `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
         setIsSessionActive(true);
         setShowSummary(false);
         setSessionStats({
@@ -127,23 +166,28 @@ function MathChallenge() {
             skipped: 0
         });
 
-        // Fetch first problem immediately to show it
+        // One batch request: show the first problem as soon as it arrives,
+        // queue the rest as they stream in
         setLoading(true);
+        let isFirst = true;
         try {
-            const response = await axios.get(`${API_URL}/problem`, {
-                params: { grade_level: selectedGrade }
+            await streamProblems(5, (data) => {
+                if (isFirst) {
+                    isFirst = false;
+                    setProblem(data);
+                    setUserAnswer('');
+                    setFeedback(null);
+                    setAnswerError(null);
+                    setShowExplanation(false);
+                    setLoading(false);
+                } else {
+                    setProblemQueue(prev => [...prev, data]);
+                }
             });
-            setProblem(response.data);
-            setUserAnswer('');
-            setFeedback(null);
-            setShowExplanation(false);
         } catch (error) {
-            console.error('Error fetching first problem:', error);
+            console.error('Error fetching problems:', error);
         }
         setLoading(false);
-
-        // Pre-fetch remaining problems in background
-        prefetchProblems(4);
     };
 
     const endSession = () => {
@@ -151,17 +195,26 @@ function MathChallenge() {
         setShowSummary(true);
         setProblem(null);
         setFeedback(null);
+        setAnswerError(null);
     };
 
     const checkAnswer = async () => {
-        if (!userAnswer) return;
+        // The answer can't be checked until the streamed problem is stored
+        if (!userAnswer || !problem.problem_id) return;
 
         try {
             const response = await axios.post(`${API_URL}/check_answer`, {
                 problem_id: problem.problem_id,
-                user_answer: parseFloat(userAnswer)
+                user_answer: userAnswer,
+                session_id: sessionIdRef.current
             });
 
+            // An unreadable answer ("abc") doesn't use up the attempt
+            if (response.data.message) {
+                setAnswerError(response.data.message);
+                return;
+            }
+            setAnswerError(null);
             setFeedback(response.data);
 
             // Update session stats
@@ -357,21 +410,28 @@ function MathChallenge() {
                     {!showExplanation && (
                         <div className="flex space-x-2">
                             <input
-                                type="number"
-                                step="0.01"
+                                type="text"
+                                inputMode="decimal"
                                 value={userAnswer}
-                                onChange={(e) => setUserAnswer(e.target.value)}
+                                onChange={(e) => {
+                                    setUserAnswer(e.target.value);
+                                    setAnswerError(null);
+                                }}
                                 className="flex-1 p-2 border rounded"
                                 placeholder="Your answer"
                             />
                             <button
                                 onClick={checkAnswer}
-                                className="px-4 py-2 bg-blue-500 text-white rounded hover:bg-blue-600"
+                                disabled={!problem.problem_id}
+                                className="px-4 py-2 bg-blue-500 text-white rounded hover:bg-blue-600 disabled:opacity-50"
                             >
                                 Submit
                             </button>
                         </div>
                     )}
+                    {answerError && !showExplanation && (
+                        <p className="text-sm text-red-600">{answerError}</p>
+                    )}
 
                     {feedback && (
                         <div className="space-y-2">